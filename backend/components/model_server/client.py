@@ -0,0 +1,165 @@
+import os
+import secrets
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker, AuthenticationError
+from multiprocessing.connection import Client
+
+# When set, SegFormer / TruFor forward passes are delegated to the shared
+# model server instead of loading a model copy in every uvicorn worker.
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+DEFAULT_SOCKET_PATH = "/tmp/veridoc-models.sock"
+# The connection unpickles what it receives, so the key is what stands between the
+# socket and code execution. Set it explicitly (or point at a mounted secret) to use TCP;
+# a unix socket without one gets a random key per server start (see resolve_authkey).
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "")
+MODEL_SERVER_AUTHKEY_FILE = os.getenv("MODEL_SERVER_AUTHKEY_FILE", "")
+
+# Set by the server process itself so its engines always run locally
+SERVER_MODE = False
+
+_local = threading.local()
+
+
+class ModelServerError(Exception):
+    pass
+
+
+def is_enabled() -> bool:
+    return bool(MODEL_SERVER_ADDRESS) and not SERVER_MODE
+
+
+def parse_address(address: str):
+    """"host:port" -> ("AF_INET", (host, port)); anything else is a unix socket path."""
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return "AF_INET", (host, int(port))
+    return "AF_UNIX", address
+
+
+def key_file_path(socket_path: str) -> str:
+    return socket_path + ".key"
+
+
+def configured_authkey():
+    """MODEL_SERVER_AUTHKEY, else the contents of MODEL_SERVER_AUTHKEY_FILE, else None."""
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY.encode()
+    if MODEL_SERVER_AUTHKEY_FILE:
+        with open(MODEL_SERVER_AUTHKEY_FILE, "rb") as f:
+            key = f.read().strip()
+        if not key:
+            raise ModelServerError(f"MODEL_SERVER_AUTHKEY_FILE {MODEL_SERVER_AUTHKEY_FILE} is empty")
+        return key
+    return None
+
+
+def resolve_authkey(address: str, create: bool = False) -> bytes:
+    """
+    Key for the model server connection at `address`.
+    An explicit key (MODEL_SERVER_AUTHKEY / MODEL_SERVER_AUTHKEY_FILE) always wins.
+    Without one:
+    - a TCP address is refused: anyone reaching the port could run code;
+    - a unix socket uses a random key in <socket>.key (mode 0600), written by
+      the server on start (create=True) and read by the workers of the same user.
+    """
+    key = configured_authkey()
+    if key:
+        return key
+    family, _ = parse_address(address)
+    if family == "AF_INET":
+        raise ModelServerError(
+            f"Model server on TCP ({address}) needs MODEL_SERVER_AUTHKEY or MODEL_SERVER_AUTHKEY_FILE"
+        )
+
+    path = key_file_path(address)
+    if create:
+        key = secrets.token_hex(32).encode()
+        if os.path.exists(path):
+            os.remove(path) # key of a previous run
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        return key
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    except OSError as e:
+        raise ModelServerError(f"No model server key at {path} (is the model server running?): {e}")
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to a block owned by the other process.
+    On Python < 3.13 attaching also registers the block with this process'
+    resource tracker, which would unlink it on exit, so we unregister it.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def array_to_shared_memory(arr: np.ndarray):
+    """Copies an array into a new shared block. Returns (shm, descriptor)."""
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, {"shm": shm.name, "shape": arr.shape, "dtype": arr.dtype.str}
+
+
+def read_shared_array(desc: dict, unlink: bool = False) -> np.ndarray:
+    """Copies an array out of a shared block (optionally releasing the block)."""
+    # A block we are going to unlink stays registered so unlink() can unregister it
+    shm = shared_memory.SharedMemory(name=desc["shm"]) if unlink else attach_shared_memory(desc["shm"])
+    try:
+        view = np.ndarray(desc["shape"], dtype=np.dtype(desc["dtype"]), buffer=shm.buf)
+        arr = view.copy()
+        del view
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    return arr
+
+
+def _connection():
+    # One connection per executor thread; the server handles each connection in its own thread
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        family, address = parse_address(MODEL_SERVER_ADDRESS)
+        # Read per connection: a restarted server writes a new key
+        conn = Client(address, family=family, authkey=resolve_authkey(MODEL_SERVER_ADDRESS))
+        _local.conn = conn
+    return conn
+
+
+def infer(model: str, input_array: np.ndarray) -> dict:
+    """
+    Runs a forward pass on the model server.
+    The input tensor travels through shared memory; only block names and
+    shapes go over the socket. Returns {output_name: np.ndarray}.
+    """
+    shm, desc = array_to_shared_memory(input_array.astype(np.float32, copy=False))
+    try:
+        try:
+            conn = _connection()
+            conn.send({"model": model, "input": desc})
+            reply = conn.recv()
+        except (OSError, EOFError, AuthenticationError) as e:
+            _local.conn = None
+            raise ModelServerError(f"Model server unreachable at {MODEL_SERVER_ADDRESS}: {e}")
+    finally:
+        shm.close()
+        shm.unlink()
+
+    if "error" in reply:
+        raise ModelServerError(reply["error"])
+
+    # The server hands ownership of the output blocks to the client
+    return {
+        name: read_shared_array(out_desc, unlink=True) if out_desc else None
+        for name, out_desc in reply["outputs"].items()
+    }
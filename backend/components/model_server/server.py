@@ -0,0 +1,192 @@
+"""
+Local model server: owns the single SegFormer and TruFor copy on this host.
+
+uvicorn workers started with MODEL_SERVER_ADDRESS send input tensors through
+shared memory and receive the output maps the same way, so adding workers
+does not add model copies or cold loads.
+
+On a unix socket the server writes a fresh random key to <socket>.key (mode 0600)
+for the workers; a TCP address needs MODEL_SERVER_AUTHKEY or MODEL_SERVER_AUTHKEY_FILE.
+The key handshake runs on each connection's own thread under a deadline, so a
+client with the wrong key, or one that stalls, never holds up the accept loop.
+
+Run:  python -m components.model_server.server
+"""
+import os
+import sys
+import socket
+import threading
+from pathlib import Path
+from multiprocessing import AuthenticationError, shared_memory
+from multiprocessing.connection import Listener, answer_challenge, deliver_challenge
+
+import numpy as np
+import torch
+
+backend_root = Path(__file__).resolve().parent.parent.parent
+if str(backend_root) not in sys.path:
+    sys.path.append(str(backend_root))
+
+from components.model_server import client as model_client
+
+# Engines imported below must run their models locally in this process
+model_client.SERVER_MODE = True
+
+from components.segformer.inference import get_model as get_segformer
+from components.trufor.engine import TruForEngine
+
+_locks = {"segformer": threading.Lock(), "trufor": threading.Lock()}
+
+# Seconds a new connection gets to complete the key handshake
+HANDSHAKE_TIMEOUT = float(os.getenv("MODEL_SERVER_HANDSHAKE_TIMEOUT", "5"))
+
+
+def _export(arr, exported: list):
+    """
+    Moves an output array into a shared block owned by the client from now on.
+    The descriptor is also appended to `exported`, so a reply that never reaches
+    the client can still be released (see _discard).
+    """
+    if arr is None:
+        return None
+    shm, desc = model_client.array_to_shared_memory(arr.detach().cpu().numpy().astype(np.float32))
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    shm.close()
+    exported.append(desc)
+    return desc
+
+
+def _discard(descs):
+    """Unlinks exported blocks whose names the client will never receive."""
+    for desc in descs:
+        try:
+            shm = shared_memory.SharedMemory(name=desc["shm"])
+            shm.close()
+            shm.unlink()
+        except Exception as e:
+            print(f"Could not release shared block {desc['shm']}: {e}")
+
+
+def handle_request(request: dict) -> dict:
+    model = request.get("model")
+    if model not in _locks:
+        return {"error": f"Unknown model '{model}'"}
+
+    desc = request["input"]
+    shm = model_client.attach_shared_memory(desc["shm"])
+    exported = []
+    try:
+        # Zero-copy view of the client's tensor
+        view = np.ndarray(desc["shape"], dtype=np.dtype(desc["dtype"]), buffer=shm.buf)
+        tensor = torch.from_numpy(view)
+
+        with _locks[model], torch.no_grad():
+            if model == "segformer":
+                logits = get_segformer()(pixel_values=tensor).logits
+                outputs = {"logits": _export(logits, exported)}
+            else:
+                engine = TruForEngine()
+                if engine._model is None:
+                    return {"error": "TruFor model not loaded on the model server"}
+                pred, conf = engine.forward(tensor.to(engine._device))
+                outputs = {"pred": _export(pred, exported), "conf": _export(conf, exported)}
+
+        del tensor, view
+        return {"outputs": outputs}
+    except Exception as e:
+        _discard(exported)
+        return {"error": f"{model} inference failed: {e}"}
+    finally:
+        shm.close()
+
+
+def _outputs_of(reply: dict):
+    return [desc for desc in (reply.get("outputs") or {}).values() if desc]
+
+
+def authenticate(conn, authkey: bytes, timeout: float = None) -> bool:
+    """
+    Runs the key handshake on a freshly accepted connection.
+    A client that has not finished within `timeout` seconds has its socket shut
+    down, which ends the handshake with EOFError.
+    """
+    timeout = HANDSHAKE_TIMEOUT if timeout is None else timeout
+
+    def expire():
+        try:
+            socket.socket(fileno=os.dup(conn.fileno())).shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        deliver_challenge(conn, authkey)
+        answer_challenge(conn, authkey)
+        return True
+    except (AuthenticationError, EOFError, OSError) as e:
+        print(f"Model server refused a connection: {e!r}")
+        return False
+    finally:
+        timer.cancel()
+
+
+def serve_connection(conn, authkey: bytes = None):
+    try:
+        if authkey is not None and not authenticate(conn, authkey):
+            return
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            reply = handle_request(request)
+            try:
+                conn.send(reply)
+            except Exception:
+                # The client never learns the block names, so it cannot unlink them
+                _discard(_outputs_of(reply))
+                raise
+    except (EOFError, OSError) as e:
+        print(f"Model server connection closed: {e!r}")
+    finally:
+        conn.close()
+
+
+def main():
+    configured = model_client.MODEL_SERVER_ADDRESS or model_client.DEFAULT_SOCKET_PATH
+    family, address = model_client.parse_address(configured)
+    # Before loading models: a TCP listener without an explicit key is refused
+    try:
+        authkey = model_client.resolve_authkey(configured, create=True)
+    except model_client.ModelServerError as e:
+        sys.exit(f"Model server not started: {e}")
+    if family == "AF_UNIX" and os.path.exists(address):
+        os.remove(address) # stale socket from a previous run
+
+    # Load both models once, before accepting work
+    get_segformer()
+    TruForEngine()
+
+    # No authkey on the listener: accept() would run the handshake on this thread
+    listener = Listener(address, family=family)
+    print(f"Model server listening on {address}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                print(f"Model server accept failed: {e!r}")
+                continue
+            threading.Thread(target=serve_connection, args=(conn, authkey), daemon=True).start()
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    main()
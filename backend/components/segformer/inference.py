@@ -4,6 +4,7 @@ import torch.nn.functional as F
 import numpy as np
 from PIL import Image
 from .model import get_segformer_model
+from components.model_server import client as model_client
 
 # Configuration
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'weights.pt')
@@ -22,13 +23,22 @@ def get_model():
         _model_instance = model
     return _model_instance
 
-def preprocess_image(image_path):
-    image = Image.open(image_path).convert('RGB')
-    original_size = image.size
-    image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+def load_rgb(image):
+    """
+    (RGB uint8 array, (W, H)) for a file path or an already decoded image
+    (any object with .rgb and .size, e.g. services.decoded_image.DecodedImage).
+    """
+    if isinstance(image, (str, os.PathLike)):
+        rgb = np.asarray(Image.open(image).convert('RGB'))
+        return rgb, (rgb.shape[1], rgb.shape[0])
+    return image.rgb, image.size
+
+def preprocess_image(image):
+    rgb, original_size = load_rgb(image)
+    resized = Image.fromarray(rgb).resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
     
-    img_array = np.array(image).astype(np.float32) / 255.0
-    img_tensor = torch.tensor(img_array).permute(2, 0, 1)
+    img_array = np.asarray(resized).astype(np.float32) / 255.0
+    img_tensor = torch.from_numpy(img_array).permute(2, 0, 1)
     
     mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
     std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
@@ -37,82 +47,111 @@ def preprocess_image(image_path):
     return img_tensor.unsqueeze(0), original_size
 
 
-def run_tamper_detection(image_path):
+def forward_logits(input_tensor):
+    """
+    Raw SegFormer forward pass. Uses the shared model server when configured
+    (MODEL_SERVER_ADDRESS), otherwise the in-process model.
+    """
+    if model_client.is_enabled():
+        outputs = model_client.infer("segformer", input_tensor.numpy())
+        return torch.from_numpy(outputs["logits"])
+
+    model = get_model()
+    with torch.no_grad():
+        return model(pixel_values=input_tensor).logits
+
+
+def postprocess_logits(logits, original_size):
+    """
+    Turns SegFormer logits for one image (1, 2, h, w) into the tamper verdict
+    and overlay. Shared by the single-image and batched paths.
+    """
+    with torch.no_grad():
+        # Interpolate to original size for better overlay
+        logits = F.interpolate(
+            logits, size=original_size[::-1], # (H, W)
+            mode='bilinear', align_corners=False
+        )
+
+        probs = torch.sigmoid(logits[:, 1])
+        prob_map = probs.squeeze().cpu().numpy()
+
+    # 1. Improved Confidence Metric (Top 1% average instead of global mean)
+    # This catches small forgeries that global mean misses
+    threshold_percentile = np.percentile(prob_map, 99)
+    confidence_score = float(threshold_percentile)
+
+    is_tampered = confidence_score > 0.5  # Stricter threshold for the top 1%
+
+    # 2. Generate Heatmap Visualization
+    import matplotlib.pyplot as plt
+
+    # Create a custom colormap or use 'jet' but with ALPHA channel based on probability
+    # We want high probability = visible, low probability = transparent
+
+    # Create an RGBA image manually for full control
+    # Colormap 'jet': Blue (low) -> Red (high)
+    cmap = plt.get_cmap('jet')
+
+    # Normalize probs to 0-1 for colormap
+    norm_probs = (prob_map - prob_map.min()) / (prob_map.max() - prob_map.min() + 1e-8)
+
+    # Apply colormap
+    rgba_img = cmap(norm_probs) # Returns (H, W, 4)
+
+    # Set Alpha channel: 
+    # Make regions with low probability (< 0.5) very transparent to invisible
+    # Make regions with high probability opaque
+    # We can use the probability map itself as the alpha base
+
+    # Sigmoid-like opacity curve or simple threshold
+    alpha_channel = prob_map.copy()
+    alpha_channel[alpha_channel < 0.2] = 0.0 # Clear background
+    alpha_channel[(alpha_channel >= 0.2) & (alpha_channel < 0.5)] = 0.3 # Slight tint for uncertain
+    alpha_channel[alpha_channel >= 0.5] = 0.8 # High visibility for tampered
+
+    rgba_img[:, :, 3] = alpha_channel
+
+    # The caller persists the overlay as an artifact (see services.artifact_writer)
+    return {
+        'is_tampered': is_tampered,
+        'confidence_score': confidence_score,
+        'details': 'SegFormer Deep Learning Model',
+        'heatmap': rgba_img
+    }
+
+
+def inference_failure(e):
+    print(f'SegFormer Inference Failed: {e}')
+    # Return a safe fallback so the app doesn't crash
+    return {
+        'is_tampered': False,
+        'confidence_score': 0.0,
+        'error': str(e),
+        'details': 'Inference Error'
+    }
+
+
+def forward_logits_batch(input_tensors):
+    """
+    One forward pass over several preprocessed images (all IMAGE_SIZE x IMAGE_SIZE).
+    Returns per-image logits in input order.
+    """
+    logits = forward_logits(torch.cat(input_tensors, dim=0))
+    return list(logits.split(1, dim=0))
+
+
+def run_tamper_detection(image, checkpoint=None):
+    """
+    `image` is a file path or a decoded image (see load_rgb).
+    checkpoint() (optional) is called between stages; it aborts a cancelled
+    analysis by raising, which is deliberately not caught here.
+    """
     try:
-        model = get_model()
-        input_tensor, original_size = preprocess_image(image_path)
-        
-        with torch.no_grad():
-            outputs = model(pixel_values=input_tensor)
-            logits = outputs.logits
-            
-            # Interpolate to original size for better overlay
-            logits = F.interpolate(
-                logits, size=original_size[::-1], # (H, W)
-                mode='bilinear', align_corners=False
-            )
-            
-            probs = torch.sigmoid(logits[:, 1])
-            prob_map = probs.squeeze().cpu().numpy()
-            
-        # 1. Improved Confidence Metric (Top 1% average instead of global mean)
-        # This catches small forgeries that global mean misses
-        threshold_percentile = np.percentile(prob_map, 99)
-        confidence_score = float(threshold_percentile)
-        
-        is_tampered = confidence_score > 0.5  # Stricter threshold for the top 1%
-
-        # 2. Generate Heatmap Visualization
-        import matplotlib.pyplot as plt
-        import io
-        import base64
-
-        # Create a custom colormap or use 'jet' but with ALPHA channel based on probability
-        # We want high probability = visible, low probability = transparent
-        
-        # Create an RGBA image manually for full control
-        # Colormap 'jet': Blue (low) -> Red (high)
-        cmap = plt.get_cmap('jet')
-        
-        # Normalize probs to 0-1 for colormap
-        norm_probs = (prob_map - prob_map.min()) / (prob_map.max() - prob_map.min() + 1e-8)
-        
-        # Apply colormap
-        rgba_img = cmap(norm_probs) # Returns (H, W, 4)
-        
-        # Set Alpha channel: 
-        # Make regions with low probability (< 0.5) very transparent to invisible
-        # Make regions with high probability opaque
-        # We can use the probability map itself as the alpha base
-        
-        # Sigmoid-like opacity curve or simple threshold
-        alpha_channel = prob_map.copy()
-        alpha_channel[alpha_channel < 0.2] = 0.0 # Clear background
-        alpha_channel[(alpha_channel >= 0.2) & (alpha_channel < 0.5)] = 0.3 # Slight tint for uncertain
-        alpha_channel[alpha_channel >= 0.5] = 0.8 # High visibility for tampered
-        
-        rgba_img[:, :, 3] = alpha_channel
-        
-        # Save to buffer
-        buf = io.BytesIO()
-        plt.imsave(buf, rgba_img, format='png')
-        buf.seek(0)
-        heatmap_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-
-        return {
-            'is_tampered': is_tampered,
-            'confidence_score': confidence_score,
-            'details': 'SegFormer Deep Learning Model',
-            'heatmap_image': f"data:image/png;base64,{heatmap_base64}"
-        }
-        
+        input_tensor, original_size = preprocess_image(image)
+        if checkpoint: checkpoint()
+        logits = forward_logits(input_tensor)
+        if checkpoint: checkpoint()
+        return postprocess_logits(logits, original_size)
     except Exception as e:
-        print(f'SegFormer Inference Failed: {e}')
-        # Return a safe fallback so the app doesn't crash
-        return {
-            'is_tampered': False,
-            'confidence_score': 0.0,
-            'error': str(e),
-            'details': 'Inference Error'
-        }
-
+        return inference_failure(e)
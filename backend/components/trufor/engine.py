@@ -28,6 +28,11 @@ except ImportError as e:
     TruForFactory = None
     default_cfg = None
 
+from components.model_server import client as model_client
+
+# Longest side fed to the network; larger images are downscaled (0 = full resolution)
+TRUFOR_MAX_SIDE = int(os.getenv("TRUFOR_MAX_SIDE", "1024"))
+
 class TruForEngine:
     _instance = None
     _model = None
@@ -36,7 +41,9 @@ class TruForEngine:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(TruForEngine, cls).__new__(cls)
-            cls._instance._load_model()
+            # With a model server the weights live in that process only
+            if not model_client.is_enabled():
+                cls._instance._load_model()
         return cls._instance
 
     def _load_model(self):
@@ -81,77 +88,147 @@ class TruForEngine:
             print(f"TruFor Load Error: {e}")
             self._model = None
 
-    def analyze(self, image_path: str):
+    def analyze(self, image, max_side: int = TRUFOR_MAX_SIDE, checkpoint=None):
         """
+        `image` is a file path or a decoded image (see prepare).
         Returns:
             - anomaly_map: 0-1 float array (The forgery heatmap)
             - confidence_map: 0-1 float array (How much to trust the heatmap)
             - score: Global integrity score (0 = Fake, 1 = Real)
+        checkpoint() (optional) runs between stages and may raise to abort a
+        cancelled analysis; that exception is not caught here.
         """
-        if self._model is None:
-            return {
-                "heatmap": None,
-                "confidence_map": None, 
-                "trust_score": 1.0, # Fail safe
-                "error": "Model not loaded"
-            }
+        if not self.is_ready():
+            return self._not_loaded()
 
         try:
             # 1. Preprocessing
-            img = Image.open(image_path).convert('RGB')
-            original_size = img.size
-            
-            # Limit size for T4/CPU stability
-            if max(original_size) > 1024:
-                img.thumbnail((1024, 1024))
-            
-            img_tensor = self._transform_image(img).to(self._device)
+            img_tensor, original_size = self.prepare(image, max_side)
+            if checkpoint: checkpoint()
 
             # 2. Inference
-            with torch.no_grad():
-                # TruFor outputs a tuple: (pred, conf, det, npp)
-                # pred: Anomaly map logits (B, 2, H, W)
-                # conf: Confidence map logits (B, 1, H, W)
-                pred, conf, det, npp = self._model(img_tensor)
-            
-            # Post-process Anomaly Map (Softmax -> Class 1)
-            # pred shape: (1, 2, H, W)
-            pred_prob = torch.softmax(pred, dim=1)[:, 1, :, :] # Take forgery class
-            
-            # Post-process Confidence Map (Sigmoid)
-            # conf shape: (1, 1, H, W)
-            if conf is not None:
-                conf_prob = torch.sigmoid(conf).squeeze(1)
-            else:
-                conf_prob = torch.ones_like(pred_prob)
-
-            # 3. Extract & Resize back to original
-            # Pass already-processed 0-1 tensors (cpu numpy)
-            anomaly = self._resize_map(pred_prob.squeeze().cpu().numpy(), original_size)
-            confidence = self._resize_map(conf_prob.squeeze().cpu().numpy(), original_size)
-            
-            # 4. Calculate Global Score
-            # We weigh the anomaly score by the confidence.
-            # If anomaly is high but confidence is low, we ignore it.
-            weighted_anomaly = anomaly * confidence
-            global_score = 1.0 - np.max(weighted_anomaly) # Simple heuristic
-
-            # Save heatmap for frontend (return as array, pipeline handles saving)
-            return {
-                "heatmap": weighted_anomaly, 
-                "raw_confidence": confidence,
-                "trust_score": float(global_score),
-                "verdict": "Forged" if global_score < 0.5 else "Authentic"
-            }
+            pred, conf = self.forward(img_tensor)
+            if checkpoint: checkpoint()
+            return self.postprocess(pred, conf, original_size)
         except Exception as e:
-            print(f"TruFor Analysis Failed: {e}")
-            import traceback
-            traceback.print_exc()
-            return {"trust_score": 1.0, "error": str(e)}
+            return self._failure(e)
+
+    def analyze_batch(self, prepared):
+        """
+        Batched variant of analyze() for [(img_tensor, original_size), ...].
+        Tensors with identical shapes share one forward pass; results keep input order.
+        """
+        if not self.is_ready():
+            return [self._not_loaded() for _ in prepared]
+
+        results = [None] * len(prepared)
+        groups = {}
+        for idx, (img_tensor, _) in enumerate(prepared):
+            groups.setdefault(tuple(img_tensor.shape), []).append(idx)
+
+        for indices in groups.values():
+            try:
+                batch = torch.cat([prepared[i][0] for i in indices], dim=0)
+                pred, conf = self.forward(batch)
+                for pos, i in enumerate(indices):
+                    conf_i = conf[pos:pos + 1] if conf is not None else None
+                    results[i] = self.postprocess(pred[pos:pos + 1], conf_i, prepared[i][1])
+            except Exception as e:
+                for i in indices:
+                    results[i] = self._failure(e)
+        return results
+
+    def is_ready(self) -> bool:
+        return self._model is not None or model_client.is_enabled()
+
+    def prepare(self, image, max_side: int = TRUFOR_MAX_SIDE):
+        """
+        Loads and normalizes an image -> (tensor (1, 3, H, W), original (W, H)).
+        `image` is a file path or an already decoded image exposing .size and
+        .downscaled(max_side) (services.decoded_image.DecodedImage), which
+        avoids decoding the file again.
+        max_side=0 keeps the full resolution (deep analysis profile).
+        """
+        # Limit size for T4/CPU stability
+        if max_side is None:
+            max_side = TRUFOR_MAX_SIDE
+
+        if not isinstance(image, (str, os.PathLike)):
+            return self._transform_image(image.downscaled(max_side)).to(self._device), image.size
+
+        img = Image.open(image).convert('RGB')
+        original_size = img.size
+        if max_side and max(original_size) > max_side:
+            img.thumbnail((max_side, max_side))
+
+        return self._transform_image(img).to(self._device), original_size
+
+    def postprocess(self, pred, conf, original_size):
+        """Converts raw outputs for one image into the heatmap and global trust score."""
+        # Post-process Anomaly Map (Softmax -> Class 1)
+        # pred shape: (1, 2, H, W)
+        pred_prob = torch.softmax(pred, dim=1)[:, 1, :, :] # Take forgery class
+
+        # Post-process Confidence Map (Sigmoid)
+        # conf shape: (1, 1, H, W)
+        if conf is not None:
+            conf_prob = torch.sigmoid(conf).squeeze(1)
+        else:
+            conf_prob = torch.ones_like(pred_prob)
+
+        # 3. Extract & Resize back to original
+        # Pass already-processed 0-1 tensors (cpu numpy)
+        anomaly = self._resize_map(pred_prob.squeeze().cpu().numpy(), original_size)
+        confidence = self._resize_map(conf_prob.squeeze().cpu().numpy(), original_size)
+
+        # 4. Calculate Global Score
+        # We weigh the anomaly score by the confidence.
+        # If anomaly is high but confidence is low, we ignore it.
+        weighted_anomaly = anomaly * confidence
+        global_score = 1.0 - np.max(weighted_anomaly) # Simple heuristic
+
+        # Save heatmap for frontend (return as array, pipeline handles saving)
+        return {
+            "heatmap": weighted_anomaly, 
+            "raw_confidence": confidence,
+            "trust_score": float(global_score),
+            "verdict": "Forged" if global_score < 0.5 else "Authentic"
+        }
+
+    def _not_loaded(self):
+        return {
+            "heatmap": None,
+            "confidence_map": None, 
+            "trust_score": 1.0, # Fail safe
+            "error": "Model not loaded"
+        }
+
+    def _failure(self, e):
+        print(f"TruFor Analysis Failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"trust_score": 1.0, "error": str(e)}
+
+    def forward(self, img_tensor):
+        """
+        Raw forward pass -> (pred logits (B, 2, H, W), conf logits (B, 1, H, W) or None).
+        Delegated to the shared model server when MODEL_SERVER_ADDRESS is set.
+        """
+        if model_client.is_enabled():
+            outputs = model_client.infer("trufor", img_tensor.cpu().numpy())
+            conf = outputs["conf"]
+            return torch.from_numpy(outputs["pred"]), torch.from_numpy(conf) if conf is not None else None
+
+        with torch.no_grad():
+            # TruFor outputs a tuple: (pred, conf, det, npp)
+            # pred: Anomaly map logits (B, 2, H, W)
+            # conf: Confidence map logits (B, 1, H, W)
+            pred, conf, det, npp = self._model(img_tensor)
+        return pred, conf
 
     def _transform_image(self, img):
-        # Standard RGB normalization for TruFor
-        arr = np.array(img).astype(np.float32) / 255.0
+        # Standard RGB normalization for TruFor (PIL image or RGB uint8 array)
+        arr = np.asarray(img).astype(np.float32) / 255.0
         arr = np.transpose(arr, (2, 0, 1)) # HWC -> CHW
         return torch.tensor(arr).unsqueeze(0) # Add batch dim
 
@@ -1,78 +1,143 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, Response
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
-import shutil
 import uuid
 import time
-from contextlib import asynccontextmanager
+import json
+import asyncio
+from contextlib import asynccontextmanager, aclosing
 
 from services.pipeline_orchestrator import determine_pipeline, PipelineType, analyze_structural, analyze_visual, analyze_cryptographic
-from services.forensic_reasoning import run_semantic_reasoning
-from pypdf import PdfReader
-from google.cloud import storage
+from services.forensic_reasoning import run_semantic_reasoning_async, REASONING_DEADLINE_SECONDS
+from services.result_cache import ResultIndex, collect_report_artifacts
+from services.task_registry import create_task_registry
+from services.result_store import create_result_store
+from services.event_stream import sse_stream, format_sse, SSE_HEADERS
+from services.upload_stream import stream_upload_to_disk, UploadRejected, RequestBodyLimit, MAX_UPLOAD_BYTES
+from services.job_queue import AnalysisQueue, QueueFull
+from services.batch_analysis import stage_batch_uploads, run_batch_analysis, discard_staged, BATCH_MAX_BYTES
+from services.analysis_sessions import SessionManager
+from services.artifact_sweeper import ArtifactSweeper, task_id_from_filename
+from services.cloud_storage import BackgroundUploads, content_addressed_blob_name, get_storage_backend
+from services.artifact_server import ArtifactETags, artifact_response, offload_inline_images
+from services.artifact_writer import collect_artifact_refs
+from services.analysis_profiles import resolve_profile, get_profile, UnknownProfile
+from services.text_layer import extract_text_layer, shutdown_pool as shutdown_text_pool
+from services.ela_engine import shutdown_pool as shutdown_ela_pool
+from services.tracing import Trace, span, trace_to_otlp
+from services.metrics import registry as metrics_registry, Gauge, STAGE_SECONDS, ANALYSES_TOTAL, CACHE_REQUESTS
+from components.segformer import inference as segformer_inference
+from components.trufor.engine import TruForEngine
+from components.model_server import client as model_client
+from services.document_context import DocumentContext
+from services.model_warmup import ModelReadiness
+from services.cancellation import CancellationToken, AnalysisCancelled, checkpoint, current_token, run_in_executor
 from dotenv import load_dotenv
 from pathlib import Path
 
 load_dotenv()
 
 UPLOAD_DIR = "uploads"
+# Server-side state (result store, task registry); kept out of UPLOAD_DIR, which /api/artifacts serves
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Share of the ELA local-statistics score taken by the block-level ELA / noise inconsistency
+BLOCK_INCONSISTENCY_WEIGHT = float(os.getenv("BLOCK_INCONSISTENCY_WEIGHT", "0.3"))
+
+# Content-addressed index of finished reports (duplicate uploads skip the pipeline)
+result_index = ResultIndex()
+
+# Bounded worker pool between the WebSocket layer and the analysis pipelines
+analysis_queue = AnalysisQueue()
+# task_id -> detached analysis run with a replayable progress log
+analysis_sessions = SessionManager()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: No background tasks needed for now
+    # Startup: spin up the analysis worker pool and the artifact sweeper
+    analysis_queue.start()
+    sweeper_task = asyncio.create_task(artifact_sweeper.run())
+    # Load and exercise the models in the background; /ready flips once they are warm
+    warmup_task = asyncio.create_task(warm_up_models())
     yield
     # Shutdown
+    warmup_task.cancel()
+    sweeper_task.cancel()
+    await analysis_queue.stop()
+    shutdown_text_pool()
+    shutdown_ela_pool()
 
 
-app = FastAPI(title="VeriDoc API", description="Document Forgery Detection System", lifespan=lifespan)
-
-
-# GCS Configuration
-GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "veridoc-uploads")
-
-def cleanup_stale_files(directory: Path, max_age_seconds: int = 300):
-    """
-    Background task to remove files older than max_age_seconds.
-    Running in background prevents blocking the upload response.
-    """
-    try:
-        current_time = time.time()
-        if not directory.exists():
-            return
-            
-        for item in directory.iterdir():
-            try:
-                # Delete files/dirs older than threshold
-                if item.stat().st_mtime < current_time - max_age_seconds:
-                    if item.is_file() or item.is_symlink():
-                        item.unlink()
-                        print(f"Background Cleaned: {item.name}")
-                    elif item.is_dir():
-                        shutil.rmtree(item)
-                        print(f"Background Cleaned Dir: {item.name}")
-            except Exception as e:
-                # Non-blocking tolerance - logging only
-                print(f"Background cleanup warning for {item.name}: {e}")
-    except Exception as e:
-        print(f"Background cleanup process error: {e}")
+async def warm_up_models():
+    await model_readiness.run(UPLOAD_DIR)
+    # Fingerprint of the weights this process has loaded; cache lookups reuse it
+    await asyncio.get_running_loop().run_in_executor(None, result_index.refresh_fingerprint)
 
-def upload_to_gcs(source_file_name, destination_blob_name):
-    """Uploads a file to the bucket."""
-    try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob(destination_blob_name)
 
-        blob.upload_from_filename(source_file_name)
+app = FastAPI(title="VeriDoc API", description="Document Forgery Detection System", lifespan=lifespan)
 
-        return f"gs://{GCS_BUCKET_NAME}/{destination_blob_name}"
-    except Exception as e:
-        print(f"GCS Upload Failed: {e}")
-        return None
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# task_id -> {path, filename, original_filename, content_type, pipeline_hint, size, sha256}
+task_registry = create_task_registry(DATA_DIR)
+
+# task_id -> finished response (compressed, with a TTL); survives restarts, served by GET /api/result
+result_store = create_result_store(DATA_DIR)
+
+# Cloud uploads started as soon as a file lands (overlaps with local analysis)
+cloud_uploads = BackgroundUploads()
+
+def forget_task(task_id: str):
+    task_registry.remove(task_id)
+    cloud_uploads.discard(task_id)
+
+# Expiry heap of tasks and their artifact sets (replaces the per-upload directory scan)
+# (expiries are mirrored into the task registry, so workers sharing the volume see each other's leases)
+# STORAGE_BACKEND=local: document objects whose upload is gone are purged on the reconcile pass
+artifact_sweeper = ArtifactSweeper(UPLOAD_DIR, on_evict=forget_task, registry=task_registry,
+                                   maintenance=[get_storage_backend().purge_expired])
+
+# Content-hash ETags for /api/artifacts (uploads are seeded with their upload hash)
+artifact_etags = ArtifactETags()
+
+# Startup warm-up state behind /ready
+model_readiness = ModelReadiness()
+
+# --- Scrape-time gauges for /metrics ---
+
+def model_load_state():
+    # 1 = weights usable (loaded here or served by the shared model server); never triggers a load
+    remote = model_client.is_enabled()
+    trufor = TruForEngine._instance
+    return {
+        ("segformer",): int(remote or segformer_inference._model_instance is not None),
+        ("trufor",): int(remote or (trufor is not None and trufor._model is not None)),
+    }
+
+def executor_queue_length():
+    # Work items waiting for a thread in the event loop's default executor (OpenCV, TruFor, pypdf)
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    work_queue = getattr(executor, "_work_queue", None)
+    return {(): work_queue.qsize() if work_queue is not None else 0}
+
+metrics_registry.register(Gauge("veridoc_analyses_in_flight", "Analysis sessions currently running.",
+                                callback=lambda: {(): analysis_sessions.stats()["running"]}))
+metrics_registry.register(Gauge("veridoc_analysis_queue_jobs", "Analysis jobs by state in the worker queue.",
+                                labels=("state",),
+                                callback=lambda: {("waiting",): analysis_queue.stats()["queue_depth"],
+                                                  ("running",): analysis_queue.stats()["running"]}))
+metrics_registry.register(Gauge("veridoc_executor_queue_length", "Pending work items in the default thread executor.",
+                                callback=executor_queue_length))
+metrics_registry.register(Gauge("veridoc_model_loaded", "Model load state (1 loaded, 0 not loaded).",
+                                labels=("model",), callback=model_load_state))
+metrics_registry.register(Gauge("veridoc_ready", "1 once model warm-up finished (see /ready).",
+                                callback=lambda: {(): int(model_readiness.is_ready)}))
+metrics_registry.register(Gauge("veridoc_tracked_artifact_bytes", "Bytes of uploads and artifacts tracked by the sweeper.",
+                                callback=lambda: {(): artifact_sweeper.stats()["tracked_bytes"]}))
+
 
 # CORS Setup
 # Explicitly list allowed origins to support allow_credentials=True
@@ -94,8 +159,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from fastapi.staticfiles import StaticFiles
-app.mount("/static/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Upload size limits apply while the body is received, not after Starlette has spooled it
+app.add_middleware(RequestBodyLimit, limits={"/api/upload": MAX_UPLOAD_BYTES, "/api/batch": BATCH_MAX_BYTES})
 
 @app.get("/")
 def read_root():
@@ -103,235 +168,804 @@ def read_root():
 
 @app.get("/health")
 def health_check():
+    """Liveness only: the process is up. Traffic gating uses /ready."""
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness: 200 once the models are loaded and warmed (status "ready", or
+    "degraded" if one could not be loaded), 503 while warm-up is running.
+    """
+    state = model_readiness.to_dict()
+    return JSONResponse(state, status_code=200 if model_readiness.is_ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition (stage/detector latency, in-flight work, model state, cache hits)."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/queue/stats")
+def queue_stats():
+    """Queue depth, running jobs and wait times (for instance sizing)."""
+    return analysis_queue.stats()
+
+@app.middleware("http")
+async def lease_on_artifact_access(request: Request, call_next):
+    # Fetching an original or overlay counts as viewing the report
+    # (the lease may read / write the SQLite registry: keep it off the event loop)
+    if request.url.path.startswith("/api/artifacts/"):
+        task_id = task_id_from_filename(request.url.path.rsplit("/", 1)[-1])
+        await asyncio.get_running_loop().run_in_executor(None, artifact_sweeper.touch, task_id)
+    return await call_next(request)
+
+@app.get("/api/artifacts/{name}")
+async def get_artifact(name: str, request: Request):
+    """
+    Serves an original or overlay with a strong ETag, immutable caching and
+    Range support. With ARTIFACT_ACCEL_REDIRECT_PREFIX set, nginx sends the bytes
+    of requests it proxied (X-Accel-Enabled).
+    """
+    return await artifact_response(request, UPLOAD_DIR, name, artifact_etags)
+
+@app.get("/api/tasks/{task_id}/trace")
+async def get_task_trace(task_id: str, format: str = "tree"):
+    """
+    Timing trace of a finished analysis (from its session, else the result store).
+    format=tree returns the span tree; format=otlp returns OpenTelemetry OTLP/JSON.
+    """
+    session = analysis_sessions.get(task_id)
+    final = next((e for e in reversed(session.events) if e.get("status") == "complete"), None) if session else None
+    if final is None:
+        final = await stored_complete_event(task_id)
+    trace_dict = (final.get("data") or {}).get("trace") if final else None
+    if not trace_dict:
+        raise HTTPException(status_code=404, detail="No trace for this task")
+    return trace_to_otlp(trace_dict) if format == "otlp" else trace_dict
+
+@app.post("/api/tasks/{task_id}/lease")
+def extend_task_lease(task_id: str):
+    """
+    Keeps a task's files alive while a dashboard is showing them.
+    Clients call this periodically; each call grants ARTIFACT_LEASE_SECONDS.
+    """
+    expires_at = artifact_sweeper.touch(task_id)
+    if expires_at is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired task")
+    return {"task_id": task_id, "expires_at": expires_at}
+
+@app.post("/api/tasks/{task_id}/cancel")
+def cancel_task(task_id: str):
+    """
+    Stops a running analysis at its next checkpoint. Followers receive a
+    terminal CANCELLED event; a finished analysis is left as is.
+    """
+    session = analysis_sessions.get(task_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No analysis session for this task")
+    session.cancel("client_cancelled")
+    return {"task_id": task_id, "finished": session.finished}
+
+def session_progress(session) -> dict:
+    """Latest progress of a session: its last event without the (large) data payload."""
+    last = session.events[-1] if session.events else {}
+    progress = {k: v for k, v in last.items() if k != "data"}
+    return {"last_event": len(session.events), **progress}
+
+async def stored_complete_event(task_id: str):
+    """
+    COMPLETE event (carrying the full response) for a task whose result is in
+    the store, or None. Lets a client attach after its session was dropped
+    without the analysis running again.
+    """
+    stored = await asyncio.get_running_loop().run_in_executor(None, result_store.get, task_id)
+    if stored is None:
+        return None
+    return {"status": "complete", "message": "Analysis successfully completed.", "step": "COMPLETE", "data": stored["response"]}
+
+@app.get("/api/result/{task_id}")
+async def get_result(task_id: str):
+    """
+    Polling alternative to the WebSocket stream.
+    200 with the final response once the analysis has finished (read from the
+    result store, so it survives restarts and never reruns a pipeline),
+    202 with the latest progress while it is queued or running,
+    200 with status error/cancelled if it failed, 404 for unknown tasks.
+    """
+    loop = asyncio.get_running_loop()
+    stored = await loop.run_in_executor(None, result_store.get, task_id)
+    if stored:
+        return {"task_id": task_id, "status": "complete", "stored_at": stored["stored_at"],
+                "expires_at": stored["expires_at"], "result": stored["response"]}
+
+    session = analysis_sessions.get(task_id)
+    if session is not None:
+        progress = session_progress(session)
+        if not session.finished:
+            return JSONResponse(status_code=202, content={"task_id": task_id, "status": "running", "progress": progress})
+        status = "cancelled" if progress.get("step") == "CANCELLED" else "error"
+        return {"task_id": task_id, "status": status, "message": progress.get("message"), "reason": progress.get("reason")}
+
+    if task_registry.get(task_id):
+        # Uploaded, but nothing has started it yet (WebSocket, SSE or ?autostart=true)
+        return JSONResponse(status_code=202, content={"task_id": task_id, "status": "pending"})
+    raise HTTPException(status_code=404, detail="Unknown or expired task")
+
+@app.get("/api/tasks/{task_id}/events")
+async def stream_task_events(task_id: str, request: Request, last_event: int = 0):
+    """
+    Server-Sent Events stream of the task's progress: the same events as the
+    WebSocket, with the sequence number as event id. Starts the analysis if it
+    is not running yet. A reconnecting EventSource resumes after its
+    Last-Event-ID; once the terminal event was delivered the stream answers 204,
+    which tells EventSource to stop reconnecting.
+    Counts as a follower for the abandon grace period, like a socket.
+    """
+    try:
+        after_seq = int(request.headers.get("last-event-id") or last_event)
+    except ValueError:
+        after_seq = last_event
+
+    session = analysis_sessions.get(task_id)
+    if session is None:
+        # Session gone (restart / retention) but the result is stored: deliver it as one event
+        event = await stored_complete_event(task_id)
+        if event is not None:
+            if after_seq:
+                return Response(status_code=204)
+            return StreamingResponse(iter([format_sse(event)]), media_type="text/event-stream", headers=SSE_HEADERS)
+        task = task_registry.get(task_id)
+        if not task or not os.path.exists(task["path"]):
+            raise HTTPException(status_code=404, detail="Unknown or expired task")
+        session = start_analysis_session(task_id, task)
+
+    if session.finished and after_seq >= len(session.events):
+        return Response(status_code=204)
+    return StreamingResponse(sse_stream(session.follow(after_seq)), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/api/upload")
 async def upload_document(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    text_layer: bool = False,
+    profile: Optional[str] = None,
+    autostart: bool = False,
+    x_api_key: Optional[str] = Header(None)
 ):
     """
     Uploads a document and returns a task ID for WebSocket analysis.
+    ?text_layer=true adds the per-page PDF text to the final result.
+    ?profile=quick|standard|deep picks the detector set (default: the API key's
+    profile, then DEFAULT_ANALYSIS_PROFILE).
+    ?autostart=true starts the analysis right away, for clients that only poll
+    GET /api/result/{task_id} (a run nobody ever followed is not abandoned).
     """
     try:
-        # 1. Schedule Cleanup (Non-blocking)
+        profile_name = resolve_profile(profile, x_api_key)
+    except UnknownProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Backpressure: refuse new work up front while the analysis queue is saturated
+    if analysis_queue.is_full():
+        raise HTTPException(status_code=429, detail="Analysis queue is full. Retry shortly.", headers={"Retry-After": "10"})
+
+    try:
         # Using pathlib for modern Python 3.12+ style handling
         upload_path = Path(UPLOAD_DIR)
         
-        # We trigger cleanup of OLD files (stale from previous sessions)
-        # We assume 5 minutes (300s) is enough for a session. 
-        # For immediate responsiveness, we don't wipe everything synchronously.
-        background_tasks.add_task(cleanup_stale_files, upload_path, 300)
-        
-        # 2. Save New File
+        # Save New File (streamed off the event loop, hashed and sniffed on the fly)
         print(f"Receiving file: {file.filename}")
-        file_ext = file.filename.split('.')[-1].lower()
         task_id = str(uuid.uuid4())
-        safe_filename = f"{task_id}.{file_ext}"
         
         # Ensure directory exists
         upload_path.mkdir(parents=True, exist_ok=True)
         
-        file_path = os.path.join(UPLOAD_DIR, safe_filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored = await stream_upload_to_disk(file, UPLOAD_DIR, task_id)
+
+        task_registry.register(
+            task_id,
+            original_filename=file.filename,
+            text_layer=text_layer,
+            profile=profile_name,
+            **stored
+        )
+        # Stale files are removed by the periodic sweeper, not per upload
+        artifact_sweeper.track(task_id, stored["path"])
+        artifact_etags.seed(stored["path"], stored["sha256"])
+
+        # Start the cloud upload now; reasoning awaits it only when it needs the URI.
+        # A duplicate this worker can answer from its result index never needs the upload.
+        if get_profile(profile_name)["reasoning"] and not result_index.contains(stored["sha256"], profile_name):
+            cloud_uploads.start(task_id, stored["path"], content_addressed_blob_name(stored["sha256"], stored["filename"]))
+
+        if autostart:
+            start_analysis_session(task_id, task_registry.get(task_id))
             
         return {
             "task_id": task_id,
             "filename": file.filename,
-            "file_path": file_path,
-            "content_type": file.content_type
+            "file_path": stored["path"],
+            "content_type": stored["content_type"],
+            "pipeline_hint": stored["pipeline_hint"],
+            "size": stored["size"],
+            "sha256": stored["sha256"],
+            "profile": profile_name,
+            "started": autostart
         }
         
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi import WebSocket, WebSocketDisconnect
+@app.post("/api/batch")
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    profile: Optional[str] = None,
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    Analyzes many documents in one request (multiple files and/or zip archives).
+    Streams one NDJSON line per document as soon as it finishes.
+    The batch occupies a single analysis worker; inside it, SegFormer and
+    TruFor forward passes are batched across documents.
+    ?profile= applies to every document of the batch (see /api/upload).
+    """
+    try:
+        profile_name = resolve_profile(profile, x_api_key)
+    except UnknownProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if analysis_queue.is_full():
+        raise HTTPException(status_code=429, detail="Analysis queue is full. Retry shortly.", headers={"Retry-After": "10"})
+
+    Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
 
-@app.websocket("/ws/analyze/{task_id}")
-async def analyze_document(websocket: WebSocket, task_id: str):
-    await websocket.accept()
     try:
-        # Locate file (reconstruct path based on task_id - simplistic approach)
-        # In a real app, look up from DB. Here we search dirtily or assume standard naming if passed, 
-        # but better to pass filename in initial handshake or just find the file.
-        # Let's look for the file with this UUID in the uploads dir.
-        found_file = None
-        for f in os.listdir(UPLOAD_DIR):
-            if f.startswith(task_id):
-                found_file = f
-                break
-        
-        if not found_file:
-            await websocket.send_json({"status": "error", "message": "File not found"})
-            await websocket.close()
-            return
+        documents = await stage_batch_uploads(files, UPLOAD_DIR)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    results = asyncio.Queue()
+    # Cancelled when the client stops reading the stream (each document also has its own deadline)
+    batch_token = CancellationToken()
+
+    async def emit_result(item):
+        if item.get("report"):
+            artifact_sweeper.track(item["task_id"], *collect_report_artifacts(item["report"], UPLOAD_DIR))
+        if item.get("filename"):
+            artifact_sweeper.unpin(item["task_id"])
+        await results.put(item)
+
+    async def run_batch():
+        try:
+            await run_batch_analysis(documents, emit=emit_result, token=batch_token)
+        finally:
+            await results.put(None) # end of stream
+
+    # The queue can fill up while a large batch is staged: nothing is registered or pinned until it is accepted
+    try:
+        analysis_queue.submit(run_batch)
+    except QueueFull as e:
+        discard_staged(documents)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+
+    # Registered before the event loop gets a chance to start the job
+    for doc in documents:
+        doc["profile"] = profile_name
+        if not doc.get("error"):
+            task_registry.register(**doc)
+            artifact_sweeper.track(doc["task_id"], doc["path"])
+            # Large batches can outlive the TTL; keep files until each document is done
+            artifact_sweeper.pin(doc["task_id"])
+
+    async def stream_results():
+        finished = False
+        try:
+            yield json.dumps({"status": "accepted", "document_count": len(documents), "profile": profile_name}) + "\n"
+            while True:
+                item = await results.get()
+                if item is None:
+                    finished = True
+                    break
+                yield json.dumps(item) + "\n"
+        finally:
+            # Client went away mid-stream: nobody will read the remaining documents
+            if not finished:
+                batch_token.cancel("client_disconnected")
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# Fields describing one particular run rather than the document; never copied from a reused report
+RUN_SCOPED_FIELDS = ("task_id", "original_filename", "cached", "trace")
+
+def complete_delta(final_response: dict, report_seq: int) -> dict:
+    """
+    Payload of the COMPLETE event: everything except the report, which was
+    already sent once in the ANALYSIS_COMPLETE event numbered report_seq.
+    """
+    delta = {k: v for k, v in final_response.items() if k != "report"}
+    delta["report_seq"] = report_seq
+    return delta
 
-        file_path = os.path.join(UPLOAD_DIR, found_file)
-        filename = found_file # approximate original name not preserved in FS but okay for logic
-        file_ext = found_file.split('.')[-1]
-        mime_type = "application/pdf" if file_ext == "pdf" else "image/jpeg" # simplified
-        
-        await websocket.send_json({"status": "info", "message": "Starting analysis...", "step": "INIT"})
-
-        # Text Extraction
-        text_content = ""
-        if file_ext == 'pdf':
-            await websocket.send_json({"status": "info", "message": "Extracting text content...", "step": "TEXT_EXTRACTION"})
-            try:
-                reader = PdfReader(file_path)
-                for page in reader.pages:
-                    text = page.extract_text()
-                    if text:
-                        text_content += text + "\n"
-            except Exception:
-                pass 
-
-        # Pipeline Determination
-        await websocket.send_json({"status": "info", "message": "Determining appropriate forensic pipeline...", "step": "PIPELINE_SELECTION"})
-        # BUG FIX: Pass full file_path so the orchestrator can open the file
-        pipeline_type = determine_pipeline(file_path, mime_type)
-        await websocket.send_json({"status": "info", "message": f"Selected Pipeline: {pipeline_type.value}", "step": "PIPELINE_SELECTED"})
-
-        # Execution
-        await websocket.send_json({"status": "info", "message": f"Running {pipeline_type.value} analysis...", "step": "ANALYSIS_RUNNING"})
-        
-        async def send_progress(msg):
-            await websocket.send_json({"status": "info", "message": msg, "step": "ANALYSIS_SUBSTEP"})
-
-        report = {}
-        if pipeline_type == PipelineType.STRUCTURAL:
-             report = await analyze_structural(file_path, callback=send_progress)
-        elif pipeline_type == PipelineType.VISUAL:
-             report = await analyze_visual(file_path, callback=send_progress)
-        elif pipeline_type == PipelineType.CRYPTOGRAPHIC:
-             report = await analyze_cryptographic(file_path, callback=send_progress)
-        else:
-             report = {"error": "Unsupported pipeline requested"}
-        
-        await websocket.send_json({"status": "info", "message": "Pipeline analysis complete.", "step": "ANALYSIS_COMPLETE", "data": report})
+def start_analysis_session(task_id: str, task: dict):
+    """
+    Returns the task's analysis session, starting it on first use
+    (WebSocket connect, SSE subscribe or ?autostart=true upload).
+    """
+    async def run(emit):
+        # Running analyses are never swept
+        artifact_sweeper.pin(task_id)
+        try:
+            await run_analysis(task_id, task, emit)
+        finally:
+            artifact_sweeper.unpin(task_id)
+
+    return analysis_sessions.get_or_start(task_id, run)
+
+async def persist_result(task_id: str, final_response: dict, content_hash: str, profile_name: str,
+                         artifacts=None, reusable: bool = False):
+    """
+    Writes a finished response to the result store (off the event loop).
+    reusable=True also offers it to later uploads of the same bytes.
+    A store failure is logged; the analysis itself still completes.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, lambda: result_store.put(
+            task_id, final_response,
+            content_hash=content_hash,
+            profile=profile_name, version=result_index.version(),
+            artifacts=artifacts, reusable=reusable,
+        ))
+    except Exception as e:
+        print(f"Could not persist result of {task_id}: {e}")
 
-        # GCS Upload
-        await websocket.send_json({"status": "info", "message": "Uploading to secure cloud storage...", "step": "GCS_UPLOAD"})
-        gcs_uri = upload_to_gcs(file_path, found_file)
-        
-        if not gcs_uri:
-             await websocket.send_json({"status": "error", "message": "GCS Upload Failed"})
+async def lookup_stored_report(content_hash: str, profile_name: str):
+    """
+    Reusable response for identical bytes from the result store, or None.
+    Only served while every file it refers to is still on disk; a hit is
+    copied into the in-process index.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        stored = await loop.run_in_executor(None, result_store.get_by_hash, content_hash, profile_name, result_index.version())
+    except Exception as e:
+        print(f"Result store lookup failed: {e}")
+        return None
+    if not stored or not all(os.path.exists(p) for p in stored["artifacts"]):
+        return None
+    result_index.put(content_hash, stored["response"], artifacts=stored["artifacts"], profile=profile_name)
+    return stored["response"]
+
+async def run_analysis(task_id: str, task: dict, emit):
+    """
+    Full analysis of one registered upload. Runs detached from any socket:
+    progress goes through emit(event), which records it in the task's session log.
+    """
+    emit({"status": "info", "message": "Starting analysis...", "step": "INIT"})
+    profile_name = get_profile(task.get("profile"))["name"]
+    # Per-task span tree; stages below open child spans through services.tracing.span
+    trace = Trace("analysis", task_id=task_id, content_type=task["content_type"], size=task.get("size"), profile=profile_name).start()
+    try:
+        if await serve_cached_report(task_id, task, emit, trace):
+            return
+
+        # One memory-mapped, lazily parsed view of the file shared by every stage below
+        document = DocumentContext(task["path"], task["content_type"])
+        try:
+            with STAGE_SECONDS.time(stage="total"):
+                await run_document_analysis(task_id, task, emit, document, trace)
+        finally:
+            document.close()
+    except AnalysisCancelled as e:
+        # The session emits the terminal CANCELLED event
+        print(f"Analysis {task_id} stopped: {e.reason}")
+        ANALYSES_TOTAL.inc(pipeline=task.get("pipeline_hint") or "unknown", outcome="cancelled")
+        trace.finish(e)
+        raise
+    except BaseException as e:
+        trace.finish(e)
+        raise
+    finally:
+        trace.finish()
+
+async def serve_cached_report(task_id: str, task: dict, emit, trace: Trace) -> bool:
+    """
+    Duplicate detection: identical bytes + same profile/models/pipeline -> the
+    stored report is sent instead of running the pipelines. Returns True on a hit.
+    """
+    content_hash = task.get("sha256")
+    profile_name = get_profile(task.get("profile"))["name"]
+    if not content_hash:
+        return False
+
+    with span("cache_lookup"):
+        cached_response = result_index.get(content_hash, profile_name)
+        if cached_response is None:
+            # Not in this process's index (other worker, or before a restart): try the result store
+            cached_response = await lookup_stored_report(content_hash, profile_name)
+    # A stored report without the text layer cannot serve a request that asks for it
+    if cached_response and task.get("text_layer") and "text_layer" not in cached_response:
+        cached_response = None
+    CACHE_REQUESTS.inc(cache="result", result="hit" if cached_response else "miss")
+    if not cached_response:
+        return False
+
+    emit({"status": "info", "message": "Identical document analyzed recently. Reusing stored report.", "step": "CACHE_HIT"})
+    # The stored report points at the original task's files; lease those
+    artifact_sweeper.alias(task_id, task_id_from_filename(cached_response["filename"]))
+    await asyncio.get_running_loop().run_in_executor(None, artifact_sweeper.touch, task_id)
+    # Per-run fields (the original run's trace) are replaced by this run's own
+    final_response = {k: v for k, v in cached_response.items() if k not in RUN_SCOPED_FIELDS}
+    trace.root.attributes["cached"] = True
+    trace.finish()
+    final_response.update({"task_id": task_id, "original_filename": task.get("original_filename"), "cached": True,
+                           "trace": trace.to_dict()})
+    ANALYSES_TOTAL.inc(pipeline=cached_response.get("pipeline_used"), outcome="cached")
+    report_seq = emit({"status": "info", "message": "Pipeline analysis complete.", "step": "ANALYSIS_COMPLETE", "data": final_response["report"]})
+    await persist_result(task_id, final_response, content_hash, profile_name)
+    emit({"status": "complete", "message": "Analysis successfully completed.", "step": "COMPLETE", "data": complete_delta(final_response, report_seq)})
+    return True
+
+async def run_document_analysis(task_id: str, task: dict, emit, document: DocumentContext, trace: Trace):
+    """Pipelines, storage, reasoning and scoring for a task that missed the result cache."""
+    file_path = task["path"]
+    found_file = task["filename"]
+    filename = found_file # stored name; the frontend fetches the original through it
+    mime_type = task["content_type"] or "application/octet-stream"
+    file_ext = "pdf" if mime_type == "application/pdf" else found_file.split('.')[-1]
+    content_hash = task.get("sha256")
+    profile = get_profile(task.get("profile"))
+    blob_name = content_addressed_blob_name(content_hash or task_id, found_file)
+    if profile["reasoning"]:
+        # Cache miss: make sure the upload overlaps the pipelines (no-op if /api/upload started it)
+        cloud_uploads.start(task_id, file_path, blob_name)
+
+    # Text Extraction (only when the client asked for the text layer; page-parallel, off the event loop)
+    # checkpoint() between stages ends the run early once it is cancelled (client gone, deadline passed)
+    checkpoint()
+    if file_ext == 'pdf' and task.get("text_layer"):
+        emit({"status": "info", "message": "Extracting text content...", "step": "TEXT_EXTRACTION"})
+        try:
+            with STAGE_SECONDS.time(stage="text_extraction"), span("text_extraction"):
+                document.text_layer = await extract_text_layer(document, content_hash)
+        except Exception as e:
+            print(f"Text extraction failed for {task_id}: {e}")
+
+    # Pipeline Determination
+    checkpoint()
+    emit({"status": "info", "message": "Determining appropriate forensic pipeline...", "step": "PIPELINE_SELECTION"})
+    # BUG FIX: Pass full file_path so the orchestrator can open the file
+    # (the pyHanko parse it triggers runs in the executor, not on the event loop)
+    with STAGE_SECONDS.time(stage="pipeline_selection"), span("routing"):
+        pipeline_type = await run_in_executor(asyncio.get_running_loop(), determine_pipeline, file_path, mime_type, document)
+    emit({"status": "info", "message": f"Selected Pipeline: {pipeline_type.value}", "step": "PIPELINE_SELECTED"})
+
+    # Execution
+    emit({"status": "info", "message": f"Running {pipeline_type.value} analysis...", "step": "ANALYSIS_RUNNING"})
+
+    async def send_progress(msg):
+        emit({"status": "info", "message": msg, "step": "ANALYSIS_SUBSTEP"})
+
+    async def run_pipeline():
+        # Runs on a queue worker; the job carries this task's trace context and token along
+        # (a job cancelled while it waited in the queue ends here without running a detector)
+        checkpoint()
+        with span("pipeline", pipeline=pipeline_type.value, profile=profile["name"]):
+            if pipeline_type == PipelineType.STRUCTURAL:
+                return await analyze_structural(file_path, callback=send_progress, document=document, profile=profile)
+            elif pipeline_type == PipelineType.VISUAL:
+                return await analyze_visual(file_path, callback=send_progress, profile=profile)
+            elif pipeline_type == PipelineType.CRYPTOGRAPHIC:
+                return await analyze_cryptographic(file_path, callback=send_progress, document=document)
+            return {"error": "Unsupported pipeline requested"}
+
+    async def send_queue_position(position):
+        emit({"status": "info", "message": f"Waiting for an analysis worker (position {position} in queue)...", "step": "QUEUED", "position": position})
+
+    # Heavy model passes run through the bounded worker pool
+    try:
+        job = analysis_queue.submit(run_pipeline, on_position=send_queue_position)
+    except QueueFull as e:
+        ANALYSES_TOTAL.inc(pipeline=pipeline_type.value, outcome="rejected")
+        emit({"status": "error", "code": 429, "message": str(e)})
+        return
+
+    position = analysis_queue.position(job)
+    if position:
+        await send_queue_position(position)
+    try:
+        report = await job.result()
+    finally:
+        if job.started_at is not None:
+            STAGE_SECONDS.observe(job.started_at - job.enqueued_at, stage="queue_wait")
+            trace.root.set_attribute("queue_wait_ms", round((job.started_at - job.enqueued_at) * 1000, 2))
+            STAGE_SECONDS.observe(time.monotonic() - job.started_at, stage=f"pipeline_{pipeline_type.value}")
+
+    checkpoint()
+    report["analysis_profile"] = profile["name"]
+
+    # Inline images (base64 data: URLs) become artifacts, keeping event frames small
+    await asyncio.get_running_loop().run_in_executor(None, offload_inline_images, report, UPLOAD_DIR, task_id)
+    # Detectors already hashed what they wrote; the artifact endpoint reuses it as the ETag
+    for ref in collect_artifact_refs(report):
+        artifact_etags.seed(os.path.join(UPLOAD_DIR, ref["id"]), ref["sha256"])
+    artifact_sweeper.track(task_id, *collect_report_artifacts(report, UPLOAD_DIR))
+    # The report is sent exactly once; COMPLETE later refers to this event by its seq
+    report_seq = emit({"status": "info", "message": "Pipeline analysis complete.", "step": "ANALYSIS_COMPLETE", "data": report})
+
+    checkpoint()
+    if profile["reasoning"]:
+        # Document Storage (GCS, or local disk with STORAGE_BACKEND=local)
+        emit({"status": "info", "message": "Uploading to secure cloud storage...", "step": "GCS_UPLOAD"})
+        # Usually already finished: the upload started when the file landed
+        with STAGE_SECONDS.time(stage="storage_upload"), span("storage_upload"):
+            document_uri = await cloud_uploads.result(task_id, file_path, blob_name)
+
+        if not document_uri:
+             ANALYSES_TOTAL.inc(pipeline=pipeline_type.value, outcome="error")
+             emit({"status": "error", "message": "Document storage upload failed"})
              return
 
         # Semantic Reasoning
         model_name_log = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
-        await websocket.send_json({"status": "info", "message": f"Initializing {model_name_log} Reasoning Agent...", "step": "REASONING_START"})
-        
-        # Pass local report to reasoning
-        reasoning_result = run_semantic_reasoning(gcs_uri, mime_type=mime_type, local_report=report)
-        
-        # --- HYBRID SCORING LOGIC ---
-        # Formula: Final = (AI_Score * 0.4) + (SegFormer_Score * 0.4) + (Metadata_Score * 0.2)
-        
-        # 1. Normalize AI Score (0-100) -> (0-100)
-        ai_score = reasoning_result.get("authenticity_score", 50)
-        
-        # 2. Normalize SegFormer Score & Local Stats (ELA)
-        # Strategy: If multiple images exist, we take the MINIMUM authenticity score (Worst Case).
-        # i.e. If one image is fake, the document is fake.
-        
-        segformer_score = 100.0
-        local_stats_score = 100.0
-        
-        details = report.get('details', {})
-        analyzed_images = details.get('analyzed_images', [])
-        
-        has_visual_components = False
-        
-        # Helper to extract scores from a visual report dict
-        def extract_visual_scores(vis_details):
-            # SegFormer
-            sf_val = 100.0
-            sem = vis_details.get("semantic_segmentation", {})
-            if isinstance(sem, dict):
-                fraud_conf = sem.get("confidence_score", 0.0)
-                sf_val = max(0, 100 - (fraud_conf * 100))
-                
-            # ELA
-            ela_val = vis_details.get('ela', {}).get('max_difference', 0)
-            ela_auth = max(0, 100 - (ela_val * 1.5)) # Slight scalar to make ELA more sensitive
-            
-            return sf_val, ela_auth
-
-        # Case A: Visual Pipeline (Single Image handled as root details)
-        if pipeline_type == PipelineType.VISUAL:
-            has_visual_components = True
-            sf, ela = extract_visual_scores(details)
-            segformer_score = sf
-            local_stats_score = ela
-            
-        # Case B: Structural with Embedded Images
-        elif analyzed_images:
-            has_visual_components = True
-            # Find the worst score among all images
-            min_sf = 100.0
-            min_ela = 100.0
-            
-            for img_entry in analyzed_images:
-                v_rep = img_entry.get('visual_report', {}).get('details', {})
-                sf, ela = extract_visual_scores(v_rep)
-                if sf < min_sf: min_sf = sf
-                if ela < min_ela: min_ela = ela
-            
-            segformer_score = min_sf
-            local_stats_score = min_ela
-
-        # 3. Normalize Metadata/Structural Score (for non-visual backup)
-        risk_score = report.get('score', 0.0)
-        metadata_auth = max(0, 100 - (risk_score * 100))
-        
-        # 4. Apply Weights & Breakdown
-        final_trust_score = 0
-        score_breakdown = {}
-        
-        if has_visual_components:
-            # Full Formula: AI(40%) + SegFormer(40%) + ELA(20%)
-            final_trust_score = (ai_score * 0.4) + (segformer_score * 0.4) + (local_stats_score * 0.2)
+        emit({"status": "info", "message": f"Initializing {model_name_log} Reasoning Agent...", "step": "REASONING_START"})
+
+        # Pass local report to reasoning (bounded by a deadline; never blocks the event loop)
+        # and never past the task's own deadline
+        checkpoint()
+        remaining = current_token().remaining() if current_token() else None
+        reasoning_deadline = REASONING_DEADLINE_SECONDS if remaining is None else min(REASONING_DEADLINE_SECONDS, remaining)
+        with STAGE_SECONDS.time(stage="reasoning"), span("reasoning") as reasoning_span:
+            reasoning_result = await run_semantic_reasoning_async(document_uri, mime_type=mime_type, local_report=report,
+                                                                  deadline_seconds=reasoning_deadline)
+    else:
+        # Triage profiles skip storage and Gemini entirely
+        reasoning_span = None
+        reasoning_result = {"error": f"Semantic reasoning is not part of the {profile['name']} profile", "skipped": True}
+        emit({"status": "info", "message": f"Profile '{profile['name']}': scoring with local forensics only.", "step": "REASONING_SKIPPED"})
+
+    # No usable AI verdict -> score with local detectors only
+    ai_available = "error" not in reasoning_result
+    if reasoning_span is not None:
+        reasoning_span.set_attribute("fallback", not ai_available)
+    if not ai_available and not reasoning_result.get("skipped"):
+        reason = "timed out" if reasoning_result.get("timed_out") else "failed"
+        emit({"status": "info", "message": f"Reasoning {reason}; scoring with local forensics only.", "step": "REASONING_FALLBACK"})
+
+    # --- HYBRID SCORING LOGIC ---
+    # Formula: Final = (AI_Score * 0.4) + (SegFormer_Score * 0.4) + (Metadata_Score * 0.2)
+
+    # 1. Normalize AI Score (0-100) -> (0-100)
+    ai_score = reasoning_result.get("authenticity_score", 50)
+
+    # 2. Normalize SegFormer Score & Local Stats (ELA)
+    # Strategy: If multiple images exist, we take the MINIMUM authenticity score (Worst Case).
+    # i.e. If one image is fake, the document is fake.
+
+    segformer_score = 100.0
+    local_stats_score = 100.0
+
+    details = report.get('details', {})
+    analyzed_images = details.get('analyzed_images', [])
+
+    has_visual_components = False
+
+    # Helper to extract scores from a visual report dict
+    def extract_visual_scores(vis_details):
+        # SegFormer
+        sf_val = 100.0
+        sem = vis_details.get("semantic_segmentation", {})
+        if isinstance(sem, dict):
+            fraud_conf = sem.get("confidence_score", 0.0)
+            sf_val = max(0, 100 - (fraud_conf * 100))
+
+        # ELA
+        ela_val = vis_details.get('ela', {}).get('max_difference', 0)
+        ela_auth = max(0, 100 - (ela_val * 1.5)) # Slight scalar to make ELA more sensitive
+
+        # Block-level ELA / noise inconsistency: a region that disagrees with the rest
+        # of the image lowers local statistics even when the global ELA level looks normal.
+        # Weighted in rather than a cap, so one detector alone cannot zero the signal
+        noise = vis_details.get('noise_analysis', {})
+        block_scores = [
+            (section.get('blocks') or {}).get('inconsistency_score', 0.0)
+            for section in (vis_details.get('ela', {}), noise if isinstance(noise, dict) else {})
+        ]
+        block_auth = 100 * (1 - max(block_scores))
+        ela_auth = (1 - BLOCK_INCONSISTENCY_WEIGHT) * ela_auth + BLOCK_INCONSISTENCY_WEIGHT * block_auth
+
+        return sf_val, ela_auth
+
+    # Case A: Visual Pipeline (Single Image handled as root details)
+    if pipeline_type == PipelineType.VISUAL:
+        has_visual_components = True
+        sf, ela = extract_visual_scores(details)
+        segformer_score = sf
+        local_stats_score = ela
+
+    # Case B: Structural with Embedded Images
+    elif analyzed_images:
+        has_visual_components = True
+        # Find the worst score among all images
+        min_sf = 100.0
+        min_ela = 100.0
+
+        for img_entry in analyzed_images:
+            v_rep = img_entry.get('visual_report', {}).get('details', {})
+            sf, ela = extract_visual_scores(v_rep)
+            if sf < min_sf: min_sf = sf
+            if ela < min_ela: min_ela = ela
+
+        segformer_score = min_sf
+        local_stats_score = min_ela
+
+    # 3. Normalize Metadata/Structural Score (for non-visual backup)
+    risk_score = report.get('score', 0.0)
+    metadata_auth = max(0, 100 - (risk_score * 100))
+
+    # 4. Apply Weights & Breakdown
+    # A profile without SegFormer (quick) reports no SegFormer confidence; its weight goes to the others
+    segformer_ran = "segformer" in profile["visual_detectors"]
+    final_trust_score = 0
+    score_breakdown = {}
+
+    if not ai_available:
+        reasoning_result["fallback"] = "local_only"
+        if has_visual_components and not segformer_ran:
+            final_trust_score = local_stats_score
             score_breakdown = {
-                "AI Analysis (40%)": round(ai_score, 1),
-                "Visual Forensics (SegFormer) (40%)": round(segformer_score, 1),
-                "Compression Consistency (ELA) (20%)": round(local_stats_score, 1)
+                "Compression Consistency (ELA) (100%)": round(local_stats_score, 1)
+            }
+        elif has_visual_components:
+            # Local-only: SegFormer(67%) + ELA(33%) keeps their 2:1 ratio
+            final_trust_score = (segformer_score * (2 / 3)) + (local_stats_score * (1 / 3))
+            score_breakdown = {
+                "Visual Forensics (SegFormer) (67%)": round(segformer_score, 1),
+                "Compression Consistency (ELA) (33%)": round(local_stats_score, 1)
             }
         else:
-            # Structural/PDF Only
-            final_trust_score = (ai_score * 0.6) + (metadata_auth * 0.4)
+            final_trust_score = metadata_auth
             score_breakdown = {
-                "AI Analysis (60%)": round(ai_score, 1),
-                "Metadata/Structure (40%)": round(metadata_auth, 1)
+                "Metadata/Structure (100%)": round(metadata_auth, 1)
             }
-            
-        final_trust_score = round(final_trust_score)
-        
-        # Inject this back into reasoning_result
-        reasoning_result["original_ai_score"] = ai_score
-        reasoning_result["authenticity_score"] = final_trust_score
-        reasoning_result["score_breakdown"] = score_breakdown
-        
-        # Final Result
-        final_response = {
-            "task_id": task_id,
-            "filename": filename,
-            "pipeline_used": pipeline_type.value,
-            "report": report,
-            "reasoning": reasoning_result
+    elif has_visual_components and not segformer_ran:
+        final_trust_score = (ai_score * 0.6) + (local_stats_score * 0.4)
+        score_breakdown = {
+            "AI Analysis (60%)": round(ai_score, 1),
+            "Compression Consistency (ELA) (40%)": round(local_stats_score, 1)
         }
-        
-        await websocket.send_json({"status": "complete", "message": "Analysis successfully completed.", "step": "COMPLETE", "data": final_response})
-        await websocket.close()
+    elif has_visual_components:
+        # Full Formula: AI(40%) + SegFormer(40%) + ELA(20%)
+        final_trust_score = (ai_score * 0.4) + (segformer_score * 0.4) + (local_stats_score * 0.2)
+        score_breakdown = {
+            "AI Analysis (40%)": round(ai_score, 1),
+            "Visual Forensics (SegFormer) (40%)": round(segformer_score, 1),
+            "Compression Consistency (ELA) (20%)": round(local_stats_score, 1)
+        }
+    else:
+        # Structural/PDF Only
+        final_trust_score = (ai_score * 0.6) + (metadata_auth * 0.4)
+        score_breakdown = {
+            "AI Analysis (60%)": round(ai_score, 1),
+            "Metadata/Structure (40%)": round(metadata_auth, 1)
+        }
+
+    final_trust_score = round(final_trust_score)
+    # Scores of different profiles are not directly comparable; say which one produced this
+    score_breakdown["Analysis Profile"] = profile["name"]
+
+    # Inject this back into reasoning_result
+    reasoning_result["original_ai_score"] = ai_score if ai_available else None
+    reasoning_result["authenticity_score"] = final_trust_score
+    reasoning_result["score_breakdown"] = score_breakdown
+
+    # Final Result
+    final_response = {
+        "task_id": task_id,
+        "filename": filename,
+        "original_filename": task.get("original_filename"),
+        "pipeline_used": pipeline_type.value,
+        "analysis_profile": profile["name"],
+        "report": report,
+        "reasoning": reasoning_result
+    }
+    if document.text_layer is not None:
+        final_response["text_layer"] = document.text_layer
+
+    # Close the root span now so the attached trace covers everything up to scoring
+    trace.finish()
+    final_response["trace"] = trace.to_dict()
+
+    # Only cache complete verdicts (a failed reasoning call should be retried next time;
+    # a profile that skips reasoning is complete without it)
+    artifacts = collect_report_artifacts(report, UPLOAD_DIR) + [file_path]
+    reusable = bool(content_hash) and ("error" not in reasoning_result or bool(reasoning_result.get("skipped")))
+    if reusable:
+        result_index.put(content_hash, final_response, artifacts=artifacts, profile=profile["name"])
+    # Every finished task is persisted for GET /api/result (before COMPLETE, so a poller never misses it)
+    await persist_result(task_id, final_response, content_hash, profile["name"], artifacts=artifacts, reusable=reusable)
+
+    ANALYSES_TOTAL.inc(pipeline=pipeline_type.value, outcome="complete" if ai_available else "local_only")
+    emit({"status": "complete", "message": "Analysis successfully completed.", "step": "COMPLETE", "data": complete_delta(final_response, report_seq)})
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+@app.websocket("/ws/analyze/{task_id}")
+async def analyze_document(websocket: WebSocket, task_id: str):
+    """
+    Attaches the socket to the task's analysis session (starting it on first connect).
+    Reconnecting clients pass ?last_event=<seq> to replay only the events they missed,
+    then keep following live progress. Nothing is recomputed on reconnect.
+    An analysis nobody follows for ABANDON_GRACE_SECONDS is cancelled; clients
+    can also stop it by sending {"action": "cancel"}.
+    """
+    await websocket.accept()
+    try:
+        session = analysis_sessions.get(task_id)
+        if session is None:
+            # Finished before the last restart (or past session retention): serve the stored result
+            event = await stored_complete_event(task_id)
+            if event is not None:
+                await websocket.send_json(event)
+                await websocket.close()
+                return
+
+            # Locate file via the task registry (written by upload_document)
+            task = task_registry.get(task_id)
+
+            if not task or not os.path.exists(task["path"]):
+                await websocket.send_json({"status": "error", "message": "File not found"})
+                await websocket.close()
+                return
+
+            session = start_analysis_session(task_id, task)
+
+        try:
+            last_event = int(websocket.query_params.get("last_event", 0))
+        except ValueError:
+            last_event = 0
+
+        async def forward_events():
+            close_code = 1000
+            # aclosing: the follower is detached as soon as this socket is done
+            async with aclosing(session.follow(last_event)) as events:
+                async for event in events:
+                    await websocket.send_json(event)
+                    if event.get("code") == 429:
+                        close_code = 1013 # Try Again Later
+            return close_code
+
+        async def watch_client():
+            # Notices a dropped socket even while no events are flowing (e.g. during a model pass);
+            # {"action": "cancel"} stops the analysis right away
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                try:
+                    if json.loads(message.get("text") or "{}").get("action") == "cancel":
+                        session.cancel("client_cancelled")
+                except (ValueError, AttributeError):
+                    pass
+
+        forwarder = asyncio.create_task(forward_events())
+        watcher = asyncio.create_task(watch_client())
+        done, _ = await asyncio.wait({forwarder, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        watcher.cancel()
+        if forwarder not in done:
+            # Client gone; the session is cancelled if nobody re-attaches within ABANDON_GRACE_SECONDS
+            forwarder.cancel()
+            print(f"Client disconnected task {task_id}")
+            return
+
+        await websocket.close(code=forwarder.result())
 
     except WebSocketDisconnect:
+        # The analysis keeps running for the grace period; a reconnect replays what was missed
         print(f"Client disconnected task {task_id}")
     except Exception as e:
         await websocket.send_json({"status": "error", "message": str(e)})
-        convert_e = str(e) # avoid f-string inside await if fearful
-
 
 
 
@@ -0,0 +1,76 @@
+import os
+
+# Detector sets, cheapest first. Every profile runs the PDF metadata / structure
+# checks and signature validation; they differ in the image models they pay for.
+PROFILES = {
+    # Triage: OpenCV ELA only (single quality, no ghost sweep), no model passes and no Gemini call (local-only score)
+    "quick": {
+        "visual_detectors": ("ela",),
+        "max_embedded_images": 3,
+        "reasoning": False,
+        "trufor_max_side": None,
+        "ela_sweep": False,
+        "ela_sweep_max_pixels": None,
+    },
+    "standard": {
+        "visual_detectors": ("ela", "quantization", "noise", "segformer"),
+        "max_embedded_images": 3,
+        "reasoning": True,
+        "trufor_max_side": None,
+        "ela_sweep": True,
+        "ela_sweep_max_pixels": None,
+    },
+    # Full audit: adds TruFor at full resolution, sweeps ELA ghosts over the whole image
+    # and inspects every embedded image
+    "deep": {
+        "visual_detectors": ("ela", "quantization", "noise", "segformer", "trufor"),
+        "max_embedded_images": None,
+        "reasoning": True,
+        "trufor_max_side": 0,
+        "ela_sweep": True,
+        "ela_sweep_max_pixels": 0,
+    },
+}
+
+DEFAULT_ANALYSIS_PROFILE = os.getenv("DEFAULT_ANALYSIS_PROFILE", "standard")
+
+
+def _parse_key_profiles(raw: str) -> dict:
+    """ANALYSIS_PROFILE_API_KEYS="key1:quick,key2:deep" -> {"key1": "quick", "key2": "deep"}"""
+    mapping = {}
+    for entry in raw.split(","):
+        key, sep, profile = entry.strip().rpartition(":")
+        if sep and key and profile in PROFILES:
+            mapping[key] = profile
+        elif entry.strip():
+            # Never echo the entry; it contains the key
+            print(f"Ignoring invalid ANALYSIS_PROFILE_API_KEYS entry (expected key:{'|'.join(PROFILES)})")
+    return mapping
+
+
+# Default profile per API key (X-API-Key header), e.g. quick for a bulk-ingest client
+API_KEY_PROFILES = _parse_key_profiles(os.getenv("ANALYSIS_PROFILE_API_KEYS", ""))
+
+
+class UnknownProfile(ValueError):
+    pass
+
+
+def resolve_profile(requested: str = None, api_key: str = None) -> str:
+    """
+    Profile name for a request: an explicit ?profile= wins, then the API key's
+    profile, then DEFAULT_ANALYSIS_PROFILE.
+    """
+    if requested:
+        if requested not in PROFILES:
+            raise UnknownProfile(f"Unknown analysis profile '{requested}'. Choose one of: {', '.join(PROFILES)}")
+        return requested
+    if api_key and api_key in API_KEY_PROFILES:
+        return API_KEY_PROFILES[api_key]
+    return DEFAULT_ANALYSIS_PROFILE if DEFAULT_ANALYSIS_PROFILE in PROFILES else "standard"
+
+
+def get_profile(name: str = None) -> dict:
+    """Profile settings plus its name; falls back to the default profile."""
+    name = name if name in PROFILES else resolve_profile()
+    return {"name": name, **PROFILES[name]}
@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+
+from services.cancellation import CancellationToken, AnalysisCancelled, use_token, ANALYSIS_DEADLINE_SECONDS
+
+# Finished sessions stay replayable this long (late reconnects still get the report)
+SESSION_RETENTION_SECONDS = int(os.getenv("SESSION_RETENTION_SECONDS", "900"))
+# A running session nobody follows is cancelled after this long (a reconnect within it resumes; < 0 = never)
+ABANDON_GRACE_SECONDS = float(os.getenv("ABANDON_GRACE_SECONDS", "30"))
+
+TERMINAL_STATUSES = ("complete", "error")
+
+
+class AnalysisSession:
+    """
+    One analysis run, detached from any socket.
+    Every {status, step, message} event is appended to an ordered log with a
+    sequence number; followers replay the log and then receive live events.
+    The run stops cooperatively (services.cancellation) when its deadline
+    passes, on cancel(), or once it has had no follower for grace_seconds.
+    """
+
+    def __init__(self, task_id: str, deadline_seconds: float = ANALYSIS_DEADLINE_SECONDS,
+                 grace_seconds: float = ABANDON_GRACE_SECONDS):
+        self.task_id = task_id
+        self.events = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.runner = None
+        self.token = CancellationToken(deadline_seconds)
+        self.grace_seconds = grace_seconds
+        self._followers = set()
+        self._abandon_timer = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self.finished:
+            self.token.cancel(reason)
+
+    def _abandon(self):
+        self._abandon_timer = None
+        if not self._followers:
+            self.cancel("client_disconnected")
+
+    def _on_follower_left(self):
+        if self._followers or self.finished or self.grace_seconds < 0:
+            return
+        if self._abandon_timer is None:
+            self._abandon_timer = asyncio.get_running_loop().call_later(self.grace_seconds, self._abandon)
+
+    def emit(self, event: dict) -> int:
+        """Appends the event and fans it out. Returns its sequence number."""
+        event = {**event, "seq": len(self.events) + 1}
+        self.events.append(event)
+        if event.get("status") in TERMINAL_STATUSES:
+            self.finished_at = time.time()
+        for queue in self._followers:
+            queue.put_nowait(event)
+        return event["seq"]
+
+    async def follow(self, after_seq: int = 0):
+        """
+        Yields every event with seq > after_seq, then live events until the
+        session reaches a terminal status.
+        """
+        queue = asyncio.Queue()
+        # Snapshot and subscribe without awaiting in between, so no event is missed or duplicated
+        backlog = self.events[after_seq:]
+        self._followers.add(queue)
+        # A reconnect within the grace period keeps the analysis alive
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        try:
+            last_seq = after_seq
+            for event in backlog:
+                yield event
+                last_seq = event["seq"]
+                if event.get("status") in TERMINAL_STATUSES:
+                    return
+            # Events emitted while the backlog was being yielded (the terminal one
+            # included) are already in the queue: drain it before giving up
+            while True:
+                if queue.empty() and self.finished:
+                    return
+                event = await queue.get()
+                if event["seq"] <= last_seq:
+                    continue
+                yield event
+                last_seq = event["seq"]
+                if event.get("status") in TERMINAL_STATUSES:
+                    return
+        finally:
+            self._followers.discard(queue)
+            self._on_follower_left()
+
+
+class SessionManager:
+    """
+    Keeps at most one running analysis per task_id.
+    A reconnect with the same task_id attaches to the existing session
+    instead of starting the pipeline again.
+    """
+
+    def __init__(self, retention_seconds: int = SESSION_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._sessions = {}
+
+    def get(self, task_id: str):
+        return self._sessions.get(task_id)
+
+    def get_or_start(self, task_id: str, run) -> AnalysisSession:
+        """
+        run(emit) is an async function performing the analysis; it is started
+        as a background task the first time a task_id is seen.
+        """
+        self._purge_expired()
+        session = self._sessions.get(task_id)
+        if session is not None:
+            return session
+
+        session = AnalysisSession(task_id)
+        self._sessions[task_id] = session
+
+        async def runner():
+            try:
+                # Tasks and queue jobs started by run() inherit the token
+                with use_token(session.token):
+                    await run(session.emit)
+            except AnalysisCancelled as e:
+                session.emit({"status": "error", "step": "CANCELLED", "reason": e.reason, "message": str(e)})
+            except Exception as e:
+                session.emit({"status": "error", "message": str(e)})
+            finally:
+                # Followers wait for a terminal event; always deliver one
+                if not session.finished:
+                    session.emit({"status": "error", "message": "Analysis ended unexpectedly"})
+
+        session.runner = asyncio.create_task(runner())
+        return session
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [tid for tid, s in self._sessions.items() if s.finished and s.finished_at < cutoff]
+        for tid in expired:
+            del self._sessions[tid]
+
+    def stats(self) -> dict:
+        running = sum(1 for s in self._sessions.values() if not s.finished)
+        return {"sessions": len(self._sessions), "running": running}
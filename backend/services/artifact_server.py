@@ -0,0 +1,150 @@
+import os
+import base64
+import asyncio
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import FileResponse, Response
+
+# Artifact names embed the task_id, so a given URL never changes content
+ARTIFACT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# When set (e.g. "/_artifacts/"), responses carry X-Accel-Redirect and nginx streams the bytes.
+# Only requests that came through that nginx (it sets ACCEL_ENABLED_HEADER) are offloaded;
+# anything else, e.g. the browser calling the backend port directly, gets the file itself.
+ARTIFACT_ACCEL_REDIRECT_PREFIX = os.getenv("ARTIFACT_ACCEL_REDIRECT_PREFIX", "")
+ACCEL_ENABLED_HEADER = "x-accel-enabled"
+ETAG_CACHE_MAX_ENTRIES = int(os.getenv("ETAG_CACHE_MAX_ENTRIES", "4096"))
+
+
+class ArtifactETags:
+    """
+    Strong ETags derived from the SHA-256 of each file's content.
+    Hashes are cached per (inode, mtime, size), so each file is read once;
+    uploads are seeded with the hash computed while streaming them to disk.
+    """
+
+    def __init__(self, max_entries: int = ETAG_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(st):
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _remember(self, path: str, key, etag: str):
+        with self._lock:
+            self._entries[path] = (key, etag)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def seed(self, path: str, sha256_hex: str):
+        try:
+            self._remember(path, self._key(os.stat(path)), f'"{sha256_hex[:32]}"')
+        except OSError:
+            pass
+
+    def get(self, path: str, st) -> str:
+        """Blocking (may hash the file); call from an executor."""
+        key = self._key(st)
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:32]}"'
+        self._remember(path, key, etag)
+        return etag
+
+
+def resolve_artifact_path(directory: str, name: str):
+    """Only plain file names inside the uploads directory are served."""
+    if not name or name != os.path.basename(name) or name.startswith("."):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+async def artifact_response(request, directory: str, name: str, etags: ArtifactETags) -> Response:
+    """
+    1. Conditional requests with a matching ETag get 304 without touching the file.
+    2. In X-Accel-Redirect mode, for requests proxied by nginx, nginx serves
+       the body (including Range requests).
+    3. Otherwise FileResponse streams it; it answers Range/If-Range with 206.
+    """
+    path = resolve_artifact_path(directory, name)
+    if path is None:
+        return Response(status_code=404)
+
+    loop = asyncio.get_running_loop()
+    try:
+        st = await loop.run_in_executor(None, os.stat, path)
+        etag = await loop.run_in_executor(None, etags.get, path, st)
+    except FileNotFoundError:
+        # Swept between the lookup and the read
+        return Response(status_code=404)
+
+    headers = {"ETag": etag, "Cache-Control": ARTIFACT_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if ARTIFACT_ACCEL_REDIRECT_PREFIX and request.headers.get(ACCEL_ENABLED_HEADER):
+        headers["X-Accel-Redirect"] = f"{ARTIFACT_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{name}"
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=st)
+
+
+def offload_inline_images(report: dict, directory: str, task_id: str) -> list:
+    """
+    Moves inline data:image/...;base64 strings out of a report: each is decoded
+    into <task_id>.inline<N>.<ext> in the uploads directory and the string is
+    replaced by an artifact reference (see services.artifact_writer). Detectors
+    write their images as artifacts already; this catches anything that still
+    inlines one. Returns the names. Runs in an executor; it decodes and writes files.
+    """
+    written = []
+
+    def visit(node):
+        if isinstance(node, dict):
+            items = node.items()
+        elif isinstance(node, list):
+            items = enumerate(node)
+        else:
+            return
+        for key, value in list(items):
+            if isinstance(value, str) and value.startswith("data:image/") and ";base64," in value:
+                header, payload = value.split(",", 1)
+                ext = header[len("data:image/"):].split(";")[0] or "png"
+                name = f"{task_id}.inline{len(written)}.{ext}"
+                data = base64.b64decode(payload)
+                with open(os.path.join(directory, name), "wb") as fh:
+                    fh.write(data)
+                node[key] = {
+                    "id": name,
+                    "kind": "inline",
+                    "media_type": f"image/{ext}",
+                    "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+                written.append(name)
+            else:
+                visit(value)
+
+    visit(report)
+    return written
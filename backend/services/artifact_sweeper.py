@@ -0,0 +1,322 @@
+import os
+import time
+import heapq
+import asyncio
+import threading
+
+# Default lifetime of a task's files after its last activity
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", "900"))
+# Lease granted each time a client signals it is still viewing a report
+ARTIFACT_LEASE_SECONDS = int(os.getenv("ARTIFACT_LEASE_SECONDS", "300"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "30"))
+# Upper bound for the uploads directory; least recently accessed tasks go first
+UPLOAD_DISK_CAP_BYTES = int(os.getenv("UPLOAD_DISK_CAP_BYTES", str(2 * 1024 ** 3)))
+# Rare full scan that adopts files the heap does not know (e.g. after a restart)
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("RECONCILE_INTERVAL_SECONDS", "3600"))
+# A task's expiry is mirrored into the shared task registry when it moves by at least this much
+# (a dashboard fetching overlays does not write the registry on every request)
+LEASE_SYNC_SECONDS = 30
+
+
+def task_id_from_filename(name: str) -> str:
+    """uploads/<task_id>.<ext>[.ela.png | _img_N.<ext> ...] -> <task_id>"""
+    return name.split(".")[0]
+
+
+class ArtifactSweeper:
+    """
+    Deletes each task's upload and derived artifacts together once its expiry passes.
+
+    - Expiries live in a min-heap, so a sweep only touches tasks that are due
+      (stale heap entries from extended leases are skipped lazily).
+    - touch() extends a task's lease while a client is viewing its report.
+    - pin() protects tasks whose analysis is still running.
+    - When the tracked bytes exceed the disk cap, least recently accessed
+      tasks are evicted first.
+
+    With a `registry` (services.task_registry), each task's expiry is also
+    kept in its registry record ("artifacts_expire_at"). Several workers on
+    one uploads volume share the SQLite registry, so a lease granted by any
+    worker reaches the worker tracking the files, and reconcile() never
+    adopts files another worker still has leased. Leases of tasks another
+    worker tracks read the registry at most once per LEASE_SYNC_SECONDS per
+    task; registry access blocks, so the per-request touch() belongs in an executor.
+
+    `maintenance` callables (e.g. the local document store's purge) run with
+    reconcile(), the rare pass that is allowed to list directories.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: int = ARTIFACT_TTL_SECONDS,
+                 disk_cap_bytes: int = UPLOAD_DISK_CAP_BYTES, on_evict=None, registry=None, maintenance=()):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.disk_cap_bytes = disk_cap_bytes
+        self.on_evict = on_evict
+        self.registry = registry
+        self.maintenance = list(maintenance)
+        self._tasks = {}
+        self._heap = []
+        self._aliases = {}
+        # task_id -> (read at, shared expiry or None) for tasks this worker does not track
+        self._shared_seen = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._last_reconcile = 0.0
+        self.evicted = 0
+
+    def _entry(self, task_id: str, now: float):
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            entry = {"files": {}, "expires_at": now + self.ttl_seconds, "last_access": now, "pinned": 0,
+                     "shared_expires_at": 0.0}
+            self._tasks[task_id] = entry
+            heapq.heappush(self._heap, (entry["expires_at"], task_id))
+        return entry
+
+    # --- Shared expiry (task registry) ---
+
+    def _shared_expiry(self, task_id: str):
+        """Expiry recorded in the registry (any worker), or None when no record references the task."""
+        if self.registry is None:
+            return None
+        try:
+            record = self.registry.get(task_id)
+        except Exception as e:
+            print(f"Sweeper registry read failed for {task_id}: {e}")
+            return None
+        if record is None:
+            return None
+        return float(record.get("artifacts_expire_at") or record.get("created_at", 0) + self.ttl_seconds)
+
+    def _seen_shared_expiry(self, task_id: str, now: float):
+        """_shared_expiry() of an untracked task, read from the registry at most once per LEASE_SYNC_SECONDS."""
+        with self._lock:
+            seen = self._shared_seen.get(task_id)
+        if seen is not None and now - seen[0] < LEASE_SYNC_SECONDS:
+            return seen[1]
+        shared = self._shared_expiry(task_id)
+        with self._lock:
+            self._shared_seen[task_id] = (now, shared)
+        return shared
+
+    def _publish(self, task_id: str, expires_at: float):
+        if self.registry is None:
+            return
+        try:
+            self.registry.update(task_id, artifacts_expire_at=expires_at)
+        except Exception as e:
+            print(f"Sweeper registry write failed for {task_id}: {e}")
+
+    def _sync_entry(self, task_id: str):
+        """Mirrors a tracked task's expiry into the registry when it moved by LEASE_SYNC_SECONDS."""
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None or entry["expires_at"] - entry["shared_expires_at"] < LEASE_SYNC_SECONDS:
+                return
+            entry["shared_expires_at"] = expires_at = entry["expires_at"]
+        self._publish(task_id, expires_at)
+
+    def _add_files(self, entry: dict, paths):
+        for path in paths:
+            name = os.path.basename(path)
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            self._total_bytes += size - entry["files"].get(name, 0)
+            entry["files"][name] = size
+
+    def track(self, task_id: str, *paths):
+        """Registers files belonging to a task (upload, overlays, extracted images)."""
+        with self._lock:
+            self._add_files(self._entry(task_id, time.time()), paths)
+        self._sync_entry(task_id)
+
+    def alias(self, task_id: str, owner_task_id: str):
+        """A task that reuses another task's artifacts (duplicate upload) leases the owner's files."""
+        with self._lock:
+            self._aliases[task_id] = owner_task_id
+
+    def touch(self, task_id: str, lease_seconds: int = ARTIFACT_LEASE_SECONDS):
+        """
+        Records an access and extends the task's expiry. Returns the new expiry,
+        or None for a task no worker knows. A task tracked by another worker gets
+        its lease in the shared registry; that worker's sweep honours it.
+        """
+        now = time.time()
+        with self._lock:
+            task_id = self._aliases.get(task_id, task_id)
+            entry = self._tasks.get(task_id)
+            if entry is not None:
+                entry["last_access"] = now
+                if now + lease_seconds > entry["expires_at"]:
+                    entry["expires_at"] = now + lease_seconds
+                    heapq.heappush(self._heap, (entry["expires_at"], task_id))
+                expires_at = entry["expires_at"]
+        if entry is not None:
+            self._sync_entry(task_id)
+            return expires_at
+
+        shared = self._seen_shared_expiry(task_id, now)
+        if shared is None:
+            return None
+        if now + lease_seconds - shared >= LEASE_SYNC_SECONDS:
+            shared = now + lease_seconds
+            self._publish(task_id, shared)
+            with self._lock:
+                self._shared_seen[task_id] = (now, shared)
+        return shared
+
+    def pin(self, task_id: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entry(task_id, now)
+            entry["pinned"] += 1
+            # Other workers see a running analysis as a lease that keeps being renewed
+            if now + self.ttl_seconds > entry["expires_at"]:
+                entry["expires_at"] = now + self.ttl_seconds
+                heapq.heappush(self._heap, (entry["expires_at"], task_id))
+        self._sync_entry(task_id)
+
+    def unpin(self, task_id: str):
+        now = time.time()
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                return
+            entry["pinned"] = max(0, entry["pinned"] - 1)
+            # The TTL counts from the end of the analysis, not from the upload
+            entry["last_access"] = now
+            entry["expires_at"] = max(entry["expires_at"], now + self.ttl_seconds)
+            heapq.heappush(self._heap, (entry["expires_at"], task_id))
+        self._sync_entry(task_id)
+
+    def _evict(self, task_id: str):
+        entry = self._tasks.pop(task_id, None)
+        if entry is None:
+            return
+        for name, size in entry["files"].items():
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Sweeper warning for {name}: {e}")
+            self._total_bytes -= size
+        self._aliases = {k: v for k, v in self._aliases.items() if v != task_id and k != task_id}
+        self.evicted += 1
+        if self.on_evict:
+            try:
+                self.on_evict(task_id)
+            except Exception as e:
+                print(f"Sweeper eviction hook failed for {task_id}: {e}")
+
+    def sweep(self, now: float = None):
+        """One pass: expire due tasks, then enforce the disk cap."""
+        now = now or time.time()
+        due = []
+        renewed = []
+        with self._lock:
+            self._shared_seen = {k: v for k, v in self._shared_seen.items() if now - v[0] < LEASE_SYNC_SECONDS}
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, task_id = heapq.heappop(self._heap)
+                entry = self._tasks.get(task_id)
+                # Skip stale heap entries (lease extended) and running analyses
+                if entry is None or entry["expires_at"] != expires_at:
+                    continue
+                if entry["pinned"]:
+                    entry["expires_at"] = now + self.ttl_seconds
+                    heapq.heappush(self._heap, (entry["expires_at"], task_id))
+                    renewed.append(task_id)
+                    continue
+                due.append((task_id, expires_at))
+
+        # Leases granted through another worker live in the registry (read outside the lock)
+        extended = {}
+        for task_id, _ in due:
+            shared = self._shared_expiry(task_id)
+            if shared is not None and shared > now:
+                extended[task_id] = shared
+
+        with self._lock:
+            for task_id, expires_at in due:
+                entry = self._tasks.get(task_id)
+                # Touched or pinned while the registry was read: a newer heap entry covers it
+                if entry is None or entry["expires_at"] != expires_at or entry["pinned"]:
+                    continue
+                if task_id in extended:
+                    entry["expires_at"] = entry["shared_expires_at"] = extended[task_id]
+                    heapq.heappush(self._heap, (entry["expires_at"], task_id))
+                    continue
+                self._evict(task_id)
+
+            if self._total_bytes > self.disk_cap_bytes:
+                candidates = sorted(
+                    (e["last_access"], tid) for tid, e in self._tasks.items() if not e["pinned"]
+                )
+                for _, task_id in candidates:
+                    if self._total_bytes <= self.disk_cap_bytes:
+                        break
+                    self._evict(task_id)
+
+        for task_id in renewed:
+            self._sync_entry(task_id)
+
+    def reconcile(self):
+        """
+        Adopts untracked files (left over from a restart or a worker that went
+        away) that are older than the TTL. A file is only adopted when no
+        registry record references its task, or the record's shared expiry
+        has passed: files another worker still analyses or has leased stay.
+        Runs rarely; the per-sweep path never lists the directory.
+        """
+        now = time.time()
+        self._last_reconcile = now
+        if not os.path.isdir(self.directory):
+            return
+        candidates = {}
+        with os.scandir(self.directory) as entries:
+            for item in entries:
+                if item.name.startswith(".") or not item.is_file():
+                    continue
+                task_id = task_id_from_filename(item.name)
+                with self._lock:
+                    if task_id in self._tasks:
+                        continue
+                st = item.stat()
+                if st.st_mtime < now - self.ttl_seconds:
+                    candidates.setdefault(task_id, []).append(item.name)
+        for task_id, names in candidates.items():
+            shared = self._shared_expiry(task_id)
+            if shared is not None and shared > now:
+                continue
+            with self._lock:
+                entry = self._entry(task_id, now)
+                self._add_files(entry, names)
+                # Already past its TTL: due at the next sweep
+                entry["expires_at"] = now
+                heapq.heappush(self._heap, (now, task_id))
+
+    async def run(self, interval_seconds: int = SWEEP_INTERVAL_SECONDS):
+        """Periodic loop started from the app lifespan."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if time.time() - self._last_reconcile > RECONCILE_INTERVAL_SECONDS:
+                    await loop.run_in_executor(None, self.reconcile)
+                    for task in self.maintenance:
+                        await loop.run_in_executor(None, task)
+                await loop.run_in_executor(None, self.sweep)
+            except Exception as e:
+                print(f"Sweeper error: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked_tasks": len(self._tasks),
+                "pinned_tasks": sum(1 for entry in self._tasks.values() if entry["pinned"]),
+                "tracked_bytes": self._total_bytes,
+                "disk_cap_bytes": self.disk_cap_bytes,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,73 @@
+import os
+import hashlib
+
+import cv2
+import numpy as np
+
+
+def _to_uint8(image: np.ndarray, color_order: str) -> np.ndarray:
+    """Normalizes detector output to what cv2.imencode expects (gray, BGR or BGRA uint8)."""
+    if image.dtype != np.uint8:
+        image = np.clip(np.asarray(image, dtype=np.float32) * 255.0, 0, 255).astype(np.uint8)
+    if image.ndim == 3 and color_order == "rgba":
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+    elif image.ndim == 3 and color_order == "rgb":
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    return image
+
+
+def write_image_artifact(source_path: str, kind: str, image: np.ndarray, color_order: str = "bgr") -> dict:
+    """
+    The one way detectors persist images. Encodes `image` as PNG next to the
+    analyzed file (<source name>.<kind>.png) and returns a compact reference:
+
+        {"id", "kind", "media_type", "size", "width", "height", "sha256"}
+
+    `id` is the artifact name served by /api/artifacts. Float images are
+    expected in [0, 1]; color_order is "bgr" (OpenCV), "rgb" or "rgba" (matplotlib).
+    """
+    pixels = _to_uint8(image, color_order)
+    ok, encoded = cv2.imencode(".png", pixels)
+    if not ok:
+        raise ValueError(f"Could not encode {kind} artifact")
+    data = encoded.tobytes()
+
+    name = f"{os.path.basename(source_path)}.{kind}.png"
+    path = os.path.join(os.path.dirname(source_path), name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    # Readers (artifact endpoint, nginx) never see a half-written file
+    os.replace(tmp_path, path)
+
+    return {
+        "id": name,
+        "kind": kind,
+        "media_type": "image/png",
+        "size": len(data),
+        "width": int(pixels.shape[1]),
+        "height": int(pixels.shape[0]),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def is_artifact_ref(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("id"), str) and "sha256" in value and "media_type" in value
+
+
+def collect_artifact_refs(report) -> list:
+    """Every artifact reference anywhere in a report (detector overlays, offloaded inline images)."""
+    refs = []
+
+    def visit(node):
+        if is_artifact_ref(node):
+            refs.append(node)
+        elif isinstance(node, dict):
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for item in node:
+                visit(item)
+
+    visit(report)
+    return refs
@@ -0,0 +1,180 @@
+import os
+import uuid
+import asyncio
+import zipfile
+
+from services.pipeline_orchestrator import determine_pipeline, PipelineType, analyze_structural, analyze_visual, analyze_cryptographic
+from services.document_context import DocumentContext
+from services.upload_stream import stream_upload_to_disk, copy_stream_to_disk, UploadRejected, MAX_UPLOAD_BYTES
+from services.batching import VisualBatch
+from services.analysis_profiles import get_profile
+from services.cancellation import CancellationToken, AnalysisCancelled, use_token, ANALYSIS_DEADLINE_SECONDS
+
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "500"))
+# Total bytes staged for one batch, across plain files and decompressed zip members
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Documents of one batch analyzed concurrently (their visual passes are batched together)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+ZIP_SIGNATURE = b"PK\x03\x04"
+
+
+def discard_staged(documents: list):
+    """Removes the files of documents staged by a batch that is then refused."""
+    for doc in documents:
+        path = doc.get("path")
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Could not remove staged upload {path}: {e}")
+
+
+def batch_limit_error() -> UploadRejected:
+    return UploadRejected(413, f"Batch exceeds {BATCH_MAX_DOCUMENTS} documents")
+
+
+def batch_size_error() -> UploadRejected:
+    return UploadRejected(413, f"Batch exceeds the {BATCH_MAX_BYTES} byte limit")
+
+
+def staged_bytes(documents: list) -> int:
+    return sum(doc.get("size", 0) for doc in documents)
+
+
+def _member_limit(max_bytes: int, remaining_bytes: int):
+    """Per-file cap for the next document -> (limit, True when the batch budget is what binds)."""
+    if remaining_bytes < max_bytes:
+        return max(0, remaining_bytes), True
+    return max_bytes, False
+
+
+def extract_zip_documents(fileobj, upload_dir: str, max_bytes: int = MAX_UPLOAD_BYTES,
+                          max_documents: int = BATCH_MAX_DOCUMENTS, max_total_bytes: int = BATCH_MAX_BYTES) -> list:
+    """
+    Streams every member of a zip archive into the uploads directory.
+    Size limits are enforced on the decompressed bytes, not the declared sizes.
+    Members that cannot be accepted come back with an "error" entry.
+    The document and total-size limits are checked while members are written:
+    an archive over either raises 413 without writing the rest, and the
+    members already written are removed.
+    """
+    documents = []
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                base = os.path.basename(name)
+                if info.is_dir() or name.startswith("__MACOSX/") or not base or base.startswith("."):
+                    continue
+                if len(documents) >= max_documents:
+                    raise batch_limit_error()
+
+                task_id = str(uuid.uuid4())
+                limit, batch_bound = _member_limit(max_bytes, max_total_bytes - staged_bytes(documents))
+                try:
+                    with archive.open(info) as member:
+                        stored = copy_stream_to_disk(member, upload_dir, task_id, limit)
+                    documents.append({"task_id": task_id, "original_filename": name, **stored})
+                except UploadRejected as e:
+                    if e.status_code == 413 and batch_bound:
+                        raise batch_size_error()
+                    documents.append({"task_id": task_id, "original_filename": name, "error": str(e)})
+    except BaseException:
+        discard_staged(documents)
+        raise
+    return documents
+
+
+async def stage_batch_uploads(files, upload_dir: str) -> list:
+    """
+    Writes a multi-file upload to disk. Zip archives are expanded into their members.
+    Returns one dict per document (same fields as the task registry).
+    A refused batch (too many documents or bytes, broken archive, client gone)
+    leaves no staged file behind.
+    """
+    loop = asyncio.get_running_loop()
+    documents = []
+
+    try:
+        for upload in files:
+            head = await upload.read(len(ZIP_SIGNATURE))
+            await upload.seek(0)
+
+            if head == ZIP_SIGNATURE:
+                remaining = BATCH_MAX_DOCUMENTS - len(documents)
+                remaining_bytes = BATCH_MAX_BYTES - staged_bytes(documents)
+                documents.extend(await loop.run_in_executor(
+                    None, extract_zip_documents, upload.file, upload_dir, MAX_UPLOAD_BYTES, remaining, remaining_bytes
+                ))
+                continue
+
+            if len(documents) >= BATCH_MAX_DOCUMENTS:
+                raise batch_limit_error()
+            task_id = str(uuid.uuid4())
+            limit, batch_bound = _member_limit(MAX_UPLOAD_BYTES, BATCH_MAX_BYTES - staged_bytes(documents))
+            try:
+                stored = await stream_upload_to_disk(upload, upload_dir, task_id, limit)
+                documents.append({"task_id": task_id, "original_filename": upload.filename, **stored})
+            except UploadRejected as e:
+                if e.status_code == 413 and batch_bound:
+                    raise batch_size_error()
+                documents.append({"task_id": task_id, "original_filename": upload.filename, "error": str(e)})
+    except BaseException:
+        # Nothing is registered yet, so nothing else would ever remove these files
+        discard_staged(documents)
+        raise
+
+    return documents
+
+
+async def run_batch_analysis(documents: list, emit, concurrency: int = BATCH_CONCURRENCY, token: CancellationToken = None):
+    """
+    Routes every document through determine_pipeline and the matching
+    analyze_* pipeline, with the document's analysis profile ("profile" field).
+    emit(result) is awaited as each document finishes, in completion order.
+    Each document gets its own deadline; cancelling `token` stops them all.
+    """
+    loop = asyncio.get_running_loop()
+    batch = VisualBatch()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(index, doc):
+        result = {
+            "index": index,
+            "task_id": doc["task_id"],
+            "filename": doc.get("filename"),
+            "original_filename": doc.get("original_filename"),
+        }
+        if doc.get("error"):
+            await emit({**result, "status": "error", "error": doc["error"]})
+            return
+
+        profile = get_profile(doc.get("profile"))
+        async with semaphore:
+            # One parse of the document shared by routing and the pipeline
+            document = DocumentContext(doc["path"], doc["content_type"])
+            # The deadline starts when the document gets a slot, not when the batch was accepted
+            doc_token = CancellationToken(ANALYSIS_DEADLINE_SECONDS, parent=token)
+            try:
+                with use_token(doc_token):
+                    doc_token.raise_if_cancelled()
+                    pipeline_type = await loop.run_in_executor(None, determine_pipeline, doc["path"], doc["content_type"], document)
+                    if pipeline_type == PipelineType.VISUAL:
+                        report = await analyze_visual(doc["path"], batch=batch, profile=profile)
+                    elif pipeline_type == PipelineType.CRYPTOGRAPHIC:
+                        report = await analyze_cryptographic(doc["path"], document=document)
+                    else:
+                        report = await analyze_structural(doc["path"], batch=batch, document=document, profile=profile)
+                report["analysis_profile"] = profile["name"]
+                result.update({"status": "complete", "pipeline_used": pipeline_type.value, "report": report})
+            except AnalysisCancelled as e:
+                result.update({"status": "cancelled", "error": str(e), "reason": e.reason})
+            except Exception as e:
+                result.update({"status": "error", "error": str(e)})
+            finally:
+                document.close()
+
+        await emit(result)
+
+    await asyncio.gather(*(run_one(i, doc) for i, doc in enumerate(documents)))
@@ -0,0 +1,104 @@
+import os
+import asyncio
+
+from components.segformer.inference import preprocess_image, forward_logits_batch, postprocess_logits, inference_failure
+from components.trufor.engine import TruForEngine
+from services.cancellation import checkpoint
+
+# Forward-pass batching for multi-document jobs
+SEGFORMER_MAX_BATCH = int(os.getenv("SEGFORMER_MAX_BATCH", "8"))
+TRUFOR_MAX_BATCH = int(os.getenv("TRUFOR_MAX_BATCH", "4"))
+BATCH_MAX_WAIT_SECONDS = float(os.getenv("BATCH_MAX_WAIT_SECONDS", "0.05"))
+
+
+class MicroBatcher:
+    """
+    Collects single items submitted by concurrent coroutines and runs them
+    through batch_fn(items) -> results in one executor call.
+    A batch is flushed when max_batch items are pending or max_wait has passed.
+    """
+
+    def __init__(self, batch_fn, max_batch: int, max_wait: float = BATCH_MAX_WAIT_SECONDS):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        # Running batches; the event loop itself only keeps weak references to tasks
+        self._tasks = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.create_task(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self.batch_fn, [item for item, _ in pending])
+            for (_, future), result in zip(pending, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            # Submitters must not wait forever on a batch that will never finish
+            for _, future in pending:
+                if not future.done():
+                    future.cancel()
+            raise
+
+
+class VisualBatch:
+    """
+    Shared SegFormer / TruFor batchers for one multi-document job.
+    Passed to analyze_visual(batch=...) so images from different documents
+    share forward passes instead of running one image at a time.
+    """
+
+    def __init__(self):
+        self.segformer = MicroBatcher(forward_logits_batch, SEGFORMER_MAX_BATCH)
+        self.trufor = MicroBatcher(lambda prepared: TruForEngine().analyze_batch(prepared), TRUFOR_MAX_BATCH)
+
+    async def run_tamper_detection(self, image) -> dict:
+        """`image`: file path or services.decoded_image.DecodedImage."""
+        loop = asyncio.get_running_loop()
+        try:
+            input_tensor, original_size = await loop.run_in_executor(None, preprocess_image, image)
+            # A cancelled document leaves the batch before its forward pass
+            checkpoint()
+            logits = await self.segformer.submit(input_tensor)
+            checkpoint()
+            return await loop.run_in_executor(None, postprocess_logits, logits, original_size)
+        except Exception as e:
+            return inference_failure(e)
+
+    async def run_trufor(self, image, max_side: int = None) -> dict:
+        loop = asyncio.get_running_loop()
+        engine = TruForEngine()
+        if not engine.is_ready():
+            return engine.analyze(image)
+        # Full-resolution tensors only share a pass with same-shaped ones (see analyze_batch)
+        prepared = await loop.run_in_executor(None, engine.prepare, image, max_side)
+        checkpoint()
+        result = await self.trufor.submit(prepared)
+        checkpoint()
+        return result
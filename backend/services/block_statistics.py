@@ -0,0 +1,171 @@
+import os
+
+import cv2
+import numpy as np
+
+BLOCK_STATS_SIZE = int(os.getenv("BLOCK_STATS_SIZE", "32"))
+# Outlier blocks reported per detector (strongest first)
+BLOCK_STATS_TOP_K = int(os.getenv("BLOCK_STATS_TOP_K", "8"))
+
+# Blocks whose mean detail (DecodedImage.detail) is below this are blank paper / flat fills:
+# their residual says nothing. Paper grain on scans reaches ~1; counting it lets the
+# near-zero residual of blank paper set the median and every text block stand out.
+# Thresholds here were calibrated on clean text / letterhead / logo pages (JPEG 75-95, PNG)
+FLAT_BLOCK_DETAIL = 2.0
+# Residuals grow with local detail (text edges, photos); each block's residual is divided
+# by its mean detail plus this floor so detailed and plain regions stay comparable
+DETAIL_FLOOR = 1.0
+# Robust z-score above which a block counts as an outlier
+OUTLIER_Z = 3.5
+# ...and only when its residual differs from the median block by at least
+# max(MIN_RESIDUAL_DELTA, RELATIVE_RESIDUAL_DELTA * median) gray levels
+MIN_RESIDUAL_DELTA = 0.15
+RELATIVE_RESIDUAL_DELTA = 0.2
+# A pasted region spans several blocks; the score follows the n-th strongest block,
+# so one odd block (a logo, a stain) does not move it
+MIN_OUTLIER_BLOCKS = 4
+# Below this many usable blocks the statistics are not meaningful
+MIN_VALID_BLOCKS = 16
+
+
+def block_mean_var(values: np.ndarray, block: int = BLOCK_STATS_SIZE, stride: int = None):
+    """
+    Per-block mean and variance of a single-channel array, from its integral
+    images (cv2.integral2 builds the sum and squared-sum tables in one pass).
+    Every block is then four lookups per table, gathered with vectorized
+    indexing: the cost is linear in pixels and does not depend on how many
+    blocks there are (stride < block gives overlapping blocks for free).
+    Returns (mean_map, var_map, ys, xs): (rows, cols) maps and the block origins.
+    Partial blocks at the right / bottom edge are not included.
+    """
+    h, w = values.shape[:2]
+    stride = stride or block
+    if h < block or w < block:
+        empty = np.zeros((0, 0), dtype=np.float32)
+        return empty, empty, np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    sums, sq_sums = cv2.integral2(values, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+    ys = np.arange(0, h - block + 1, stride)
+    xs = np.arange(0, w - block + 1, stride)
+    y0, y1 = ys[:, None], ys[:, None] + block
+    x0, x1 = xs[None, :], xs[None, :] + block
+
+    def box(table):
+        return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+    n = float(block * block)
+    mean = box(sums) / n
+    var = np.maximum(box(sq_sums) / n - mean * mean, 0.0)
+    return mean.astype(np.float32), var.astype(np.float32), ys, xs
+
+
+def _block_z(residual: np.ndarray, detail: np.ndarray, block: int):
+    """
+    One-sided robust z-score of every block's residual against the usable blocks.
+    Returns (z, mean, var, valid); z is 0 for flat blocks, for blocks whose
+    residual is not MIN_RESIDUAL_DELTA above the median, and for blocks below it.
+    """
+    mean, var, _, _ = block_mean_var(residual, block)
+    metric = mean
+    valid = np.ones_like(mean, dtype=bool)
+    if detail is not None:
+        detail_mean, _, _, _ = block_mean_var(detail, block)
+        valid = detail_mean >= FLAT_BLOCK_DETAIL
+        metric = mean / (detail_mean + DETAIL_FLOOR)
+    z = np.zeros_like(mean, dtype=np.float64)
+    if valid.sum() < MIN_VALID_BLOCKS:
+        return z, mean, var, valid
+
+    sample = metric[valid]
+    median = float(np.median(sample))
+    mad = float(np.median(np.abs(sample - median))) * 1.4826
+    # Near-uniform residuals give a tiny MAD; keep z from exploding on noise-level differences
+    scale = max(mad, 0.05 * abs(median), 1e-3)
+    median_residual = float(np.median(mean[valid]))
+    min_delta = max(MIN_RESIDUAL_DELTA, RELATIVE_RESIDUAL_DELTA * median_residual)
+    # Only residual above the rest counts: a block that changes less than the page
+    # (a flat fill, a clean edge) is not a sign of editing
+    counted = valid & (mean - median_residual >= min_delta)
+    z = np.where(counted, np.maximum((metric - median) / scale, 0.0), 0.0)
+    return z, mean, var, valid
+
+
+def block_inconsistency(residual: np.ndarray, detail: np.ndarray = None,
+                        block: int = BLOCK_STATS_SIZE, top_k: int = BLOCK_STATS_TOP_K,
+                        chroma: tuple = None) -> dict:
+    """
+    Finds blocks whose residual (ELA difference, noise map) is higher than
+    the rest of the image.
+    1. Block mean / variance of the residual, and block mean of `detail`
+       (DecodedImage.detail) when given: flat blocks are skipped and each
+       residual is normalized by the block's detail.
+    2. One-sided robust z-score of every block against the median / MAD of all
+       usable blocks; blocks less than MIN_RESIDUAL_DELTA above the median residual never count.
+    3. `chroma` = (chroma residual, chroma detail) scores the colour channels on
+       their own. Saturated colour edges (logos, coloured headers) leak residual
+       into luma, so luma is then normalized by luma + chroma detail; each block
+       keeps the stronger of its two z-scores.
+    4. inconsistency_score in [0, 1]: 0 until MIN_OUTLIER_BLOCKS blocks pass
+       OUTLIER_Z, approaching 1 as they move further beyond it.
+    Returns the score, the outlier count and the top_k outlier blocks with pixel coordinates.
+    """
+    h, w = residual.shape[:2]
+    rows, cols = (h // block, w // block) if h >= block and w >= block else (0, 0)
+    ys, xs = np.arange(rows) * block, np.arange(cols) * block
+    summary = {
+        "block_size": block,
+        "grid": [int(rows), int(cols)],
+        "valid_blocks": 0,
+        "outlier_blocks": 0,
+        "inconsistency_score": 0.0,
+        "top_blocks": [],
+    }
+    if rows == 0:
+        return summary
+
+    channels = []
+    if chroma is None:
+        channels.append(("luma", residual, detail))
+    else:
+        chroma_residual, chroma_detail = chroma
+        luma_detail = chroma_detail if detail is None else cv2.add(detail, chroma_detail)
+        channels.append(("luma", residual, luma_detail))
+        channels.append(("chroma", chroma_residual, chroma_detail))
+
+    scored = [(name,) + _block_z(values, channel_detail, block) for name, values, channel_detail in channels]
+    summary["valid_blocks"] = int(np.logical_or.reduce([s[4] for s in scored]).sum())
+    if summary["valid_blocks"] < MIN_VALID_BLOCKS:
+        return summary
+
+    z_maps = np.stack([s[1] for s in scored])
+    best = np.argmax(z_maps, axis=0)
+    z = np.take_along_axis(z_maps, best[None], axis=0)[0]
+    strength = z.ravel()
+
+    summary["outlier_blocks"] = int((strength > OUTLIER_Z).sum())
+    if strength.size >= MIN_OUTLIER_BLOCKS:
+        nth = float(np.partition(strength, -MIN_OUTLIER_BLOCKS)[-MIN_OUTLIER_BLOCKS])
+        summary["inconsistency_score"] = round(1.0 - float(np.exp(-max(nth - OUTLIER_Z, 0.0) / OUTLIER_Z)), 4)
+
+    k = min(max(1, top_k), strength.size)
+    top = np.argpartition(strength, -k)[-k:]
+    top = top[np.argsort(strength[top])[::-1]]
+    blocks = []
+    for r, c in (divmod(int(i), cols) for i in top):
+        if z[r, c] <= OUTLIER_Z:
+            continue
+        name, _, mean, var, _ = scored[best[r, c]]
+        entry = {
+            "x": int(xs[c]),
+            "y": int(ys[r]),
+            "width": block,
+            "height": block,
+            "mean": round(float(mean[r, c]), 3),
+            "std": round(float(np.sqrt(var[r, c])), 3),
+            "z": round(float(z[r, c]), 2),
+        }
+        if chroma is not None:
+            entry["channel"] = name
+        blocks.append(entry)
+    summary["top_blocks"] = blocks
+    return summary
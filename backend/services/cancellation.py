@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Wall-clock budget of one analysis, from session start (queue wait included)
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "600"))
+
+# Token of the analysis running in this context; copied into gathered tasks and queue jobs
+_current_token = contextvars.ContextVar("veridoc_cancellation_token", default=None)
+
+
+class AnalysisCancelled(BaseException):
+    """
+    Raised at a checkpoint once the task's token is cancelled or past its deadline.
+    A BaseException (like asyncio.CancelledError), so the detectors' broad
+    `except Exception` fallbacks let it through instead of reporting a detector error.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(f"Analysis cancelled ({reason})")
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Thread-safe cancel flag with an optional deadline. Checked cooperatively:
+    async stages, executor jobs and model wrappers call checkpoint() between
+    steps; nothing is interrupted mid-operation.
+    """
+
+    def __init__(self, deadline_seconds: float = None, parent=None):
+        self._event = threading.Event()
+        self.reason = None
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds and deadline_seconds > 0 else None
+        # e.g. one document of a batch: cancelled with the whole batch
+        self.parent = parent
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set():
+            if self.parent is not None and self.parent.cancelled:
+                self.cancel(self.parent.reason)
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel("deadline_exceeded")
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise AnalysisCancelled(self.reason)
+
+
+def current_token():
+    return _current_token.get()
+
+
+@contextmanager
+def use_token(token: CancellationToken):
+    """Makes `token` the current one for the enclosed block (and tasks / jobs it starts)."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def checkpoint():
+    """Raises AnalysisCancelled if the current analysis was cancelled. No-op outside one."""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def run_in_executor(loop, fn, *args):
+    """
+    loop.run_in_executor(None, fn, *args) that carries the current token into
+    the worker thread (plain run_in_executor does not copy context variables),
+    so checkpoint() inside fn sees it. Checks once before queueing the job.
+    """
+    checkpoint()
+    return loop.run_in_executor(None, contextvars.copy_context().run, fn, *args)
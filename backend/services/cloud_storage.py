@@ -0,0 +1,233 @@
+import os
+import time
+import fcntl
+import shutil
+import asyncio
+import threading
+from collections import OrderedDict
+
+# Storage Configuration
+# "gcs" (default) or "local" (no network; for benchmarks, CI and air-gapped runs)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs").lower()
+GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "veridoc-uploads")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "storage")
+# Local objects no upload links to any more are removed once they were last stored this long ago
+# (longer than an analysis takes from upload to the reasoning call)
+LOCAL_STORAGE_TTL_SECONDS = int(os.getenv("LOCAL_STORAGE_TTL_SECONDS", "3600"))
+
+# Objects this process uploaded or found are not checked again for this long
+# (keep it below the bucket's lifecycle age)
+KNOWN_BLOB_TTL_SECONDS = int(os.getenv("KNOWN_BLOB_TTL_SECONDS", "3600"))
+# ...and at most this many are remembered (least recently confirmed dropped first)
+KNOWN_BLOBS_MAX_ENTRIES = int(os.getenv("KNOWN_BLOBS_MAX_ENTRIES", "10000"))
+
+# Linux ioctl that clones file extents (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+_client = None
+_client_lock = threading.Lock()
+# blob name -> when it was last known to exist in the bucket (least recently used first)
+_known_blobs = OrderedDict()
+_known_blobs_lock = threading.Lock()
+
+
+def get_storage_client():
+    """One storage.Client per process; it pools its HTTP connections internally."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google.cloud import storage
+                _client = storage.Client()
+    return _client
+
+
+def _remember_blob(name: str):
+    with _known_blobs_lock:
+        _known_blobs[name] = time.time()
+        _known_blobs.move_to_end(name)
+        while len(_known_blobs) > KNOWN_BLOBS_MAX_ENTRIES:
+            _known_blobs.popitem(last=False)
+
+
+def content_addressed_blob_name(content_hash: str, filename: str) -> str:
+    """Objects are named by content hash, so identical documents share one object."""
+    ext = os.path.splitext(filename)[1].lower()
+    return f"documents/{content_hash}{ext}"
+
+
+def upload_to_gcs(source_file_name, destination_blob_name):
+    """
+    Uploads a file to the bucket unless an object with that name already exists.
+    Returns the gs:// URI, or None on failure.
+    """
+    uri = f"gs://{GCS_BUCKET_NAME}/{destination_blob_name}"
+    # Content-addressed names: a duplicate document needs neither an upload nor an exists() call
+    with _known_blobs_lock:
+        known_at = _known_blobs.get(destination_blob_name)
+        if known_at is not None:
+            # Recently used names stay; the TTL still counts from the last confirmation
+            _known_blobs.move_to_end(destination_blob_name)
+    if known_at is not None and time.time() - known_at < KNOWN_BLOB_TTL_SECONDS:
+        return uri
+
+    try:
+        bucket = get_storage_client().bucket(GCS_BUCKET_NAME)
+        blob = bucket.blob(destination_blob_name)
+
+        # An existing object already holds these bytes
+        if blob.exists():
+            _remember_blob(destination_blob_name)
+            return uri
+
+        from google.api_core.exceptions import PreconditionFailed
+        try:
+            # if_generation_match=0 -> only create; a concurrent upload of the same document wins the race
+            blob.upload_from_filename(source_file_name, if_generation_match=0)
+        except PreconditionFailed:
+            pass
+
+        _remember_blob(destination_blob_name)
+        return uri
+    except Exception as e:
+        print(f"GCS Upload Failed: {e}")
+        return None
+
+
+def link_or_clone(source_file_name, destination_path):
+    """
+    Places the bytes of source at destination without copying them when possible:
+    hard link first, then a reflink clone, plain copy only as a last resort.
+    """
+    try:
+        os.link(source_file_name, destination_path)
+        return "link"
+    except OSError:
+        pass
+
+    try:
+        with open(source_file_name, "rb") as src, open(destination_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return "reflink"
+    except OSError:
+        pass
+
+    shutil.copyfile(source_file_name, destination_path)
+    return "copy"
+
+
+class GCSStorage:
+    """Documents live in the configured bucket; Gemini reads them via gs:// URIs."""
+
+    scheme = "gs"
+
+    def put(self, source_file_name, destination_blob_name):
+        return upload_to_gcs(source_file_name, destination_blob_name)
+
+    def purge_expired(self, now: float = None) -> int:
+        # Object lifetime is the bucket's lifecycle policy
+        return 0
+
+
+class LocalStorage:
+    """
+    Documents live under a local directory and are referenced by file:// URIs.
+    Objects are hard-linked (or reflinked) from uploads/, so storing costs no
+    byte copies and survives the sweeper removing the upload.
+    purge_expired() (run by the artifact sweeper) removes objects that no
+    upload links to any more and that were last stored more than ttl_seconds ago.
+    """
+
+    scheme = "file"
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, ttl_seconds: int = LOCAL_STORAGE_TTL_SECONDS):
+        self.root = os.path.abspath(root)
+        self.ttl_seconds = ttl_seconds
+
+    def put(self, source_file_name, destination_blob_name):
+        try:
+            destination_path = os.path.join(self.root, destination_blob_name)
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            # Content-addressed names: an existing object already holds these bytes
+            if not os.path.exists(destination_path):
+                tmp_path = f"{destination_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                link_or_clone(source_file_name, tmp_path)
+                os.replace(tmp_path, destination_path)
+            else:
+                # Stored again: restart its retention
+                os.utime(destination_path)
+            return f"file://{destination_path}"
+        except Exception as e:
+            print(f"Local Storage Failed: {e}")
+            return None
+
+    def purge_expired(self, now: float = None) -> int:
+        """
+        Removes objects whose bytes no upload holds any more (link count 1: the
+        sweeper removed the upload, or the object is a copy) and that were last
+        stored more than ttl_seconds ago. Returns the number of files removed.
+        """
+        now = now or time.time()
+        removed = 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                    if st.st_nlink > 1 or st.st_mtime > now - self.ttl_seconds:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Local storage purge warning for {path}: {e}")
+        return removed
+
+
+_backend = None
+
+
+def get_storage_backend():
+    """Backend selected by STORAGE_BACKEND (created once per process)."""
+    global _backend
+    if _backend is None:
+        with _client_lock:
+            if _backend is None:
+                _backend = LocalStorage() if STORAGE_BACKEND == "local" else GCSStorage()
+    return _backend
+
+
+def store_document(source_file_name, destination_name):
+    """Stores a document in the active backend. Returns its URI, or None on failure."""
+    return get_storage_backend().put(source_file_name, destination_name)
+
+
+class BackgroundUploads:
+    """
+    Starts the cloud upload as soon as a file lands, so it overlaps with the
+    local pipelines. The reasoning stage awaits the URI only when it needs it.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def start(self, task_id: str, source_file_name: str, destination_blob_name: str):
+        if task_id in self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        self._pending[task_id] = loop.run_in_executor(None, store_document, source_file_name, destination_blob_name)
+
+    async def result(self, task_id: str, source_file_name: str, destination_blob_name: str):
+        """
+        Awaits the background upload for this task. Starts it now if it was never
+        started here (e.g. the upload request was served by another worker).
+        """
+        self.start(task_id, source_file_name, destination_blob_name)
+        try:
+            return await self._pending[task_id]
+        finally:
+            self._pending.pop(task_id, None)
+
+    def discard(self, task_id: str):
+        self._pending.pop(task_id, None)
@@ -0,0 +1,152 @@
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+EXIF_ORIENTATION = 0x0112
+
+
+def _read_only(arr: np.ndarray) -> np.ndarray:
+    arr.flags.writeable = False
+    return arr
+
+
+def _gradient_magnitude(channel: np.ndarray) -> np.ndarray:
+    # sigma 1 keeps edges and texture but not pixel-level noise
+    smooth = cv2.GaussianBlur(channel.astype(np.float32), (0, 0), 1.0)
+    return cv2.magnitude(cv2.Sobel(smooth, cv2.CV_32F, 1, 0), cv2.Sobel(smooth, cv2.CV_32F, 0, 1))
+
+
+class DecodedImage:
+    """
+    One per analyzed image: the file is decoded once and every visual detector
+    reads the views it needs from here instead of decoding it again.
+
+    All views are computed lazily on first access, cached, and read-only:
+    - rgb:                 uint8 (H, W, 3) RGB array, pixels as stored (SegFormer, TruFor)
+    - bgr:                 BGR array as cv2.imread returns it (ELA)
+    - gray:                uint8 (H, W) luma as cv2.imread(IMREAD_GRAYSCALE) returns it (noise, quantization)
+    - detail:              float32 (H, W) gradient magnitude of the lightly blurred luma
+                           (block statistics compare residuals against it)
+    - chroma_detail:       float32 (H, W) the same for Cr plus Cb (ELA colour edges)
+    - downscaled(max_side): PIL thumbnail of rgb no larger than max_side (TruFor)
+
+    Every detector sees the pixels it saw when it decoded the file itself:
+    the models read them as stored, without EXIF orientation (Pillow), while
+    cv2.imread applies the orientation. The file is decoded once, ignoring the
+    orientation; only a file that carries an orientation tag is decoded a
+    second time, by OpenCV, for the OpenCV detectors. Likewise gray is derived
+    from bgr for JPEG (identical to OpenCV's grayscale decode) and decoded
+    directly for other formats, whose decoders round differently.
+    Formats OpenCV cannot read fall back to Pillow.
+    A file that cannot be decoded raises ValueError from the first view accessed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._cache = {}
+
+    @classmethod
+    def of(cls, image):
+        """Accepts a DecodedImage or a path (detectors can still be called with a file)."""
+        return image if isinstance(image, cls) else cls(image)
+
+    def close(self):
+        """Drops every view (the pipeline calls this once all detectors have finished)."""
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    def _decode(self) -> np.ndarray:
+        # Stored pixel order, like Image.open(path).convert("RGB")
+        bgr = cv2.imread(self.path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if bgr is not None:
+            # In place: no second full-size buffer
+            return _read_only(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr))
+        try:
+            with Image.open(self.path) as img:
+                return _read_only(np.array(img.convert("RGB")))
+        except Exception:
+            raise ValueError("Could not read image")
+
+    def _has_orientation(self) -> bool:
+        """True when the file carries an EXIF orientation other than "normal" (header read only)."""
+        try:
+            with Image.open(self.path) as img:
+                return img.getexif().get(EXIF_ORIENTATION, 1) not in (0, 1)
+        except Exception:
+            return False
+
+    def _decode_bgr(self) -> np.ndarray:
+        if self._has_orientation():
+            # OpenCV's own orientation handling (it differs between formats)
+            oriented = cv2.imread(self.path, cv2.IMREAD_COLOR)
+            if oriented is not None:
+                return _read_only(oriented)
+        return _read_only(cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR))
+
+    # --- Views ---
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return self._cached("rgb", self._decode)
+
+    @property
+    def bgr(self) -> np.ndarray:
+        return self._cached("bgr", self._decode_bgr)
+
+    def _decode_gray(self) -> np.ndarray:
+        if not self._is_jpeg():
+            gray = cv2.imread(self.path, cv2.IMREAD_GRAYSCALE)
+            if gray is not None:
+                return _read_only(gray)
+        return _read_only(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    def _is_jpeg(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                return f.read(3) == b"\xff\xd8\xff"
+        except OSError:
+            return False
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self._cached("gray", self._decode_gray)
+
+    @property
+    def detail(self) -> np.ndarray:
+        return self._cached("detail", lambda: _read_only(_gradient_magnitude(self.gray)))
+
+    @property
+    def chroma_detail(self) -> np.ndarray:
+        """Gradient magnitude of Cr plus Cb: colour edges that luma detail underrates."""
+        def compute():
+            ycrcb = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2YCrCb)
+            return _read_only(cv2.add(_gradient_magnitude(ycrcb[..., 1]), _gradient_magnitude(ycrcb[..., 2])))
+        return self._cached("chroma_detail", compute)
+
+    @property
+    def size(self) -> tuple:
+        """(width, height), the PIL convention the model wrappers use."""
+        h, w = self.rgb.shape[:2]
+        return (w, h)
+
+    def downscaled(self, max_side: int) -> np.ndarray:
+        """RGB view no larger than max_side on its longest side (the full array when already small enough)."""
+        w, h = self.size
+        if not max_side or max(w, h) <= max_side:
+            return self.rgb
+
+        def resize():
+            # Same resampling as TruFor's own Image.thumbnail
+            img = Image.fromarray(self.rgb)
+            img.thumbnail((max_side, max_side))
+            return _read_only(np.asarray(img))
+        return self._cached(("downscaled", max_side), resize)
@@ -0,0 +1,164 @@
+import io
+import os
+import mmap
+import threading
+
+from pypdf import PdfReader
+from pyhanko.pdf_utils.reader import PdfFileReader
+
+
+class _MappedStream(io.RawIOBase):
+    """Read-only cursor over a shared mapping: each parser keeps its own position."""
+
+    def __init__(self, mapping):
+        super().__init__()
+        self._map = mapping
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._map)
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self._map) - self._pos))
+        if n:
+            buffer[:n] = self._map[self._pos:self._pos + n]
+            self._pos += n
+        return n
+
+
+class DocumentContext:
+    """
+    One per task: the file is opened and memory-mapped once, and every stage
+    reads the parsed views from here instead of re-opening and re-parsing the PDF.
+
+    All views are computed lazily on first access and cached:
+    - raw:               read-only mmap of the file (no copy into Python memory)
+    - xref_info:         %%EOF / xref / startxref counts from the raw bytes
+    - trailer:           the pypdf trailer dictionary
+    - pypdf_reader:      pypdf.PdfReader
+    - pyhanko_reader:    pyhanko PdfFileReader (signature inspection)
+    - embedded_images(): pypdf image objects of every page, in page order
+
+    The parsers read the same mapping through their own cursors, so their
+    seek positions never clash and neither opens the file again.
+    text_layer holds the per-page text once a consumer has asked for it
+    (services.text_layer extracts it in a process pool).
+    """
+
+    def __init__(self, path: str, content_type: str = None):
+        self.path = path
+        self.content_type = content_type
+        self._lock = threading.RLock()
+        self._handles = []
+        self._cache = {}
+        self.text_layer = None
+
+    # --- Lifecycle ---
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
+            for handle in reversed(self._handles):
+                try:
+                    handle.close()
+                except BufferError:
+                    # A view of the mapping is still exported somewhere; the GC releases it
+                    pass
+            self._handles = []
+
+    def _open_map(self):
+        with self._lock:
+            stream = open(self.path, "rb")
+            self._handles.append(stream)
+            if os.fstat(stream.fileno()).st_size == 0:
+                return b""
+            m = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            self._handles.append(m)
+            return m
+
+    def _open_stream(self):
+        """
+        A parser-private, buffered cursor over the mapping. pyHanko re-reads
+        signed byte ranges during validation, so each parser keeps its own position.
+        """
+        with self._lock:
+            stream = io.BufferedReader(_MappedStream(self.raw))
+            self._handles.append(stream)
+            return stream
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    # --- Views ---
+
+    @property
+    def raw(self):
+        return self._cached("raw", self._open_map)
+
+    def count(self, token: bytes) -> int:
+        """Occurrences of token in the raw bytes (mmap has no count())."""
+        raw = self.raw
+        n, pos = 0, raw.find(token)
+        while pos != -1:
+            n += 1
+            pos = raw.find(token, pos + len(token))
+        return n
+
+    @property
+    def xref_info(self) -> dict:
+        return self._cached("xref_info", lambda: {
+            "eof_markers": self.count(b"%%EOF"),
+            # xref keyword often appears once per section; multiple sections imply updates
+            "xref_keywords": self.count(b"xref"),
+            "startxref_offsets": self.count(b"startxref"),
+        })
+
+    @property
+    def pypdf_reader(self) -> PdfReader:
+        return self._cached("pypdf_reader", lambda: PdfReader(self._open_stream()))
+
+    @property
+    def trailer(self):
+        return self.pypdf_reader.trailer
+
+    @property
+    def pyhanko_reader(self) -> PdfFileReader:
+        return self._cached("pyhanko_reader", lambda: PdfFileReader(self._open_stream()))
+
+    @property
+    def embedded_signatures(self) -> list:
+        return self._cached("embedded_signatures", lambda: list(self.pyhanko_reader.embedded_signatures))
+
+    def embedded_images(self) -> list:
+        def collect():
+            images = []
+            for page in self.pypdf_reader.pages:
+                for img in page.images:
+                    images.append(img)
+            return images
+        return self._cached("embedded_images", collect)
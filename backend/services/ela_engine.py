@@ -0,0 +1,165 @@
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from services.cancellation import checkpoint
+
+# JPEG ghost sweep: re-compress at every quality in [MIN, MAX] (step STEP) and record the residual
+ELA_SWEEP_MIN_QUALITY = int(os.getenv("ELA_SWEEP_MIN_QUALITY", "60"))
+ELA_SWEEP_MAX_QUALITY = int(os.getenv("ELA_SWEEP_MAX_QUALITY", "98"))
+ELA_SWEEP_STEP = int(os.getenv("ELA_SWEEP_STEP", "1"))
+# Encoder threads for the sweep (cv2.imencode / imdecode release the GIL)
+ELA_SWEEP_WORKERS = int(os.getenv("ELA_SWEEP_WORKERS", str(min(4, os.cpu_count() or 1))))
+# The sweep reads a centered, JPEG-grid aligned crop of at most this many pixels (0 = whole image)
+ELA_SWEEP_MAX_PIXELS = int(os.getenv("ELA_SWEEP_MAX_PIXELS", "2000000"))
+
+# 4:2:0 chroma subsampling makes the JPEG grid 16x16 (MCU) in pixel coordinates
+JPEG_MCU_SIZE = 16
+
+# A local minimum of the mean residual curve counts as a ghost when it sits
+# at least this far (relative) below its lower neighbour
+GHOST_MIN_DIP = 0.15
+# A single save also leaves weaker dips above its quality (quantization table
+# harmonics); an earlier save shows up as a dip of at least this depth below it
+DOUBLE_COMPRESSION_MIN_DIP = 0.2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max(1, ELA_SWEEP_WORKERS), thread_name_prefix="ela-sweep")
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def sweep_qualities() -> list:
+    low = max(1, min(ELA_SWEEP_MIN_QUALITY, ELA_SWEEP_MAX_QUALITY))
+    high = min(100, max(ELA_SWEEP_MIN_QUALITY, ELA_SWEEP_MAX_QUALITY))
+    return list(range(low, high + 1, max(1, ELA_SWEEP_STEP)))
+
+
+def recompress(bgr: np.ndarray, quality: int) -> np.ndarray:
+    """JPEG round trip at `quality` entirely in memory (no temp file)."""
+    ok, encoded = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError(f"JPEG encoding at quality {quality} failed")
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+
+def error_level(bgr: np.ndarray, quality: int) -> np.ndarray:
+    """Per-channel absolute difference between the image and its re-compressed copy."""
+    return cv2.absdiff(bgr, recompress(bgr, quality))
+
+
+def luma_chroma_error(bgr: np.ndarray, recompressed: np.ndarray) -> tuple:
+    """
+    Error level split into YCrCb: (|dY|, |dCr| + |dCb|) as float32 maps.
+    Colour edges are re-quantized much harder than luma (chroma subsampling),
+    so the two are only comparable within their own channel.
+    """
+    diff = cv2.absdiff(cv2.cvtColor(bgr, cv2.COLOR_BGR2YCrCb).astype(np.float32),
+                       cv2.cvtColor(recompressed, cv2.COLOR_BGR2YCrCb).astype(np.float32))
+    return diff[..., 0].copy(), cv2.add(diff[..., 1], diff[..., 2])
+
+
+def grid_aligned_crop(bgr: np.ndarray, max_pixels: int) -> np.ndarray:
+    """
+    Centered crop of at most max_pixels whose origin stays on the JPEG MCU
+    grid (a shifted grid would hide the ghost). A view, not a copy.
+    """
+    h, w = bgr.shape[:2]
+    if not max_pixels or h * w <= max_pixels:
+        return bgr
+    mcu = JPEG_MCU_SIZE
+    scale = (max_pixels / float(h * w)) ** 0.5
+    ch = max(mcu, int(h * scale) // mcu * mcu)
+    cw = max(mcu, int(w * scale) // mcu * mcu)
+    y = (h - ch) // 2 // mcu * mcu
+    x = (w - cw) // 2 // mcu * mcu
+    return bgr[y:y + ch, x:x + cw]
+
+
+def _residual_stats(bgr: np.ndarray, quality: int) -> tuple:
+    checkpoint()
+    gray = cv2.cvtColor(error_level(bgr, quality), cv2.COLOR_BGR2GRAY)
+    _, max_val, _, _ = cv2.minMaxLoc(gray)
+    return float(cv2.mean(gray)[0]), float(max_val)
+
+
+def find_ghosts(qualities: list, mean_curve: list) -> list:
+    """
+    Local minima of the mean residual curve, deepest first.
+    Re-compressing at the quality an image was last saved with changes it
+    least, so that quality shows up as a dip ("JPEG ghost"); a second dip
+    points at an earlier compression (e.g. a spliced-in region).
+    """
+    ghosts = []
+    for i in range(len(mean_curve)):
+        value = mean_curve[i]
+        # The ends of the sweep only have one neighbour
+        neighbours = mean_curve[max(0, i - 1):i] + mean_curve[i + 1:i + 2]
+        if not neighbours:
+            continue
+        lower_neighbour = min(neighbours)
+        if value >= lower_neighbour:
+            continue
+        dip = (lower_neighbour - value) / (lower_neighbour + 1e-6)
+        if dip >= GHOST_MIN_DIP:
+            ghosts.append({"quality": qualities[i], "dip": round(dip, 3)})
+    return sorted(ghosts, key=lambda g: g["dip"], reverse=True)
+
+
+def jpeg_ghost_analysis(bgr: np.ndarray, max_pixels: int = None) -> dict:
+    """
+    Runs the quality sweep in parallel and returns the ghost curves:
+    - qualities / mean_residual / max_residual: one entry per swept quality
+    - ghosts: dips of the mean curve, deepest first
+    - best_quality: quality the image most likely was last saved with
+      (None: no dip, e.g. never JPEG-compressed)
+    - earlier_quality: quality of an earlier save, when one is visible
+    max_pixels None uses ELA_SWEEP_MAX_PIXELS; 0 sweeps the whole image.
+    """
+    if max_pixels is None:
+        max_pixels = ELA_SWEEP_MAX_PIXELS
+    region = np.ascontiguousarray(grid_aligned_crop(bgr, max_pixels))
+    qualities = sweep_qualities()
+
+    # Each job carries the analysis context, so a cancelled task stops mid-sweep
+    pool = _get_pool()
+    futures = [pool.submit(contextvars.copy_context().run, _residual_stats, region, q) for q in qualities]
+    try:
+        stats = [f.result() for f in futures]
+    finally:
+        for f in futures:
+            f.cancel()
+
+    mean_curve = [round(m, 4) for m, _ in stats]
+    ghosts = find_ghosts(qualities, mean_curve)
+    best_quality = ghosts[0]["quality"] if ghosts else None
+    earlier = sorted(g["quality"] for g in ghosts[1:] if g["quality"] < best_quality and g["dip"] >= DOUBLE_COMPRESSION_MIN_DIP)
+    return {
+        "qualities": qualities,
+        "mean_residual": mean_curve,
+        "max_residual": [mx for _, mx in stats],
+        "ghosts": ghosts,
+        "best_quality": best_quality,
+        # Ghost below best_quality: saved as JPEG at least twice (lowest such quality)
+        "earlier_quality": earlier[0] if earlier else None,
+        "analyzed_pixels": int(region.shape[0] * region.shape[1]),
+    }
@@ -0,0 +1,56 @@
+import os
+import json
+import asyncio
+from contextlib import aclosing
+
+# Comment line sent while no event is flowing (e.g. during a TruFor pass), so proxies keep the stream open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # nginx: pass events through as they are written instead of buffering the response
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: dict) -> str:
+    """
+    One Server-Sent Event. The session sequence number becomes the event id,
+    so a reconnecting EventSource resumes through its Last-Event-ID header.
+    """
+    lines = []
+    if event.get("seq") is not None:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_stream(events, keepalive_seconds: float = SSE_KEEPALIVE_SECONDS):
+    """
+    Re-emits an async iterator of session events as SSE text.
+    The source is read by a separate task so keep-alive comments can be sent
+    while it is idle; closing this generator (client gone) closes the source.
+    """
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async with aclosing(events) as source:
+                async for event in source:
+                    queue.put_nowait(event)
+        finally:
+            queue.put_nowait(None) # end of stream
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                break
+            yield format_sse(event)
+    finally:
+        pump_task.cancel()
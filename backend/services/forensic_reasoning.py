@@ -1,7 +1,11 @@
 import vertexai
+import asyncio
+import random
 from datetime import datetime
 
 from vertexai.generative_models import GenerativeModel, Part
+from services.metrics import DETECTOR_SECONDS
+from services.artifact_writer import is_artifact_ref
 import json
 import os
 from dotenv import load_dotenv
@@ -19,121 +23,183 @@ try:
 except Exception as e:
     print(f"Warning: vertexai.init failed (likely due to placeholder PROJECT_ID): {e}")
 
-def run_semantic_reasoning(gcs_uri, mime_type="application/pdf", local_report=None):
+# Async client limits
+REASONING_MAX_CONCURRENCY = int(os.getenv("REASONING_MAX_CONCURRENCY", "4"))
+REASONING_DEADLINE_SECONDS = float(os.getenv("REASONING_DEADLINE_SECONDS", "45"))
+REASONING_MAX_RETRIES = int(os.getenv("REASONING_MAX_RETRIES", "2"))
+REASONING_BACKOFF_SECONDS = float(os.getenv("REASONING_BACKOFF_SECONDS", "1.0"))
+
+# Global cap on in-flight Gemini calls across all analyses in this process
+_reasoning_semaphore = asyncio.Semaphore(REASONING_MAX_CONCURRENCY)
+
+def build_reasoning_request(document_uri, mime_type="application/pdf", local_report=None):
     """
-    Sends a file from GCS directly to Gemini 1.5 Pro for forensic analysis.
-    
-    Args:
-        gcs_uri: The path to the file (e.g., "gs://veridoc-bucket/uploads/file.pdf")
-        mime_type: "application/pdf" or "image/jpeg"
-        local_report: (Optional) Dictionary containing local analysis findings (ELA, SegFormer, etc.)
+    Prepares the Gemini call.
+    Returns (GenerativeModel, contents, generation_config, model_name).
     """
-    
-    try:
-        # 1. Load the Model
-        # (Model initialized later with system instructions) 
+    # 1. Load the Model
+    # (Model initialized later with system instructions) 
 
-        # 2. Reference the file in the Bucket (Zero download latency!)
+    # 2. Reference the file in the Bucket (Zero download latency!)
+    if document_uri.startswith("file://"):
+        # Local storage backend: send the bytes inline
+        with open(document_uri[len("file://"):], "rb") as fh:
+            document_part = Part.from_data(data=fh.read(), mime_type=mime_type)
+    else:
         document_part = Part.from_uri(
-            uri=gcs_uri,
+            uri=document_uri,
             mime_type=mime_type
         )
+    
+    # Prepare Context String from Local Report
+    local_context = "No prior local analysis available."
+    if local_report:
+        # SANITIZATION: Drop artifact references (image files the model cannot see) and heavy strings
+        def sanitize_data(data):
+            if isinstance(data, dict):
+                return {k: sanitize_data(v) for k, v in data.items() if not is_artifact_ref(v)}
+            elif isinstance(data, list):
+                # Truncate long lists (e.g., histogram values)
+                if len(data) > 50 and all(isinstance(x, (int, float)) for x in data):
+                    return data[:10] + [f"... {len(data)-10} more items ..."]
+                return [sanitize_data(item) for item in data]
+            elif isinstance(data, str):
+                # Safety check: if a string looks like a base64 image (starts with data:image), drop it
+                if len(data) > 1000 and "data:image" in data[:50]:
+                    return "<Base64 Image Data Omitted>"
+                if len(data) > 5000: # General truncation for massive logs
+                    return data[:1000] + "... (truncated)"
+            return data
+
+        # We want to provide the FULL details to the AI so it can explain everything
+        # serialized in a readable format.
+        clean_report = sanitize_data(local_report) # Create deep-ish copy via recursion
         
-        # Prepare Context String from Local Report
-        local_context = "No prior local analysis available."
-        if local_report:
-            # SANITIZATION: Remove heavy Base64 strings to prevent Token Limit Error
-            def sanitize_data(data):
-                if isinstance(data, dict):
-                    return {k: sanitize_data(v) for k, v in data.items() if k not in ['heatmap_image', 'ela_image', 'noise_map']}
-                elif isinstance(data, list):
-                    # Truncate long lists (e.g., histogram values)
-                    if len(data) > 50 and all(isinstance(x, (int, float)) for x in data):
-                        return data[:10] + [f"... {len(data)-10} more items ..."]
-                    return [sanitize_data(item) for item in data]
-                elif isinstance(data, str):
-                    # Safety check: if a string looks like a base64 image (starts with data:image), drop it
-                    if len(data) > 1000 and "data:image" in data[:50]:
-                        return "<Base64 Image Data Omitted>"
-                    if len(data) > 5000: # General truncation for massive logs
-                        return data[:1000] + "... (truncated)"
-                return data
-
-            # We want to provide the FULL details to the AI so it can explain everything
-            # serialized in a readable format.
-            clean_report = sanitize_data(local_report) # Create deep-ish copy via recursion
-            
-            details = clean_report.get('details', {})
-            flags = clean_report.get('flags', [])
-            score = clean_report.get('score', 0)
-            
-            # Create a clean summary object
-            context_data = {
-                "local_risk_score": score,
-                "technical_flags": flags,
-                "detailed_metrics": details
-            }
-            
-            local_context = f"""
-            FULL LOCAL FORENSIC ANALYSIS DATA:
-            {json.dumps(context_data, indent=2)}
-            
-            INSTRUCTIONS FOR USING THIS DATA:
-            1. This data comes from specialized code-based forensic tools (ELA, SegFormer, Metadata Analysis, Digital Signature Verification).
-            2. Trust these metrics. If SegFormer says "Tampered", it is highly likely.
-            3. **CRITICAL**: Check for "signatures" in the details. If a signature is INVALID, UNTRUSTED, or REVOKED, you MUST flag this as a severe authenticity issue.
-            4. Your job is to SYNTHESIZE these technical findings with your own Visual/Semantic analysis.
-            """
-
-        # 3. Define the Prompt (The one above)
-        prompt = """
-        Analyze the attached document using the provided forensic context.
-        """
-        
-        system_instruction = f"""
-        You are VeriDoc-AI, an expert forensic document auditor. 
-        Current Date: {datetime.now().strftime('%Y-%m-%d')}
-        
-        CONTEXT:
-        {local_context}
+        details = clean_report.get('details', {})
+        flags = clean_report.get('flags', [])
+        score = clean_report.get('score', 0)
         
-        OBJECTIVE:
-        Provide a "Unified Forensic Narrative" that explains the document's authenticity. 
-        You must correlate the "Local Forensic Analysis Data" with your own visual observations.
+        # Create a clean summary object
+        context_data = {
+            "local_risk_score": score,
+            "technical_flags": flags,
+            "detailed_metrics": details
+        }
         
-        OUTPUT FORMAT (JSON):
-        {{
-            "authenticity_score": (0-100) - Your confidence in the document's legitimacy.
-            "flagged_issues": [List of strings] - Focus on SEMANTIC inconsistencies (dates, logic) or VISUAL anomalies you see. *Do not* merely repeat the technical flags unless you add new context.
-            "summary": (String) - High-level executive summary (max 2 sentences).
-            "reasoning": (String) - THE MASTER EXPLANATION. This should be a detailed paragraph.
-                - EXPLICITLY REFERENCE the technical metrics (e.g., "The high ELA variance confirms editing...")
-                - Connect them to your visual findings (e.g., "...aligning with the visual mismatch in the font at the top right.").
-                - Explain what the Segment/Noise maps likely show based on their presence.
-                - This field MUST cover "Everything" - technical signals + semantic reasoning.
-            "bounding_boxes": [ {{ "box_2d": [ymin, xmin, ymax, xmax], "label": "description" }} ]
-        }}
+        local_context = f"""
+        FULL LOCAL FORENSIC ANALYSIS DATA:
+        {json.dumps(context_data, indent=2)}
         
-        BOUNDING BOXES:
-        If you find specific visual anomalies, provide bounding boxes.
-        Format: [ymin, xmin, ymax, xmax] normalized to 0-1000.
+        INSTRUCTIONS FOR USING THIS DATA:
+        1. This data comes from specialized code-based forensic tools (ELA, SegFormer, Metadata Analysis, Digital Signature Verification).
+        2. Trust these metrics. If SegFormer says "Tampered", it is highly likely.
+        3. **CRITICAL**: Check for "signatures" in the details. If a signature is INVALID, UNTRUSTED, or REVOKED, you MUST flag this as a severe authenticity issue.
+        4. Your job is to SYNTHESIZE these technical findings with your own Visual/Semantic analysis.
         """
-        # 4. Generate Content
-        # We set temperature to 0.0 for maximum factual consistency
-        
-        # Initialize model with system instructions
-        model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
-        model = GenerativeModel(model_name, system_instruction=system_instruction)
 
-        response = model.generate_content(
-            [document_part, prompt],
-            generation_config={"response_mime_type": "application/json", "temperature": 0.0}
-        )
+    # 3. Define the Prompt (The one above)
+    prompt = """
+    Analyze the attached document using the provided forensic context.
+    """
+    
+    system_instruction = f"""
+    You are VeriDoc-AI, an expert forensic document auditor. 
+    Current Date: {datetime.now().strftime('%Y-%m-%d')}
+    
+    CONTEXT:
+    {local_context}
+    
+    OBJECTIVE:
+    Provide a "Unified Forensic Narrative" that explains the document's authenticity. 
+    You must correlate the "Local Forensic Analysis Data" with your own visual observations.
+    
+    OUTPUT FORMAT (JSON):
+    {{
+        "authenticity_score": (0-100) - Your confidence in the document's legitimacy.
+        "flagged_issues": [List of strings] - Focus on SEMANTIC inconsistencies (dates, logic) or VISUAL anomalies you see. *Do not* merely repeat the technical flags unless you add new context.
+        "summary": (String) - High-level executive summary (max 2 sentences).
+        "reasoning": (String) - THE MASTER EXPLANATION. This should be a detailed paragraph.
+            - EXPLICITLY REFERENCE the technical metrics (e.g., "The high ELA variance confirms editing...")
+            - Connect them to your visual findings (e.g., "...aligning with the visual mismatch in the font at the top right.").
+            - Explain what the Segment/Noise maps likely show based on their presence.
+            - This field MUST cover "Everything" - technical signals + semantic reasoning.
+        "bounding_boxes": [ {{ "box_2d": [ymin, xmin, ymax, xmax], "label": "description" }} ]
+    }}
+    
+    BOUNDING BOXES:
+    If you find specific visual anomalies, provide bounding boxes.
+    Format: [ymin, xmin, ymax, xmax] normalized to 0-1000.
+    """
+    # 4. Generate Content
+    # We set temperature to 0.0 for maximum factual consistency
+    
+    # Initialize model with system instructions
+    model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+    model = GenerativeModel(model_name, system_instruction=system_instruction)
+    generation_config = {"response_mime_type": "application/json", "temperature": 0.0}
+
+    return model, [document_part, prompt], generation_config, model_name
+
+def parse_reasoning_response(response, model_name):
+    result = json.loads(response.text)
+    result['model_name'] = model_name
+    return result
+
+def run_semantic_reasoning(document_uri, mime_type="application/pdf", local_report=None):
+    """
+    Sends a file from GCS directly to Gemini for forensic analysis (blocking).
+    
+    Args:
+        document_uri: The path to the file (e.g., "gs://veridoc-bucket/documents/<sha256>.pdf",
+                      or "file://..." with the local storage backend)
+        mime_type: "application/pdf" or "image/jpeg"
+        local_report: (Optional) Dictionary containing local analysis findings (ELA, SegFormer, etc.)
+    """
+    try:
+        model, contents, generation_config, model_name = build_reasoning_request(document_uri, mime_type, local_report)
+        response = model.generate_content(contents, generation_config=generation_config)
 
         # 5. Parse and Return
-        result = json.loads(response.text)
-        result['model_name'] = model_name
-        return result
+        return parse_reasoning_response(response, model_name)
+
+    except Exception as e:
+        return {"error": f"Reasoning layer failed: {str(e)}"}
 
+async def run_semantic_reasoning_async(document_uri, mime_type="application/pdf", local_report=None,
+                                       deadline_seconds=REASONING_DEADLINE_SECONDS):
+    """
+    Non-blocking variant used by the API.
+    - At most REASONING_MAX_CONCURRENCY calls in flight per process
+    - Transient failures retried with exponential backoff + jitter
+    - The whole call (queueing, retries included) is bounded by deadline_seconds;
+      on expiry the result carries "timed_out": True so callers can fall back
+    """
+    async def attempt_with_retries():
+        # Prompt building may read the document (local storage backend): keep it off the loop
+        loop = asyncio.get_running_loop()
+        model, contents, generation_config, model_name = await loop.run_in_executor(
+            None, build_reasoning_request, document_uri, mime_type, local_report
+        )
+        last_error = None
+        for attempt in range(REASONING_MAX_RETRIES + 1):
+            try:
+                async with _reasoning_semaphore:
+                    with DETECTOR_SECONDS.time(detector="gemini"):
+                        response = await model.generate_content_async(contents, generation_config=generation_config)
+                return parse_reasoning_response(response, model_name)
+            except json.JSONDecodeError as e:
+                # Malformed model output is not transient
+                return {"error": f"Reasoning layer failed: {str(e)}"}
+            except Exception as e:
+                last_error = e
+                if attempt < REASONING_MAX_RETRIES:
+                    delay = REASONING_BACKOFF_SECONDS * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        return {"error": f"Reasoning layer failed: {str(last_error)}"}
+
+    try:
+        return await asyncio.wait_for(attempt_with_retries(), timeout=deadline_seconds)
+    except asyncio.TimeoutError:
+        return {"error": f"Reasoning layer timed out after {deadline_seconds:g}s", "timed_out": True}
     except Exception as e:
         return {"error": f"Reasoning layer failed: {str(e)}"}
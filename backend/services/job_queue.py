@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import deque
+
+from services.cancellation import AnalysisCancelled
+
+# Heavy model passes (TruFor / SegFormer) share the CPU, so only a few
+# analyses run at once and the rest wait in a bounded queue.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "16"))
+
+# Rolling window used for wait / run time statistics
+STATS_WINDOW = 500
+
+
+class QueueFull(Exception):
+    """Raised when the analysis queue is at its maximum depth (maps to HTTP 429)."""
+
+
+class AnalysisJob:
+    def __init__(self, run, on_position=None):
+        self.run = run                  # coroutine function executed by a worker
+        self.on_position = on_position  # async callback(position) while waiting
+        self.future = asyncio.get_running_loop().create_future()
+        # The submitter's context (e.g. its trace span) follows the job onto the worker
+        self.context = contextvars.copy_context()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+    async def result(self):
+        return await self.future
+
+
+class AnalysisQueue:
+    """
+    Fixed-size worker pool in front of the analysis pipelines.
+    - submit() enqueues a job or raises QueueFull when max_depth jobs are already waiting
+    - waiting jobs are told their position each time the queue moves
+    - stats() exposes depth and wait times for capacity planning
+    """
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS, max_depth: int = ANALYSIS_QUEUE_DEPTH):
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self._queue = None
+        self._waiting = []
+        self._worker_tasks = []
+        self._running = 0
+        self._wait_times = deque(maxlen=STATS_WINDOW)
+        self._run_times = deque(maxlen=STATS_WINDOW)
+        self._completed = 0
+        self._rejected = 0
+
+    def start(self):
+        # Idempotent; also invoked lazily so the queue works without lifespan
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def is_full(self) -> bool:
+        return len(self._waiting) >= self.max_depth
+
+    def submit(self, run, on_position=None) -> AnalysisJob:
+        self.start()
+        if self.is_full():
+            self._rejected += 1
+            raise QueueFull(f"Analysis queue is full ({self.max_depth} jobs waiting)")
+
+        job = AnalysisJob(run, on_position)
+        self._waiting.append(job)
+        self._queue.put_nowait(job)
+        return job
+
+    def position(self, job: AnalysisJob) -> int:
+        """
+        1-based position in the line for a worker.
+        0 means the job is running or an idle worker is about to pick it up.
+        """
+        try:
+            idx = self._waiting.index(job)
+        except ValueError:
+            return 0
+        idle_workers = self.workers - self._running
+        return max(0, idx + 1 - idle_workers)
+
+    async def _notify_positions(self):
+        for job in list(self._waiting):
+            position = self.position(job)
+            if job.on_position and position:
+                try:
+                    await job.on_position(position)
+                except Exception:
+                    # A disconnected client must not stall the queue
+                    job.on_position = None
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            self._waiting.remove(job)
+            job.started_at = time.monotonic()
+            self._wait_times.append(job.started_at - job.enqueued_at)
+            self._running += 1
+            await self._notify_positions()
+
+            try:
+                result = await asyncio.create_task(job.run(), context=job.context)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except (Exception, AnalysisCancelled) as e:
+                # AnalysisCancelled is a BaseException; hand it to the submitter like any failure
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._running -= 1
+                self._completed += 1
+                self._run_times.append(time.monotonic() - job.started_at)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        def summarize(samples):
+            if not samples:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            ordered = sorted(samples)
+            return {
+                "avg": round(sum(ordered) / len(ordered), 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max": round(ordered[-1], 3),
+            }
+
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "queue_depth": len(self._waiting),
+            "running": self._running,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "wait_seconds": summarize(self._wait_times),
+            "run_seconds": summarize(self._run_times),
+        }
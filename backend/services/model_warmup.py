@@ -0,0 +1,96 @@
+import os
+import time
+import asyncio
+import threading
+
+import torch
+
+from components.segformer import inference as segformer_inference
+from components.trufor.engine import TruForEngine, TRUFOR_MAX_SIDE
+from components.model_server import client as model_client
+from services.artifact_writer import write_image_artifact
+from services.pipeline_orchestrator import colorize_trufor_heatmap
+
+# Set to false for local development (skips loading weights at startup)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+# Synthetic image size for the warm-up passes; matches the largest image TruFor sees by default
+WARMUP_IMAGE_SIDE = int(os.getenv("WARMUP_IMAGE_SIDE", str(TRUFOR_MAX_SIDE or 1024)))
+
+
+class ModelReadiness:
+    """
+    Startup state for /ready.
+    - warming: weights loading / synthetic passes running
+    - ready: every model loaded and ran once
+    - degraded: warm-up finished but a model is unavailable (its detector reports an error)
+    /health stays liveness only; /ready gates traffic on warm-up finishing.
+    """
+
+    def __init__(self):
+        self.status = "warming" if MODEL_WARMUP else "ready"
+        self.models = {}
+        self.started_at = None
+        self.elapsed_ms = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status in ("ready", "degraded")
+
+    def _record(self, name: str, **fields):
+        with self._lock:
+            self.models[name] = fields
+
+    def _warm_segformer(self, side: int):
+        # Same path as a real image: preprocess size IMAGE_SIZE, overlay at the original size
+        input_tensor = torch.rand(1, 3, segformer_inference.IMAGE_SIZE, segformer_inference.IMAGE_SIZE)
+        if not model_client.is_enabled():
+            segformer_inference.get_model()
+        logits = segformer_inference.forward_logits(input_tensor)
+        result = segformer_inference.postprocess_logits(logits, (side, side))
+        return result["heatmap"]
+
+    def _warm_trufor(self, side: int):
+        engine = TruForEngine()
+        if not engine.is_ready():
+            raise RuntimeError("TruFor model not loaded")
+        pred, conf = engine.forward(torch.rand(1, 3, side, side).to(engine._device))
+        return colorize_trufor_heatmap(engine.postprocess(pred, conf, (side, side))["heatmap"])
+
+    def warm_up(self, scratch_dir: str):
+        """Blocking; run in an executor. Loads every model and runs one synthetic pass each."""
+        self.started_at = time.time()
+        began = time.perf_counter()
+        side = max(64, WARMUP_IMAGE_SIDE)
+
+        for name, warm in (("segformer", self._warm_segformer), ("trufor", self._warm_trufor)):
+            model_began = time.perf_counter()
+            try:
+                overlay = warm(side)
+                # Also warms the PNG encoder the artifact writer uses
+                ref = write_image_artifact(os.path.join(scratch_dir, "warmup"), name, overlay, color_order="rgba")
+                os.remove(os.path.join(scratch_dir, ref["id"]))
+                self._record(name, status="ready", warmup_ms=round((time.perf_counter() - model_began) * 1000, 1))
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+                self._record(name, status="unavailable", error=str(e))
+
+        self.elapsed_ms = round((time.perf_counter() - began) * 1000, 1)
+        with self._lock:
+            all_ready = all(m["status"] == "ready" for m in self.models.values())
+            self.status = "ready" if all_ready else "degraded"
+        print(f"Model warm-up finished in {self.elapsed_ms} ms ({self.status}).")
+
+    async def run(self, scratch_dir: str):
+        if not MODEL_WARMUP:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.warm_up, scratch_dir)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "status": self.status,
+                "models": {name: dict(fields) for name, fields in self.models.items()},
+                "warmup_ms": self.elapsed_ms,
+            }
+
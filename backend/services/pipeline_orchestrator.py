@@ -1,8 +1,8 @@
 from components.segformer.inference import run_tamper_detection
 from components.trufor.engine import TruForEngine
 import os
+import contextlib
 from enum import Enum
-from pypdf import PdfReader
 import cv2
 import numpy as np
 import logging
@@ -10,7 +10,16 @@ import logging
 # Suppress verbose pypdf warnings commonly triggered by malformed forensic samples
 logging.getLogger("pypdf").setLevel(logging.WARNING)
 from pyhanko.sign import validation
-from pyhanko.pdf_utils.reader import PdfFileReader
+
+from services.analysis_profiles import get_profile
+from services.cancellation import AnalysisCancelled, checkpoint, run_in_executor
+from services.artifact_writer import write_image_artifact
+from services.document_context import DocumentContext
+from services.decoded_image import DecodedImage
+from services.ela_engine import jpeg_ghost_analysis, luma_chroma_error, recompress
+from services.block_statistics import block_inconsistency
+from services.metrics import DETECTOR_SECONDS
+from services.tracing import span
 
 class PipelineType(Enum):
     STRUCTURAL = "structural"
@@ -19,71 +28,112 @@ class PipelineType(Enum):
 
 # --- HELPERS: VISUAL PIPELINE ---
 
-def perform_ela(image_path: str, quality: int = 90) -> dict:
+def perform_ela(image, quality: int = 90, sweep: bool = True, sweep_max_pixels: int = None) -> dict:
     """
     Performs Error Level Analysis (ELA) on an image using OpenCV.
     Generates a visual ELA heatmap for the frontend.
+    `image` is a DecodedImage (or a path, decoded here). Re-compression happens
+    in memory. With `sweep`, a JPEG ghost sweep over ELA_SWEEP_MIN..MAX_QUALITY
+    adds per-quality residual curves and the best-matching original quality
+    (services.ela_engine; sweep_max_pixels None = ELA_SWEEP_MAX_PIXELS, 0 = whole image).
+    "blocks" holds the block-level inconsistency of the ELA residual
+    (services.block_statistics): a score and the outlier blocks.
     """
     try:
-        # 1. Read Original
-        original = cv2.imread(image_path)
-        if original is None:
-             return {"status": "error", "message": "Could not read image"}
+        # 1. Original pixels (decoded once per image, shared with the other detectors)
+        image = DecodedImage.of(image)
+        original = image.bgr
+        checkpoint()
              
-        # 2. Resave at specific quality
-        resaved_path = image_path + ".resaved.jpg"
-        cv2.imwrite(resaved_path, original, [cv2.IMWRITE_JPEG_QUALITY, quality])
-        
-        # 3. Read Resaved
-        resaved = cv2.imread(resaved_path)
+        # 2. Resave at specific quality and take the absolute difference (ELA), in memory
+        recompressed = recompress(original, quality)
+        ela_image = cv2.absdiff(original, recompressed)
+        checkpoint()
         
-        # 4. Calculate Absolute Difference (ELA)
-        ela_image = cv2.absdiff(original, resaved)
-        
-        # 5. Calculate Stats
+        # 3. Calculate Stats
         # Convert to grayscale for simple intensity stats
         gray_ela = cv2.cvtColor(ela_image, cv2.COLOR_BGR2GRAY)
         max_diff = np.max(gray_ela)
         mean_diff = np.mean(gray_ela)
         std_dev = np.std(gray_ela)
         
-        # 6. Generate Amplified ELA Image for Display
+        # 4. Generate Amplified ELA Image for Display
         scale_factor = 15.0 
         amplified = cv2.convertScaleAbs(ela_image, alpha=scale_factor, beta=0)
         
-        ela_filename = os.path.basename(image_path) + ".ela.png"
-        ela_output_path = os.path.join(os.path.dirname(image_path), ela_filename)
-        cv2.imwrite(ela_output_path, amplified)
-        
-        # Cleanup temp
-        if os.path.exists(resaved_path):
-            os.remove(resaved_path)
-            
-        return {
+        checkpoint()
+        artifact = write_image_artifact(image.path, "ela", amplified)
+
+        result = {
             "status": "success",
+            "quality": quality,
             "max_difference": float(max_diff),
             "mean_difference": float(mean_diff),
             "std_deviation": float(std_dev),
-            "ela_image_path": ela_filename
+            "artifact": artifact
         }
+
+        # 5. Regions whose error level does not match the rest of the image
+        checkpoint()
+        # luma and chroma are scored separately so colour edges don't read as anomalies
+        luma_error, chroma_error = luma_chroma_error(original, recompressed)
+        result["blocks"] = block_inconsistency(luma_error, image.detail,
+                                               chroma=(chroma_error, image.chroma_detail))
+
+        # 6. JPEG ghost curves (threaded quality sweep)
+        if sweep:
+            checkpoint()
+            result["ghost"] = jpeg_ghost_analysis(original, sweep_max_pixels)
+        return result
         
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def perform_noise_analysis(image_path: str) -> dict:
+def colorize_trufor_heatmap(heatmap_arr: np.ndarray) -> np.ndarray:
+    """TruFor probability map -> RGBA overlay (jet, transparent below 0.1)."""
+    import matplotlib.pyplot as plt
+    rgba_img = plt.get_cmap('jet')(heatmap_arr) # (H,W,4)
+
+    # Set alpha logic
+    alpha = heatmap_arr.copy()
+    alpha[alpha < 0.1] = 0.0
+    alpha[alpha >= 0.1] = 0.7
+    rgba_img[:, :, 3] = alpha
+    return rgba_img
+
+def save_heatmap_artifact(file_path: str, kind: str, result: dict) -> dict:
+    """
+    Replaces the raw overlay array a model returns ("heatmap") with an artifact
+    reference ("artifact"), so reports only carry small JSON.
+    """
+    heatmap = result.pop("heatmap", None)
+    if heatmap is None:
+        return result
+    try:
+        if heatmap.ndim == 2:
+            heatmap = colorize_trufor_heatmap(heatmap)
+        result["artifact"] = write_image_artifact(file_path, kind, heatmap, color_order="rgba")
+    except Exception as e:
+        print(f"{kind} heatmap save error: {e}")
+    return result
+
+def perform_noise_analysis(image) -> dict:
     """
     Generates a Noise Variance Map to visualize high-frequency noise distribution.
     Inconsistent noise patterns often indicate splicing.
+    `image` is a DecodedImage (or a path, decoded here).
+    "blocks" scores how far the noise level of individual blocks departs from
+    the rest of the image and lists the outlier blocks (services.block_statistics).
     """
     try:
-        # Read image in grayscale
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
-            return {"status": "error", "message": "Could not read image"}
+        # Grayscale view of the shared decode
+        image = DecodedImage.of(image)
+        img = image.gray
 
         # Denoise using a median filter (removes noise) and subtract from original to isolate noise
         denoised = cv2.medianBlur(img, 3)
         noise_map = cv2.absdiff(img, denoised)
+        checkpoint()
 
         # Enhance visibility of the noise
         # 1. Normalize (stretch contrast)
@@ -94,26 +144,26 @@ def perform_noise_analysis(image_path: str) -> dict:
         colored_noise = cv2.applyColorMap(norm_noise, cv2.COLORMAP_JET)
 
         # Save
-        noise_filename = os.path.basename(image_path) + ".noise.png"
-        noise_output_path = os.path.join(os.path.dirname(image_path), noise_filename)
-        cv2.imwrite(noise_output_path, colored_noise)
-        
+        artifact = write_image_artifact(image.path, "noise", colored_noise)
+
+        # Per-block noise level against the rest of the image
+        checkpoint()
         return {
             "status": "success",
-            "noise_map_path": noise_filename
+            "artifact": artifact,
+            "blocks": block_inconsistency(noise_map, image.detail),
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def analyze_quantization(image_path: str) -> dict:
+def analyze_quantization(image) -> dict:
     """
     Simplified JPEG Quantization Analysis (Double Quantization Detection)
     Checks for periodicity in DCT histograms of the image.
+    `image` is a DecodedImage (or a path, decoded here).
     """
     try:
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
-             return {"status": "error", "message": "Could not read image"}
+        img = DecodedImage.of(image).gray
         
         # Taking a center crop to analyze
         h, w = img.shape
@@ -160,29 +210,55 @@ def analyze_quantization(image_path: str) -> dict:
 
 import asyncio
 
-async def analyze_structural(file_path: str, callback=None):
+def write_embedded_image(img_obj, path: str):
+    with open(path, "wb") as fp:
+        fp.write(img_obj.data)
+
+def document_root(document):
+    """The /Root catalog of the PDF (resolved), or None."""
+    trailer = document.trailer
+    if not trailer or '/Root' not in trailer:
+        return None
+    root_obj = trailer['/Root']
+    # Depending on pypdf version, root_obj might be IndirectObject or Dict
+    # We access it safely
+    if hasattr(root_obj, 'get_object'):
+        root_obj = root_obj.get_object()
+    return root_obj
+
+async def analyze_structural(file_path: str, callback=None, batch=None, document=None, profile=None):
     """
     Pipeline A: Structural Forensics (Native PDFs)
     Advanced checks including:
     1. Incremental Update Detection (EOF markers)
     2. XRef Table keyword analysis
     3. Metadata Consistency
+    `batch` (services.batching.VisualBatch) is forwarded to embedded image analysis.
+    `document` (services.document_context.DocumentContext) shares the parsed PDF
+    with the other stages; one is opened here if not given.
+    `profile` (services.analysis_profiles) caps how many embedded images are
+    inspected and which visual detectors run on them.
+    Byte scans, parsing and image extraction run in the default executor,
+    like the visual detectors, so the event loop keeps serving other tasks.
     """
+    profile = profile or get_profile()
     results = {
         "pipeline": "Structural Forensics (Real)",
         "score": 0.0,
         "flags": [],
         "details": {}
     }
-    
+
+    owns_document = document is None
+    if owns_document:
+        document = DocumentContext(file_path)
+    loop = asyncio.get_running_loop()
+
     try:
         # 1. Incremental Update Detection (Raw Bytes)
-        with open(file_path, 'rb') as f:
-            content = f.read()
-            eof_count = content.count(b'%%EOF')
-            # xref keyword often appears once per section in standard PDFs.
-            # Multiple xrefs can also imply updates.
-            xref_count = content.count(b'xref') 
+        xref_info = await run_in_executor(loop, lambda: document.xref_info)
+        eof_count = xref_info["eof_markers"]
+        xref_count = xref_info["xref_keywords"]
             
         results['details']['eof_markers_found'] = eof_count
         results['details']['xref_keywords_found'] = xref_count
@@ -195,126 +271,120 @@ async def analyze_structural(file_path: str, callback=None):
             results['score'] = 1.0 # High risk or broken
             
         # 2. PDF Parsing & Deep Analysis
-        # We use a context manager to ensure the file handle is closed immediately after use, allowing cleanup.
-        with open(file_path, 'rb') as f_stream:
-            reader = PdfReader(f_stream)
+        # Parsed once per task; the document context owns (and later closes) the mapping.
+        reader = await run_in_executor(loop, lambda: document.pypdf_reader)
+        
+        # A. Metadata Forensics
+        meta = await run_in_executor(loop, lambda: reader.metadata)
+        if meta:
+            safe_meta = {k: str(v) for k, v in meta.items()}
+            results['details']['metadata'] = safe_meta
             
-            # A. Metadata Forensics
-            meta = reader.metadata
-            if meta:
-                safe_meta = {k: str(v) for k, v in meta.items()}
-                results['details']['metadata'] = safe_meta
-                
-                producer = safe_meta.get('/Producer', '').lower()
-                if not producer:
-                    results['flags'].append("Missing Producer Metadata")
-                    results['score'] += 0.2
-                elif "phantom" in producer or "gpl output" in producer:
-                    results['flags'].append(f"Suspicious Producer detected: {safe_meta.get('/Producer')}")
-                    results['score'] += 0.3
-            else:
-                results['flags'].append("No Metadata found")
-                results['score'] += 0.1
-                
-            # --- NEW: Deep Image Inspection (Extract & Analyze) ---
-            # Checks for embedded images that might be faked (e.g., pasted signature, fake bank statement screenshot)
-            try:
-                embedded_images = []
-                for page in reader.pages:
-                    for img in page.images:
-                        embedded_images.append(img)
-                
-                results['details']['embedded_image_count'] = len(embedded_images)
-                results['details']['analyzed_images'] = []
-                
-                if len(embedded_images) > 0:
-                    # Analyze up to 3 largest images to save time, or all if critical.
-                    # For now, analyze the first 3.
-                    for idx, img_obj in enumerate(embedded_images[:3]):
-                        # Send Update
-                        if callback:
-                            await callback(f"Found embedded image {idx+1}/{len(embedded_images[:3])}. Running Visual Forensics (SegFormer)...")
-
-                        # Save temp
-                        temp_img_name = f"{os.path.basename(file_path)}_img_{idx}.{img_obj.name.split('.')[-1]}"
-                        temp_img_path = os.path.join(os.path.dirname(file_path), temp_img_name)
-                        
-                        with open(temp_img_path, "wb") as fp:
-                            fp.write(img_obj.data)
+            producer = safe_meta.get('/Producer', '').lower()
+            if not producer:
+                results['flags'].append("Missing Producer Metadata")
+                results['score'] += 0.2
+            elif "phantom" in producer or "gpl output" in producer:
+                results['flags'].append(f"Suspicious Producer detected: {safe_meta.get('/Producer')}")
+                results['score'] += 0.3
+        else:
+            results['flags'].append("No Metadata found")
+            results['score'] += 0.1
+            
+        # --- NEW: Deep Image Inspection (Extract & Analyze) ---
+        # Checks for embedded images that might be faked (e.g., pasted signature, fake bank statement screenshot)
+        try:
+            embedded_images = await run_in_executor(loop, document.embedded_images)
+            
+            results['details']['embedded_image_count'] = len(embedded_images)
+            results['details']['analyzed_images'] = []
+            
+            if len(embedded_images) > 0:
+                # The profile decides how many: the first 3 (quick / standard) or all (deep)
+                selected_images = embedded_images[:profile["max_embedded_images"]]
+                for idx, img_obj in enumerate(selected_images):
+                    # Stop right away once the client is gone or the deadline passed
+                    checkpoint()
+                    # Send Update
+                    if callback:
+                        await callback(f"Found embedded image {idx+1}/{len(selected_images)}. Running Visual Forensics...")
+
+                    # Save temp
+                    temp_img_name = f"{os.path.basename(file_path)}_img_{idx}.{img_obj.name.split('.')[-1]}"
+                    temp_img_path = os.path.join(os.path.dirname(file_path), temp_img_name)
+                    
+                    with span("structural.embedded_image", index=idx, file=temp_img_name):
+                        await run_in_executor(loop, write_embedded_image, img_obj, temp_img_path)
                             
                         # RUN VISUAL PIPELINE ON EXTRACTED CONTENT
                         # analyze_visual is now async, so we await it directly
-                        visual_report = await analyze_visual(temp_img_path)
-                        
-                        # Store comprehensive results for this image
-                        # We inject the temp filename so the frontend knows what to fetch
-                        # Also include image metadata if available
-                        image_summary = {
-                            "index": idx,
-                            "filename": temp_img_name,
-                            "visual_report": visual_report
-                        }
-                        results['details']['analyzed_images'].append(image_summary)
-
-                        # Check for flags (Original Logic Preserved)
-                        if visual_report.get('score', 0) > 0.4:
-                            results['flags'].append(f"Embedded Image {idx+1}: Potential Tampering Detected")
-                            results['score'] += 0.4
-                            
-                            if 'semantic_segmentation' in visual_report['details']:
-                                sem = visual_report['details']['semantic_segmentation']
-                                if isinstance(sem, dict) and sem.get('is_tampered'):
-                                    conf = sem.get('confidence_score', 0)
-                                    results['flags'].append(f"-> SegFormer found tampering in embedded image {idx+1} (Conf: {conf:.2f})")
-                                    results['score'] += 0.3
-                        
-                        # --- PERSISTENCE LOGIC ---
-                        # We KEEP the temp files if we analyzed them, so the frontend can show the Visual Lab for ANY processed image.
-                        # This meets the user requirement: "make the visual lab thing for each image... show those graphs too"
-                        # We do NOT delete the files here. They will be cleaned up by the explicit cleanup API.
-
-
-            except Exception as e:
-                results['warnings'] = f"Deep Image Inspection failed: {str(e)}"
-
-
-            # B. Orphan / Hidden Content Analysis (Simplified Safe Mode)
-            # Instead of deep traversal which risks recursion errors, we check for high-risk flags
-            try:
-                # Check for embedded files (often used for attacks)
-                if reader.trailer and '/Root' in reader.trailer:
-                    root_obj = reader.trailer['/Root']
-                    # Depending on pypdf version, root_obj might be IndirectObject or Dict
-                    # We access it safely
-                    if hasattr(root_obj, 'get_object'):
-                        root_obj = root_obj.get_object()
+                        visual_report = await analyze_visual(temp_img_path, batch=batch, profile=profile)
                     
-                    if '/EmbeddedFiles' in root_obj:
-                        results['flags'].append("Contains Embedded Files (Potential Payload)")
-                        results['score'] += 0.3
+                    # Store comprehensive results for this image
+                    # We inject the temp filename so the frontend knows what to fetch
+                    # Also include image metadata if available
+                    image_summary = {
+                        "index": idx,
+                        "filename": temp_img_name,
+                        "visual_report": visual_report
+                    }
+                    results['details']['analyzed_images'].append(image_summary)
+
+                    # Check for flags (Original Logic Preserved)
+                    if visual_report.get('score', 0) > 0.4:
+                        results['flags'].append(f"Embedded Image {idx+1}: Potential Tampering Detected")
+                        results['score'] += 0.4
                         
-                    if '/JS' in root_obj or '/JavaScript' in root_obj:
-                        results['flags'].append("Contains Embeded JavaScript (High Risk)")
-                        results['score'] += 0.5
+                        if 'semantic_segmentation' in visual_report['details']:
+                            sem = visual_report['details']['semantic_segmentation']
+                            if isinstance(sem, dict) and sem.get('is_tampered'):
+                                conf = sem.get('confidence_score', 0)
+                                results['flags'].append(f"-> SegFormer found tampering in embedded image {idx+1} (Conf: {conf:.2f})")
+                                results['score'] += 0.3
                     
-            except Exception as e:
-                # Don't fail the whole pipeline for an advanced check
-                results['warnings'] = f"Advanced structural check warning: {str(e)}"
+                    # --- PERSISTENCE LOGIC ---
+                    # We KEEP the temp files if we analyzed them, so the frontend can show the Visual Lab for ANY processed image.
+                    # This meets the user requirement: "make the visual lab thing for each image... show those graphs too"
+                    # We do NOT delete the files here. They will be cleaned up by the explicit cleanup API.
+
+
+        except Exception as e:
+            results['warnings'] = f"Deep Image Inspection failed: {str(e)}"
 
-        # Context manager closes f_stream here
 
+        # B. Orphan / Hidden Content Analysis (Simplified Safe Mode)
+        # Instead of deep traversal which risks recursion errors, we check for high-risk flags
+        try:
+            # Check for embedded files (often used for attacks)
+            root_obj = await run_in_executor(loop, document_root, document)
+            if root_obj is not None:
+                if '/EmbeddedFiles' in root_obj:
+                    results['flags'].append("Contains Embedded Files (Potential Payload)")
+                    results['score'] += 0.3
+                    
+                if '/JS' in root_obj or '/JavaScript' in root_obj:
+                    results['flags'].append("Contains Embeded JavaScript (High Risk)")
+                    results['score'] += 0.5
+                
+        except Exception as e:
+            # Don't fail the whole pipeline for an advanced check
+            results['warnings'] = f"Advanced structural check warning: {str(e)}"
 
         results['score'] = min(results['score'], 1.0)
             
     except Exception as e:
         results['error'] = f"Analysis Failed: {str(e)}"
+    finally:
+        if owns_document:
+            document.close()
         
     return results
 
-async def analyze_cryptographic(file_path: str, callback=None):
+async def analyze_cryptographic(file_path: str, callback=None, document=None):
     """
     Pipeline C: Cryptographic Analysis (Signed PDFs)
     Uses pyHanko to validate signatures with Trust Store usage.
+    `document` (DocumentContext) reuses the pyHanko reader opened for pipeline selection.
     """
     if callback:
         await callback("Initializing Cryptographic Engine...")
@@ -337,11 +407,13 @@ async def analyze_cryptographic(file_path: str, callback=None):
         if callback:
              await callback("Loading Trusted Root Certificates...")
         
-        # 2. Open File
-        with open(file_path, 'rb') as f:
-            r = PdfFileReader(f)
+        # 2. Open File (or reuse the task's parsed document)
+        owns_document = document is None
+        with (DocumentContext(file_path) if owns_document else contextlib.nullcontext(document)) as doc:
+            # The pyHanko parse and signature walk are synchronous: keep them off the event loop
+            embedded_signatures = await run_in_executor(asyncio.get_running_loop(), lambda: doc.embedded_signatures)
             
-            if not r.embedded_signatures:
+            if not embedded_signatures:
                 results['flags'].append("No Embedded Signatures found")
                 results['details']['signature_count'] = 0
                 return results
@@ -351,13 +423,15 @@ async def analyze_cryptographic(file_path: str, callback=None):
             # Create Validation Context (allow online fetching of CRLs)
             vc = ValidationContext(allow_fetching=True)
             
-            for sig in r.embedded_signatures:
+            for sig in embedded_signatures:
+                checkpoint()
                 try:
                     if callback:
                         await callback(f"Verifying Signature: {sig.field_name}...")
                     
                     # Validate with Context
-                    val_status = await async_validate_pdf_signature(sig, signer_validation_context=vc)
+                    with DETECTOR_SECONDS.time(detector="pyhanko_validation"), span("cryptographic.signature", field=sig.field_name):
+                        val_status = await async_validate_pdf_signature(sig, signer_validation_context=vc)
                     
                     # Extract Signer Details
                     signer_name = "Unknown"
@@ -412,11 +486,19 @@ async def analyze_cryptographic(file_path: str, callback=None):
         
     return results
 
-async def analyze_visual(file_path: str, callback=None):
+# Block inconsistency score (ELA / noise) from which a localized anomaly is flagged
+BLOCK_INCONSISTENCY_FLAG = 0.5
+
+async def analyze_visual(file_path: str, callback=None, batch=None, profile=None):
     """
     Pipeline B: Visual Analysis (Images)
     Uses ELA, Quantization Checks, and Semantic Segmentation (SegFormer).
+    With `batch` (services.batching.VisualBatch) the SegFormer / TruFor forward
+    passes are grouped with other documents of the same job.
+    `profile` (services.analysis_profiles) selects the detectors; the others are
+    reported as {"status": "skipped"}.
     """
+    profile = profile or get_profile()
     if callback:
         await callback("Starting Visual Forensics Pipeline...")
 
@@ -428,6 +510,10 @@ async def analyze_visual(file_path: str, callback=None):
     }
     
     loop = asyncio.get_running_loop()
+
+    # One decode shared by every detector (lazy: the first detector to need pixels decodes,
+    # a file that cannot be decoded fails each detector as before)
+    image = DecodedImage(file_path)
     
     # Define tasks efficiently
     # CPU-bound tasks (OpenCV) needed executors
@@ -435,36 +521,66 @@ async def analyze_visual(file_path: str, callback=None):
     async def run_ela():
         if callback: await callback("Running Error Level Analysis (ELA)...")
         # Run in executor to avoid blocking main thread
-        return await loop.run_in_executor(None, perform_ela, file_path)
+        with DETECTOR_SECONDS.time(detector="ela"), span("visual.ela", file=os.path.basename(file_path)):
+            return await run_in_executor(loop, perform_ela, image, 90, profile["ela_sweep"], profile["ela_sweep_max_pixels"])
 
     async def run_quant():
         if callback: await callback("Analyzing DCT Histograms...")
-        return await loop.run_in_executor(None, analyze_quantization, file_path)
+        with DETECTOR_SECONDS.time(detector="quantization"), span("visual.quantization", file=os.path.basename(file_path)):
+            return await run_in_executor(loop, analyze_quantization, image)
     
     async def run_segformer():
         # SegFormer inference might be heavy, ensure it's non-blocking
         if callback: await callback("Engaging Neural Network (SegFormer)...")
-        # Assuming run_tamper_detection is synchronous, offload it
-        return await loop.run_in_executor(None, run_tamper_detection, file_path)
+        with DETECTOR_SECONDS.time(detector="segformer"), span("visual.segformer", file=os.path.basename(file_path)):
+            if batch:
+                seg_res = await batch.run_tamper_detection(image)
+            else:
+                # Assuming run_tamper_detection is synchronous, offload it
+                seg_res = await run_in_executor(loop, run_tamper_detection, image, checkpoint)
+            return await run_in_executor(loop, save_heatmap_artifact, file_path, "segformer", seg_res)
 
     async def run_noise():
         if callback: await callback("Calculating Noise Variance...")
-        return await loop.run_in_executor(None, perform_noise_analysis, file_path)
+        with DETECTOR_SECONDS.time(detector="noise"), span("visual.noise", file=os.path.basename(file_path)):
+            return await run_in_executor(loop, perform_noise_analysis, image)
 
     async def run_trufor():
         if callback: await callback("Initializing TruFor Analysis...")
-        trufor_engine = TruForEngine()
-        return await loop.run_in_executor(None, trufor_engine.analyze, file_path)
+        with DETECTOR_SECONDS.time(detector="trufor"), span("visual.trufor", file=os.path.basename(file_path)):
+            if batch:
+                trufor_res = await batch.run_trufor(image, max_side=profile["trufor_max_side"])
+            else:
+                trufor_engine = TruForEngine()
+                trufor_res = await run_in_executor(loop, trufor_engine.analyze, image, profile["trufor_max_side"], checkpoint)
+            if not isinstance(trufor_res, dict):
+                return trufor_res
+            trufor_res.pop("raw_confidence", None)
+            return await run_in_executor(loop, save_heatmap_artifact, file_path, "trufor", trufor_res)
+
+    async def skipped():
+        return {"status": "skipped", "profile": profile["name"]}
+
+    def selected(name, runner):
+        return runner() if name in profile["visual_detectors"] else skipped()
 
     # FIRE EVERYTHING AT ONCE (Parallel Execution)
-    ela_res, quant_res, seg_res, noise_res, trufor_res = await asyncio.gather(
-        run_ela(),
-        run_quant(),
-        run_segformer(),
-        run_noise(),
-        run_trufor(),
-        return_exceptions=True # Prevent one failure from stopping others
-    )
+    try:
+        ela_res, quant_res, seg_res, noise_res, trufor_res = await asyncio.gather(
+            selected("ela", run_ela),
+            selected("quantization", run_quant),
+            selected("segformer", run_segformer),
+            selected("noise", run_noise),
+            selected("trufor", run_trufor),
+            return_exceptions=True # Prevent one failure from stopping others
+        )
+    finally:
+        # Only the reports survive; free the pixel buffers before the next image
+        image.close()
+    # A cancelled analysis is not a detector failure; abort the whole pipeline
+    for res in (ela_res, quant_res, seg_res, noise_res, trufor_res):
+        if isinstance(res, AnalysisCancelled):
+            raise res
 
     # --- PROCESS RESULTS (Sequential Aggregation) ---
 
@@ -477,6 +593,14 @@ async def analyze_visual(file_path: str, callback=None):
         if ela_res.get('status') == 'success' and ela_res['mean_difference'] > 15:
              results['flags'].append("High ELA Response (Potential Manipulation)")
              results['score'] += 0.4
+        ghost = ela_res.get('ghost') or {}
+        if ghost.get('earlier_quality'):
+             results['flags'].append(f"JPEG Ghosts at Q{ghost['best_quality']} and Q{ghost['earlier_quality']} (Saved as JPEG More Than Once)")
+             results['score'] += 0.2
+        blocks = ela_res.get('blocks') or {}
+        if blocks.get('inconsistency_score', 0) >= BLOCK_INCONSISTENCY_FLAG:
+             results['flags'].append(f"Localized ELA Inconsistency ({blocks['outlier_blocks']} Blocks)")
+             results['score'] += 0.3
 
     # 2. Quantization
     if isinstance(quant_res, Exception):
@@ -502,48 +626,17 @@ async def analyze_visual(file_path: str, callback=None):
         results["details"]["noise_analysis"] = f"Noise Map Failed: {str(noise_res)}"
     else:
         results["details"]["noise_analysis"] = noise_res
+        blocks = noise_res.get("blocks") or {}
+        if blocks.get("inconsistency_score", 0) >= BLOCK_INCONSISTENCY_FLAG:
+             results["flags"].append(f"Localized Noise Inconsistency ({blocks['outlier_blocks']} Blocks)")
+             results["score"] += 0.3
 
     # 5. TruFor
     if isinstance(trufor_res, Exception):
         results["details"]["trufor"] = {"error": str(trufor_res)}
     else:
-        # TruFor Result Processing (Heatmap Saving)
-        # Note: Previous implementation had huge inline code here. We must keep it.
-        # But `analyze` probably returns the heatmap ARRAY, so we need to save it here?
-        # WAIT: The previous code ran `trufor_engine.analyze` which returned a dict with 'heatmap'.
-        # We need to replicate the saving logic here because `analyze` likely doesn't save to disk itself (based on previous code).
-        
+        # Heatmap already saved as an artifact by run_trufor
         results["details"]["trufor"] = trufor_res
-        
-        # Save Heatmap if present
-        if isinstance(trufor_res, dict) and trufor_res.get("heatmap") is not None:
-             try:
-                 import matplotlib.pyplot as plt
-                 # Save formatted heatmap to disk for frontend
-                 heatmap_arr = trufor_res["heatmap"]
-                 
-                 # Create RGBA
-                 cmap = plt.get_cmap('jet')
-                 rgba_img = cmap(heatmap_arr) # (H,W,4)
-                 
-                 # Set alpha logic
-                 alpha = heatmap_arr.copy()
-                 alpha[alpha < 0.1] = 0.0
-                 alpha[alpha >= 0.1] = 0.7
-                 rgba_img[:, :, 3] = alpha
-                 
-                 # Save
-                 tf_filename = os.path.basename(file_path) + ".trufor.png"
-                 tf_path = os.path.join(os.path.dirname(file_path), tf_filename)
-                 
-                 plt.imsave(tf_path, rgba_img)
-                 
-                 results["details"]["trufor"]["heatmap_path"] = tf_filename
-                 # Remove raw array
-                 if "heatmap" in results["details"]["trufor"]: del results["details"]["trufor"]["heatmap"]
-                 if "raw_confidence" in results["details"]["trufor"]: del results["details"]["trufor"]["raw_confidence"]
-             except Exception as e:
-                 print(f"TruFor Save Error: {e}")
 
         # Integrate Score
         if isinstance(trufor_res, dict) and trufor_res.get("trust_score", 1.0) < 0.5:
@@ -555,22 +648,54 @@ async def analyze_visual(file_path: str, callback=None):
     
     return results
 
-def determine_pipeline(filename: str, content_type: str) -> PipelineType:
+# Magic-byte signatures of the formats we can route
+FILE_SIGNATURES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"BM", "image/bmp"),
+]
+
+VISUAL_CONTENT_TYPES = {"image/jpeg", "image/png", "image/tiff", "image/bmp", "image/webp"}
+
+def sniff_content_type(header: bytes, fallback: str = None) -> str:
+    """
+    Identifies the real file type from its leading bytes instead of trusting
+    the client-supplied extension / Content-Type.
+    """
+    for signature, mime in FILE_SIGNATURES:
+        if header.startswith(signature):
+            return mime
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    # The PDF spec tolerates junk before the header within the first 1 KB
+    if b"%PDF-" in header[:1024]:
+        return "application/pdf"
+    return fallback
+
+def determine_pipeline(filename: str, content_type: str, document=None) -> PipelineType:
     """
     Orchestration Logic
+    `document` (DocumentContext) keeps the pyHanko parse for the cryptographic stage.
     """
     fn_lower = filename.lower()
     ext = fn_lower.split('.')[-1]
+
+    # Sniffed content type wins over the extension
+    if content_type == "application/pdf":
+        ext = 'pdf'
+    elif content_type in VISUAL_CONTENT_TYPES:
+        return PipelineType.VISUAL
     
     if ext == 'pdf':
         try:
             # Content-Based Detection for Digital Signatures
-            with open(filename, 'rb') as f:
-                r = PdfFileReader(f)
-                if len(r.embedded_signatures) > 0:
+            owns_document = document is None
+            with (DocumentContext(filename) if owns_document else contextlib.nullcontext(document)) as doc:
+                if len(doc.embedded_signatures) > 0:
                     return PipelineType.CRYPTOGRAPHIC
-                else:
-                    pass
         except Exception as e:
             # Fallback or log error if file is unreadable (Structural pipeline handles malformed)
             pass
@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from services.artifact_writer import collect_artifact_refs
+
+# Bump whenever orchestrator, detector or scoring logic changes in a way that
+# alters the report. Cached reports produced by an older pipeline are ignored.
+PIPELINE_VERSION = "2026.10.6"
+
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+
+# Any change to these files means previously computed reports are stale
+MODEL_WEIGHT_PATHS = [
+    BACKEND_ROOT / "components" / "trufor" / "core" / "weights",
+    BACKEND_ROOT / "components" / "segformer" / "weights.pt",
+]
+
+
+def compute_model_fingerprint() -> str:
+    """
+    Fingerprint of the deployed model weights (path, size, mtime).
+    Walks the weight directories, so it is computed when the index is built
+    and again after model warm-up, never per lookup.
+    """
+    parts = [os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")]
+    for root in MODEL_WEIGHT_PATHS:
+        if root.is_dir():
+            candidates = sorted(p for p in root.rglob("*") if p.is_file())
+        elif root.exists():
+            candidates = [root]
+        else:
+            parts.append(f"{root.name}:missing")
+            continue
+
+        for p in candidates:
+            st = p.stat()
+            parts.append(f"{p.name}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+class ResultIndex:
+    """
+    Content-addressed index of finished analyses.
+    Key: (sha256 of the upload, analysis profile, model fingerprint, PIPELINE_VERSION).
+    Entries expire after ttl_seconds and the least recently used entry is
+    evicted once max_entries is reached. The model fingerprint is taken once;
+    refresh_fingerprint() re-reads it (after warm-up has loaded the weights).
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = compute_model_fingerprint()
+        self.hits = 0
+        self.misses = 0
+
+    def refresh_fingerprint(self):
+        """Re-reads the weights fingerprint; different weights invalidate every stored report."""
+        current = compute_model_fingerprint()
+        with self._lock:
+            if current != self._fingerprint:
+                print("Model weights changed. Invalidating result index.")
+                self._entries.clear()
+                self._fingerprint = current
+
+    def _key(self, content_hash: str, profile: str):
+        return (content_hash, profile, self._fingerprint, PIPELINE_VERSION)
+
+    def version(self) -> str:
+        """Pipeline version + model fingerprint; persisted results carry it so stale ones are not reused."""
+        with self._lock:
+            return f"{PIPELINE_VERSION}|{self._fingerprint}"
+
+    def get(self, content_hash: str, profile: str = "standard"):
+        """
+        Returns the stored response for this content hash and profile, or None.
+        Entries whose artifacts were removed from disk are dropped.
+        """
+        with self._lock:
+            key = self._key(content_hash, profile)
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expired = time.time() - entry["stored_at"] > self.ttl_seconds
+            missing = any(not os.path.exists(p) for p in entry["artifacts"])
+            if expired or missing:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+
+    def contains(self, content_hash: str, profile: str = "standard") -> bool:
+        """Whether get() would likely hit; does not count as a lookup or touch the LRU order."""
+        with self._lock:
+            entry = self._entries.get(self._key(content_hash, profile))
+            return entry is not None and time.time() - entry["stored_at"] <= self.ttl_seconds
+
+    def put(self, content_hash: str, response: dict, artifacts=None, profile: str = "standard"):
+        """
+        Stores a finished response. `artifacts` lists the files the report
+        refers to, so a hit is only served while they still exist.
+        """
+        with self._lock:
+            key = self._key(content_hash, profile)
+            self._entries[key] = {
+                "response": response,
+                "artifacts": list(artifacts or []),
+                "stored_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "pipeline_version": PIPELINE_VERSION,
+            }
+
+
+def collect_report_artifacts(report: dict, directory: str) -> list:
+    """
+    Lists the on-disk files referenced by a pipeline report
+    (ELA / noise / TruFor / SegFormer overlays and extracted embedded images).
+    """
+    names = [ref["id"] for ref in collect_artifact_refs(report)]
+
+    def visit(details):
+        if not isinstance(details, dict):
+            return
+        for img in details.get("analyzed_images", []) or []:
+            if img.get("filename"):
+                names.append(img["filename"])
+            visit(img.get("visual_report", {}).get("details", {}))
+
+    visit(report.get("details", {}))
+    return [os.path.join(directory, n) for n in names]
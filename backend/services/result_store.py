@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+DEFAULT_BACKEND = "sqlite"
+
+# Finished results stay readable through GET /api/result/{task_id} this long
+RESULT_STORE_TTL_SECONDS = int(os.getenv("RESULT_STORE_TTL_SECONDS", "604800"))
+# Expired rows are deleted at most this often (piggybacks on writes)
+RESULT_STORE_PURGE_INTERVAL_SECONDS = int(os.getenv("RESULT_STORE_PURGE_INTERVAL_SECONDS", "600"))
+
+
+def encode_result(response: dict) -> bytes:
+    return zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_result(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class MemoryResultStore:
+    """
+    Single-process result store (lost on restart). Same interface as
+    SQLiteResultStore; results are kept compressed either way.
+    """
+
+    def __init__(self, ttl_seconds: int = RESULT_STORE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def put(self, task_id: str, response: dict, content_hash: str = None, profile: str = None,
+            version: str = None, artifacts=None, reusable: bool = False) -> dict:
+        now = time.time()
+        row = {
+            "task_id": task_id,
+            "content_hash": content_hash,
+            "profile": profile,
+            "version": version,
+            "artifacts": list(artifacts or []),
+            "reusable": reusable,
+            "blob": encode_result(response),
+            "stored_at": now,
+            "expires_at": now + self.ttl_seconds,
+        }
+        with self._lock:
+            self._rows[task_id] = row
+            self._purge(now)
+        return {"stored_at": row["stored_at"], "expires_at": row["expires_at"], "size": len(row["blob"])}
+
+    def get(self, task_id: str):
+        with self._lock:
+            row = self._rows.get(task_id)
+        if row is None or row["expires_at"] <= time.time():
+            return None
+        return {"response": decode_result(row["blob"]), "stored_at": row["stored_at"], "expires_at": row["expires_at"]}
+
+    def get_by_hash(self, content_hash: str, profile: str, version: str):
+        now = time.time()
+        with self._lock:
+            rows = [r for r in self._rows.values()
+                    if r["reusable"] and r["content_hash"] == content_hash and r["profile"] == profile
+                    and r["version"] == version and r["expires_at"] > now]
+        if not rows:
+            return None
+        row = max(rows, key=lambda r: r["stored_at"])
+        return {"response": decode_result(row["blob"]), "artifacts": row["artifacts"], "task_id": row["task_id"]}
+
+    def _purge(self, now: float):
+        for task_id in [tid for tid, r in self._rows.items() if r["expires_at"] <= now]:
+            del self._rows[task_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "results": len(self._rows),
+                    "compressed_bytes": sum(len(r["blob"]) for r in self._rows.values())}
+
+
+class SQLiteResultStore:
+    """
+    Finished analyses in a SQLite file on the uploads volume, so polling
+    clients, other workers and a restarted server can read them without
+    rerunning any pipeline. One row per task_id; reports are stored as
+    zlib-compressed JSON and expire after ttl_seconds.
+    Rows marked reusable (complete verdicts) are also found by content hash.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int = RESULT_STORE_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    task_id TEXT PRIMARY KEY,
+                    content_hash TEXT,
+                    profile TEXT,
+                    version TEXT,
+                    artifacts TEXT NOT NULL,
+                    reusable INTEGER NOT NULL,
+                    response BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_by_hash ON results (content_hash, profile, version)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_by_expiry ON results (expires_at)")
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers in other workers proceed during writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, task_id: str, response: dict, content_hash: str = None, profile: str = None,
+            version: str = None, artifacts=None, reusable: bool = False) -> dict:
+        """
+        Stores a finished response under task_id (replacing any previous one).
+        `version` identifies the pipeline/models that produced it; hash lookups
+        only return rows with the caller's current version.
+        """
+        blob = encode_result(response)
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (task_id, content_hash, profile, version, artifacts, reusable, response, stored_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, content_hash, profile, version, json.dumps(list(artifacts or [])), int(reusable), blob, now, expires_at),
+            )
+            if now - self._last_purge >= RESULT_STORE_PURGE_INTERVAL_SECONDS:
+                self._last_purge = now
+                conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        return {"stored_at": now, "expires_at": expires_at, "size": len(blob)}
+
+    def get(self, task_id: str):
+        """Returns {response, stored_at, expires_at} or None (unknown or expired)."""
+        row = self._connect().execute(
+            "SELECT response, stored_at, expires_at FROM results WHERE task_id = ? AND expires_at > ?",
+            (task_id, time.time()),
+        ).fetchone()
+        if not row:
+            return None
+        return {"response": decode_result(row[0]), "stored_at": row[1], "expires_at": row[2]}
+
+    def get_by_hash(self, content_hash: str, profile: str, version: str):
+        """Newest reusable result for identical bytes, profile and version: {response, artifacts, task_id} or None."""
+        row = self._connect().execute(
+            "SELECT response, artifacts, task_id FROM results "
+            "WHERE content_hash = ? AND profile = ? AND version = ? AND reusable = 1 AND expires_at > ? "
+            "ORDER BY stored_at DESC LIMIT 1",
+            (content_hash, profile, version, time.time()),
+        ).fetchone()
+        if not row:
+            return None
+        return {"response": decode_result(row[0]), "artifacts": json.loads(row[1]), "task_id": row[2]}
+
+    def stats(self) -> dict:
+        row = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM results WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return {"backend": "sqlite", "results": row[0], "compressed_bytes": row[1]}
+
+
+def create_result_store(data_dir: str):
+    """
+    Builds the store selected by RESULT_STORE_BACKEND ("sqlite" | "memory").
+    The SQLite file lives in the data directory unless RESULT_STORE_DB is set;
+    never put it in the uploads directory, whose files are reachable over HTTP.
+    """
+    backend = os.getenv("RESULT_STORE_BACKEND", DEFAULT_BACKEND).lower()
+    if backend == "memory":
+        return MemoryResultStore()
+    db_path = os.getenv("RESULT_STORE_DB", os.path.join(data_dir, "results.sqlite3"))
+    print(f"Result store: SQLite ({db_path})")
+    return SQLiteResultStore(db_path)
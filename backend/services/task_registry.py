@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# "memory" is fine for a single uvicorn worker. Multiple workers behind one
+# uploads volume must share state, so they default to the SQLite backend.
+DEFAULT_BACKEND = "sqlite" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "memory"
+
+
+class MemoryTaskRegistry:
+    """
+    Per-process task registry: task_id -> upload metadata (dict lookup).
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def register(self, task_id: str, **fields) -> dict:
+        record = {"task_id": task_id, "created_at": time.time(), **fields}
+        with self._lock:
+            self._tasks[task_id] = record
+        return record
+
+    def get(self, task_id: str):
+        with self._lock:
+            record = self._tasks.get(task_id)
+            return dict(record) if record else None
+
+    def update(self, task_id: str, **fields):
+        with self._lock:
+            if task_id in self._tasks:
+                self._tasks[task_id].update(fields)
+
+    def remove(self, task_id: str):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+
+class SQLiteTaskRegistry:
+    """
+    Task registry backed by a SQLite file on the shared uploads volume,
+    so a WebSocket served by any worker can resolve any upload.
+    Lookups are primary-key reads.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    record TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers in other workers proceed during writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, task_id: str, **fields) -> dict:
+        record = {"task_id": task_id, "created_at": time.time(), **fields}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, record, created_at) VALUES (?, ?, ?)",
+                (task_id, json.dumps(record), record["created_at"]),
+            )
+        return record
+
+    def get(self, task_id: str):
+        row = self._connect().execute("SELECT record FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id: str, **fields):
+        with self._connect() as conn:
+            row = conn.execute("SELECT record FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if not row:
+                return
+            record = json.loads(row[0])
+            record.update(fields)
+            conn.execute("UPDATE tasks SET record = ? WHERE task_id = ?", (json.dumps(record), task_id))
+
+    def remove(self, task_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+
+def create_task_registry(data_dir: str):
+    """
+    Builds the registry selected by TASK_REGISTRY_BACKEND ("memory" | "sqlite").
+    The SQLite file lives in the data directory unless TASK_REGISTRY_DB is set;
+    never put it in the uploads directory, whose files are reachable over HTTP.
+    """
+    backend = os.getenv("TASK_REGISTRY_BACKEND", DEFAULT_BACKEND).lower()
+    if backend == "sqlite":
+        db_path = os.getenv("TASK_REGISTRY_DB", os.path.join(data_dir, "task_registry.sqlite3"))
+        print(f"Task registry: SQLite ({db_path})")
+        return SQLiteTaskRegistry(db_path)
+    return MemoryTaskRegistry()
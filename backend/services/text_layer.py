@@ -0,0 +1,157 @@
+import os
+import time
+import signal
+import asyncio
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+from services.metrics import CACHE_REQUESTS
+from services.cancellation import checkpoint
+
+TEXT_EXTRACTION_WORKERS = int(os.getenv("TEXT_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages with pathological content streams are cut off instead of stalling the document
+TEXT_PAGE_BUDGET_SECONDS = float(os.getenv("TEXT_PAGE_BUDGET_SECONDS", "5"))
+TEXT_PAGES_PER_TASK = int(os.getenv("TEXT_PAGES_PER_TASK", "8"))
+TEXT_LAYER_CACHE_MAX_ENTRIES = int(os.getenv("TEXT_LAYER_CACHE_MAX_ENTRIES", "64"))
+# How often a running extraction checks whether its analysis was cancelled
+CANCEL_POLL_SECONDS = 0.25
+
+
+# --- Worker side (runs in the process pool) ---
+
+class PageBudgetExceeded(Exception):
+    pass
+
+
+def _on_budget_exceeded(signum, frame):
+    raise PageBudgetExceeded()
+
+
+# Per-process reader cache: consecutive page ranges of one document parse it once per worker
+_worker_readers = OrderedDict()
+
+
+def _worker_reader(path: str):
+    key = (path, os.stat(path).st_mtime_ns)
+    reader = _worker_readers.get(key)
+    if reader is None:
+        reader = PdfReader(path)
+        _worker_readers[key] = reader
+        while len(_worker_readers) > 2:
+            _worker_readers.popitem(last=False)
+    return reader
+
+
+def extract_page_range(path: str, start: int, stop: int, budget_seconds: float) -> list:
+    """Extracts pages [start, stop). Each page gets at most budget_seconds (SIGALRM)."""
+    reader = _worker_reader(path)
+    use_alarm = budget_seconds > 0 and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_budget_exceeded)
+
+    pages = []
+    for index in range(start, stop):
+        began = time.perf_counter()
+        entry = {"index": index, "text": "", "char_count": 0, "status": "ok"}
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, budget_seconds)
+            entry["text"] = reader.pages[index].extract_text() or ""
+            entry["char_count"] = len(entry["text"])
+        except PageBudgetExceeded:
+            entry["status"] = "timeout"
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = str(e)
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        entry["elapsed_ms"] = round((time.perf_counter() - began) * 1000, 1)
+        pages.append(entry)
+    return pages
+
+
+# --- Parent side ---
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: never fork a parent that holds model threads
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(1, TEXT_EXTRACTION_WORKERS),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def extract_text_layer(document, content_hash: str = None) -> dict:
+    """
+    Text layer of a PDF, extracted page-parallel in a process pool.
+    Only runs when a consumer asks for it; results are cached by content hash.
+
+    Returns:
+        {"page_count", "char_count", "pages": [{"index", "text", "char_count",
+         "status": ok|timeout|error, "elapsed_ms"}], "elapsed_ms", "cached"}
+    """
+    if content_hash and content_hash in _cache:
+        _cache.move_to_end(content_hash)
+        CACHE_REQUESTS.inc(cache="text_layer", result="hit")
+        return {**_cache[content_hash], "cached": True}
+    CACHE_REQUESTS.inc(cache="text_layer", result="miss")
+
+    began = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    # Page count comes from the task's already-parsed document
+    page_count = await loop.run_in_executor(None, lambda: len(document.pypdf_reader.pages))
+
+    checkpoint()
+    pool = _get_pool()
+    # Workers keep the working directory they were started in; never hand them a relative path
+    path = os.path.abspath(document.path)
+    futures = [
+        pool.submit(extract_page_range, path, start,
+                    min(start + TEXT_PAGES_PER_TASK, page_count), TEXT_PAGE_BUDGET_SECONDS)
+        for start in range(0, page_count, TEXT_PAGES_PER_TASK)
+    ]
+    # A cancelled or expired analysis stops waiting; page ranges no worker has picked up are dropped
+    chunks = [asyncio.wrap_future(f) for f in futures]
+    try:
+        pending = set(chunks)
+        while pending:
+            checkpoint()
+            _, pending = await asyncio.wait(pending, timeout=CANCEL_POLL_SECONDS)
+    finally:
+        for f in futures:
+            f.cancel()
+    pages = [page for chunk in chunks for page in chunk.result()]
+
+    layer = {
+        "page_count": page_count,
+        "char_count": sum(p["char_count"] for p in pages),
+        "pages": pages,
+        "elapsed_ms": round((time.perf_counter() - began) * 1000, 1),
+    }
+    if content_hash:
+        _cache[content_hash] = layer
+        while len(_cache) > TEXT_LAYER_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return {**layer, "cached": False}
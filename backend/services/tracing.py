@@ -0,0 +1,181 @@
+import os
+import time
+import resource
+import contextvars
+from contextlib import contextmanager
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "veridoc-backend")
+
+# The span new spans attach to; copied into tasks created by asyncio.gather / create_task
+_current_span = contextvars.ContextVar("veridoc_current_span", default=None)
+
+
+def _peak_rss_kb() -> int:
+    # Linux reports ru_maxrss in KiB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Span:
+    """
+    One timed operation.
+    - wall_ms: elapsed wall time
+    - cpu_ms: process CPU time consumed while the span was open (spans running
+      concurrently overlap, so siblings can add up to more than their parent)
+    - rss_peak_delta_kb: growth of the process peak RSS during the span
+      (0 when the span stayed below an earlier peak)
+    """
+
+    def __init__(self, trace, name: str, parent=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.status = "ok"
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._perf_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._rss_start = _peak_rss_kb()
+        self.wall_ms = None
+        self.cpu_ms = None
+        self.rss_peak_delta_kb = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self, error: BaseException = None):
+        self.end_ns = time.time_ns()
+        self.wall_ms = round((time.perf_counter() - self._perf_start) * 1000, 2)
+        self.cpu_ms = round((time.process_time() - self._cpu_start) * 1000, 2)
+        self.rss_peak_delta_kb = max(0, _peak_rss_kb() - self._rss_start)
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent.span_id if self.parent else None,
+            "start_unix_nano": self.start_ns,
+            "end_unix_nano": self.end_ns,
+            "wall_ms": self.wall_ms,
+            "cpu_ms": self.cpu_ms,
+            "rss_peak_delta_kb": self.rss_peak_delta_kb,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Trace:
+    """
+    Span tree of one analysis. start() opens the root span and makes it current,
+    so span() calls anywhere below (including gathered sub-tasks) nest under it.
+    """
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(self, name, attributes=attributes)
+        self._token = None
+
+    def start(self):
+        self._token = _current_span.set(self.root)
+        return self
+
+    def finish(self, error: BaseException = None):
+        # Idempotent: the root may be closed before the report is sent and again on exit
+        if self.root.end_ns is None:
+            self.root.finish(error)
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "service": SERVICE_NAME, "root": self.root.to_dict()}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block as a child of the current span.
+    Outside of a trace (scripts, batch jobs without tracing) this is a no-op.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    current = Span(parent.trace, name, parent=parent, attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_span.reset(token)
+
+
+# --- OpenTelemetry export ---
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def trace_to_otlp(trace_dict: dict) -> dict:
+    """
+    Converts Trace.to_dict() output into OTLP/JSON (ExportTraceServiceRequest),
+    accepted by OpenTelemetry collectors on /v1/traces.
+    """
+    spans = []
+
+    def walk(node):
+        attributes = dict(node.get("attributes") or {})
+        attributes.update({
+            "veridoc.wall_ms": node.get("wall_ms"),
+            "veridoc.cpu_ms": node.get("cpu_ms"),
+            "veridoc.rss_peak_delta_kb": node.get("rss_peak_delta_kb"),
+        })
+        status = {"code": 2, "message": node["error"]} if node.get("status") == "error" else {"code": 1}
+        entry = {
+            "traceId": trace_dict["trace_id"],
+            "spanId": node["span_id"],
+            "name": node["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(node["start_unix_nano"]),
+            "endTimeUnixNano": str(node["end_unix_nano"] or node["start_unix_nano"]),
+            "attributes": _otlp_attributes(attributes),
+            "status": status,
+        }
+        if node.get("parent_span_id"):
+            entry["parentSpanId"] = node["parent_span_id"]
+        spans.append(entry)
+        for child in node.get("children", []):
+            walk(child)
+
+    walk(trace_dict["root"])
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": trace_dict.get("service", SERVICE_NAME)})},
+            "scopeSpans": [{"scope": {"name": "veridoc.analysis"}, "spans": spans}],
+        }]
+    }
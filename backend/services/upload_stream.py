@@ -0,0 +1,173 @@
+import os
+import asyncio
+import hashlib
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from services.pipeline_orchestrator import sniff_content_type, VISUAL_CONTENT_TYPES, PipelineType
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Multipart framing (boundaries, part headers, small form fields) allowed on top of a body limit
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Stored extension per sniffed type (keeps artifact names and routing consistent)
+CONTENT_TYPE_EXTENSIONS = {
+    "application/pdf": "pdf",
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/tiff": "tiff",
+    "image/webp": "webp",
+    "image/bmp": "bmp",
+}
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused. Carries the HTTP status to return."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RequestBodyLimit:
+    """
+    ASGI middleware capping request bodies per path while they are received.
+
+    Starlette parses a multipart form completely (spooling files to temporary
+    storage) before the endpoint runs, so a limit checked in the endpoint only
+    applies after the whole body was read. Here a declared Content-Length over
+    the limit is refused up front, and a body without one (chunked) is counted
+    chunk by chunk: the request fails with 413 as soon as it passes the limit.
+    `limits` maps a path to its payload limit; MULTIPART_OVERHEAD_BYTES is added for the framing.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = {path: limit + MULTIPART_OVERHEAD_BYTES for path, limit in limits.items()}
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        message = f"Request body exceeds the {limit} byte limit"
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await JSONResponse({"detail": message}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            event = await receive()
+            if event["type"] == "http.request":
+                received += len(event.get("body", b""))
+                if received > limit:
+                    # Raised inside the form parser; FastAPI passes HTTPExceptions through
+                    raise HTTPException(413, message)
+            return event
+
+        await self.app(scope, limited_receive, send)
+
+
+def _resolve_target(first_chunk: bytes, upload_dir: str, task_id: str):
+    """Sniffs the first chunk -> (content_type, pipeline_hint, filename, file_path)."""
+    content_type = sniff_content_type(first_chunk[:1024])
+    if content_type is None:
+        raise UploadRejected(415, "Unsupported file type (expected PDF, JPEG, PNG, TIFF or WebP)")
+
+    # Images never need the PDF signature probe, so routing is settled here
+    pipeline_hint = PipelineType.VISUAL.value if content_type in VISUAL_CONTENT_TYPES else None
+
+    filename = f"{task_id}.{CONTENT_TYPE_EXTENSIONS[content_type]}"
+    return content_type, pipeline_hint, filename, os.path.join(upload_dir, filename)
+
+
+def copy_stream_to_disk(source, upload_dir: str, task_id: str, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """
+    Synchronous counterpart of stream_upload_to_disk for sources that are
+    already being read inside an executor (e.g. members of a zip archive).
+    """
+    first_chunk = source.read(UPLOAD_CHUNK_SIZE)
+    content_type, pipeline_hint, filename, file_path = _resolve_target(first_chunk, upload_dir, task_id)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(file_path, "wb") as fh:
+            chunk = first_chunk
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"File exceeds the {max_bytes} byte upload limit")
+                digest.update(chunk)
+                fh.write(chunk)
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return {
+        "path": file_path,
+        "filename": filename,
+        "content_type": content_type,
+        "pipeline_hint": pipeline_hint,
+        "size": size,
+        "sha256": digest.hexdigest(),
+    }
+
+
+async def stream_upload_to_disk(upload, upload_dir: str, task_id: str, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """
+    Streams an UploadFile to disk without blocking the event loop.
+
+    1. The first chunk is sniffed for magic bytes, so the file type (and for
+       images the pipeline) is known before the rest is written.
+    2. Chunks are hashed (SHA-256) and written inside the default executor.
+    3. The size cap is enforced while streaming; oversized partial files are removed.
+    By the time the endpoint runs, Starlette has already spooled the multipart
+    body; RequestBodyLimit is what keeps an oversized body from being received at all.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(413, f"File exceeds the {max_bytes} byte upload limit")
+
+    first_chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+    content_type, pipeline_hint, filename, file_path = _resolve_target(first_chunk, upload_dir, task_id)
+
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    size = 0
+
+    def write_chunk(fh, chunk):
+        digest.update(chunk)
+        fh.write(chunk)
+
+    fh = await loop.run_in_executor(None, open, file_path, "wb")
+    try:
+        chunk = first_chunk
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(413, f"File exceeds the {max_bytes} byte upload limit")
+            await loop.run_in_executor(None, write_chunk, fh, chunk)
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        await loop.run_in_executor(None, fh.close)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    await loop.run_in_executor(None, fh.close)
+
+    return {
+        "path": file_path,
+        "filename": filename,
+        "content_type": content_type,
+        "pipeline_hint": pipeline_hint,
+        "size": size,
+        "sha256": digest.hexdigest(),
+    }
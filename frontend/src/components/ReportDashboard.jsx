@@ -11,6 +11,13 @@ import { BarChart, Bar, XAxis, YAxis, Tooltip as RechartsTooltip, ResponsiveCont
 import jsPDF from 'jspdf';
 import 'jspdf-autotable';
 
+// Originals and overlays: immutable, ETag'd responses (nginx sends the bytes when X-Accel-Redirect is enabled)
+const ARTIFACT_BASE_URL = `${import.meta.env.VITE_ARTIFACT_URL || import.meta.env.VITE_API_URL}/api/artifacts`;
+// Report image fields hold artifact names (older reports may still carry inline data: URLs)
+// Detector images arrive as artifact references ({ id, kind, width, height, ... })
+const artifactId = (ref) => (typeof ref === 'string' ? ref : ref?.id);
+const artifactUrl = (ref) => (artifactId(ref)?.startsWith('data:') ? artifactId(ref) : `${ARTIFACT_BASE_URL}/${artifactId(ref)}`);
+
 // --- Sub-Components ---
 
 function ScoreRing({ score, isSuspicious }) {
@@ -114,22 +121,22 @@ const Lightbox = ({ isOpen, onClose, data, activeLayer, setActiveLayer }) => {
                             transition={{ type: 'spring', damping: 20 }}
                         >
                             <img
-                                src={`http://localhost:8000/static/uploads/${currentFilename}`}
+                                src={`${ARTIFACT_BASE_URL}/${currentFilename}`}
                                 alt="Document Fullscreen"
                                 className="block max-h-[75vh] w-auto object-contain rounded-lg"
                             />
                             {/* Overlays */}
-                            {activeLayer === 'heatmap' && currentDetails?.semantic_segmentation?.heatmap_image && (
-                                <img src={currentDetails.semantic_segmentation.heatmap_image} className="absolute inset-0 w-full h-full object-contain pointer-events-none z-10" />
+                            {activeLayer === 'heatmap' && currentDetails?.semantic_segmentation?.artifact && (
+                                <img src={artifactUrl(currentDetails.semantic_segmentation.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none z-10" />
                             )}
-                            {activeLayer === 'trufor' && currentDetails?.trufor?.heatmap_path && (
-                                <img src={`http://localhost:8000/static/uploads/${currentDetails.trufor.heatmap_path}`} className="absolute inset-0 w-full h-full object-contain pointer-events-none opacity-90 z-10" />
+                            {activeLayer === 'trufor' && currentDetails?.trufor?.artifact && (
+                                <img src={artifactUrl(currentDetails.trufor.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none opacity-90 z-10" />
                             )}
-                            {activeLayer === 'ela' && currentDetails?.ela?.ela_image_path && (
-                                <img src={`http://localhost:8000/static/uploads/${currentDetails.ela.ela_image_path}`} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
+                            {activeLayer === 'ela' && currentDetails?.ela?.artifact && (
+                                <img src={artifactUrl(currentDetails.ela.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
                             )}
-                            {activeLayer === 'noise' && currentDetails?.noise_analysis?.noise_map_path && (
-                                <img src={`http://localhost:8000/static/uploads/${currentDetails.noise_analysis.noise_map_path}`} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
+                            {activeLayer === 'noise' && currentDetails?.noise_analysis?.artifact && (
+                                <img src={artifactUrl(currentDetails.noise_analysis.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
                             )}
                             {activeLayer === 'ai_analysis' && boundingBoxes.map((box, idx) => {
                                 const [ymin, xmin, ymax, xmax] = box.box_2d;
@@ -173,7 +180,8 @@ export function ReportDashboard({ data, onReset }) {
     const { report, pipeline_used, reasoning } = data;
     const aiScore = reasoning?.authenticity_score ?? 0;
     const aiIssues = reasoning?.flagged_issues || [];
-    const aiDetail = reasoning?.reasoning;
+    const aiDetail = reasoning?.reasoning
+        || (reasoning?.fallback ? `${reasoning.error}. The score was computed from local forensics only.` : undefined);
     const modelName = reasoning?.model_name || "Gemini AI";
 
     const isSuspicious = aiScore < 70;
@@ -188,6 +196,15 @@ export function ReportDashboard({ data, onReset }) {
     // Lightbox State
     const [showLightbox, setShowLightbox] = useState(false);
 
+    // Keep this report's files alive on the server while the dashboard is open
+    useEffect(() => {
+        if (!data?.task_id) return;
+        const renewLease = () => fetch(`${import.meta.env.VITE_API_URL}/api/tasks/${data.task_id}/lease`, { method: 'POST' }).catch(() => {});
+        renewLease();
+        const timer = setInterval(renewLease, 60000);
+        return () => clearInterval(timer);
+    }, [data?.task_id]);
+
     const handleZoomIn = () => setZoomLevel(prev => Math.min(prev + 0.5, 4));
     const handleZoomOut = () => setZoomLevel(prev => Math.max(prev - 0.5, 1));
     const handleMaximize = () => setShowLightbox(true);
@@ -208,10 +225,10 @@ export function ReportDashboard({ data, onReset }) {
 
     // --- Conditional Layer Logic ---
     const availableLayers = ['original'];
-    if (currentDetails?.semantic_segmentation?.heatmap_image) availableLayers.push('heatmap');
-    if (currentDetails?.trufor?.heatmap_path) availableLayers.push('trufor');
-    if (currentDetails?.ela?.ela_image_path) availableLayers.push('ela');
-    if (currentDetails?.noise_analysis?.noise_map_path) availableLayers.push('noise');
+    if (currentDetails?.semantic_segmentation?.artifact) availableLayers.push('heatmap');
+    if (currentDetails?.trufor?.artifact) availableLayers.push('trufor');
+    if (currentDetails?.ela?.artifact) availableLayers.push('ela');
+    if (currentDetails?.noise_analysis?.artifact) availableLayers.push('noise');
     if (boundingBoxes.length > 0) availableLayers.push('ai_analysis');
 
     // --- Smart Box Logic ---
@@ -328,7 +345,7 @@ export function ReportDashboard({ data, onReset }) {
 
                 try {
                     // Fetch image via proxy or ensure CORS is handled
-                    const img = await loadImage(`http://localhost:8000/static/uploads/${url}`);
+                    const img = await loadImage(`${ARTIFACT_BASE_URL}/${url}`);
                     const ratio = img.height / img.width;
                     const targetW = 120;
                     const targetH = targetW * ratio;
@@ -351,19 +368,19 @@ export function ReportDashboard({ data, onReset }) {
 
             await drawLayer("Original Document", currentFilename, "The unprocessed input file.");
 
-            if (currentDetails?.semantic_segmentation?.heatmap_image)
+            if (currentDetails?.semantic_segmentation?.artifact)
                 await drawLayer("Splice Detection (SegFormer)",
-                    currentDetails.semantic_segmentation.heatmap_image.split('/').pop(), // Extract filename
+                    artifactId(currentDetails.semantic_segmentation.artifact),
                     "Red areas indicate regions with high probability of digital manipulation such as splicing or copy-move.");
 
-            if (currentDetails?.trufor?.heatmap_path)
+            if (currentDetails?.trufor?.artifact)
                 await drawLayer("Sensor Noise Analysis (TruFor)",
-                    currentDetails.trufor.heatmap_path,
+                    artifactId(currentDetails.trufor.artifact),
                     "Highlights inconsistencies in camera sensor noise patterns. Alien content often disrupts the uniform noise field.");
 
-            if (currentDetails?.ela?.ela_image_path)
+            if (currentDetails?.ela?.artifact)
                 await drawLayer("Error Level Analysis (ELA)",
-                    currentDetails.ela.ela_image_path,
+                    artifactId(currentDetails.ela.artifact),
                     "Visualizes compression artifacts. Bright white noise often suggests the image was recently resaved or edited.");
         }
 
@@ -390,8 +407,8 @@ Digital Signatures:
 ${hasSignatures ? report.details.signatures.map(s => `- ${s.signer_name || s.field}: ${s.valid ? 'VALID' : 'INVALID'} (${s.trusted ? 'Trusted' : 'Untrusted'})`).join('\n') : '- None found.'}
 
 Visual Analysis Layers:
-- SegFormer: ${currentDetails?.semantic_segmentation?.heatmap_image ? 'Tampering Detected' : 'Clean'}
-- TruFor: ${currentDetails?.trufor?.heatmap_path ? 'Anomalies Found' : 'Clean'}
+- SegFormer: ${currentDetails?.semantic_segmentation?.artifact ? 'Tampering Detected' : 'Clean'}
+- TruFor: ${currentDetails?.trufor?.artifact ? 'Anomalies Found' : 'Clean'}
 `;
 
         if (navigator.share) {
@@ -539,22 +556,22 @@ Visual Analysis Layers:
                                 transition={{ type: 'spring', damping: 20 }}
                             >
                                 <img
-                                    src={`http://localhost:8000/static/uploads/${currentFilename}`}
+                                    src={`${ARTIFACT_BASE_URL}/${currentFilename}`}
                                     alt="Document"
                                     className="block max-h-[420px] w-auto object-contain pointer-events-none rounded-lg"
                                 />
                                 {/* Overlays */}
-                                {activeLayer === 'heatmap' && currentDetails?.semantic_segmentation?.heatmap_image && (
-                                    <img src={currentDetails.semantic_segmentation.heatmap_image} className="absolute inset-0 w-full h-full object-contain pointer-events-none z-10" />
+                                {activeLayer === 'heatmap' && currentDetails?.semantic_segmentation?.artifact && (
+                                    <img src={artifactUrl(currentDetails.semantic_segmentation.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none z-10" />
                                 )}
-                                {activeLayer === 'trufor' && currentDetails?.trufor?.heatmap_path && (
-                                    <img src={`http://localhost:8000/static/uploads/${currentDetails.trufor.heatmap_path}`} className="absolute inset-0 w-full h-full object-contain pointer-events-none opacity-90 z-10" />
+                                {activeLayer === 'trufor' && currentDetails?.trufor?.artifact && (
+                                    <img src={artifactUrl(currentDetails.trufor.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none opacity-90 z-10" />
                                 )}
-                                {activeLayer === 'ela' && currentDetails?.ela?.ela_image_path && (
-                                    <img src={`http://localhost:8000/static/uploads/${currentDetails.ela.ela_image_path}`} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
+                                {activeLayer === 'ela' && currentDetails?.ela?.artifact && (
+                                    <img src={artifactUrl(currentDetails.ela.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
                                 )}
-                                {activeLayer === 'noise' && currentDetails?.noise_analysis?.noise_map_path && (
-                                    <img src={`http://localhost:8000/static/uploads/${currentDetails.noise_analysis.noise_map_path}`} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
+                                {activeLayer === 'noise' && currentDetails?.noise_analysis?.artifact && (
+                                    <img src={artifactUrl(currentDetails.noise_analysis.artifact)} className="absolute inset-0 w-full h-full object-contain pointer-events-none mix-blend-screen opacity-90 z-10" />
                                 )}
                                 {activeLayer === 'ai_analysis' && boundingBoxes.map((box, idx) => {
                                     const [ymin, xmin, ymax, xmax] = box.box_2d;
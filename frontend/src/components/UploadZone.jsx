@@ -115,39 +115,60 @@ export function UploadZone({ onUploadComplete }) {
             if (!uploadResponse.ok) throw new Error('Upload failed');
             const { task_id } = await uploadResponse.json();
 
-            // WebSocket
-            const ws = new WebSocket(`${import.meta.env.VITE_API_URL.replace('https', 'wss')}/ws/analyze/${task_id}`);
-
-            ws.onopen = () => {
-                setQueue(prev => [...prev, { step: 'CONNECT', message: 'Connected to VeriDoc Analysis Engine...' }]);
-            };
-
-            ws.onmessage = (event) => {
-                const data = JSON.parse(event.data);
-
-                if (data.status === 'error') {
-                    setError(data.message);
-                    ws.close();
-                    setIsUploading(false);
-                } else if (data.status === 'complete') {
-                    // Force complete all steps
-                    setSteps(prev => prev.map(s => ({ ...s, status: 'complete' })));
-                    setQueue(prev => [...prev, { step: 'COMPLETE', message: 'Analysis Verified. finalize()' }]);
-
-                    // Allow the final queue items to drain before finishing
-                    setTimeout(() => {
-                        onUploadComplete(data.data);
-                    }, 2500); // Give time for the queue to drain visibly
-                } else {
-                    // Push to Queue
-                    setQueue(prev => [...prev, data]);
-                }
+            // WebSocket (the analysis runs server-side; on a dropped connection we
+            // reconnect and the server replays every event after `lastSeq`)
+            let lastSeq = 0;
+            let report = null; // sent once in ANALYSIS_COMPLETE; COMPLETE only carries the delta
+            let finished = false;
+            let attempts = 0;
+
+            const connect = () => {
+                const ws = new WebSocket(`${import.meta.env.VITE_API_URL.replace('https', 'wss')}/ws/analyze/${task_id}?last_event=${lastSeq}`);
+
+                ws.onopen = () => {
+                    attempts = 0;
+                    setQueue(prev => [...prev, { step: 'CONNECT', message: 'Connected to VeriDoc Analysis Engine...' }]);
+                };
+
+                ws.onmessage = (event) => {
+                    const data = JSON.parse(event.data);
+                    if (data.seq) lastSeq = data.seq;
+                    if (data.step === 'ANALYSIS_COMPLETE' && data.data) report = data.data;
+
+                    if (data.status === 'error') {
+                        finished = true;
+                        setError(data.message);
+                        ws.close();
+                        setIsUploading(false);
+                    } else if (data.status === 'complete') {
+                        finished = true;
+                        // Force complete all steps
+                        setSteps(prev => prev.map(s => ({ ...s, status: 'complete' })));
+                        setQueue(prev => [...prev, { step: 'COMPLETE', message: 'Analysis Verified. finalize()' }]);
+
+                        // Allow the final queue items to drain before finishing
+                        setTimeout(() => {
+                            onUploadComplete({ ...data.data, report: data.data.report ?? report });
+                        }, 2500); // Give time for the queue to drain visibly
+                    } else {
+                        // Push to Queue
+                        setQueue(prev => [...prev, data]);
+                    }
+                };
+
+                ws.onclose = () => {
+                    if (finished) return;
+                    if (attempts < 5) {
+                        attempts += 1;
+                        setTimeout(connect, 1000 * attempts);
+                    } else {
+                        setError("WebSocket connection failed");
+                        setIsUploading(false);
+                    }
+                };
             };
 
-            ws.onerror = () => {
-                setError("WebSocket connection failed");
-                setIsUploading(false);
-            };
+            connect();
 
         } catch (err) {
             setError(err.message);
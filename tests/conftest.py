@@ -0,0 +1,82 @@
+import io
+import os
+import sys
+import copy
+import shutil
+import tempfile
+
+import pytest
+
+# The backend is not an installed package: import its modules the way main.py does
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+# Configuration is read at import time; keep the app offline and local for every test module
+WORK_DIR = tempfile.mkdtemp(prefix="veridoc-tests-")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ["MODEL_WARMUP"] = "false"
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["LOCAL_STORAGE_DIR"] = os.path.join(WORK_DIR, "storage")
+os.environ["TASK_REGISTRY_BACKEND"] = "memory"
+
+
+@pytest.fixture(scope="session")
+def api():
+    """
+    (TestClient, main module) for the FastAPI app, run from a scratch directory
+    (uploads/ and the result store live there). Models are not warmed up.
+    """
+    from fastapi.testclient import TestClient
+
+    previous = os.getcwd()
+    os.chdir(WORK_DIR)
+    try:
+        import main
+        with TestClient(main.app) as client:
+            yield client, main
+    finally:
+        os.chdir(previous)
+
+
+@pytest.fixture
+def analyze(api, monkeypatch):
+    """
+    Runs uploads end to end through /api/upload and the WebSocket with the
+    models, storage and Gemini replaced by instant stand-ins.
+    Tests adjust analyze.report / analyze.reasoning before calling
+    analyze(data, **query), which returns (task_id, events).
+    Every call should use distinct bytes, or the result cache answers it.
+    """
+    client, main = api
+
+    async def structural(path, callback=None, document=None, profile=None):
+        return copy.deepcopy(run.report)
+
+    async def reasoning(document_uri, mime_type="application/pdf", local_report=None, deadline_seconds=None):
+        return dict(run.reasoning)
+
+    monkeypatch.setattr(main, "determine_pipeline", lambda path, mime_type, document=None: main.PipelineType.STRUCTURAL)
+    monkeypatch.setattr(main, "analyze_structural", structural)
+    monkeypatch.setattr(main, "run_semantic_reasoning_async", reasoning)
+
+    def run(data: bytes, filename: str = "doc.pdf", **query):
+        response = client.post("/api/upload", params=query,
+                               files={"file": (filename, io.BytesIO(data), "application/pdf")})
+        assert response.status_code == 200, response.text
+        task_id = response.json()["task_id"]
+        events = []
+        with client.websocket_connect(f"/ws/analyze/{task_id}") as ws:
+            while True:
+                event = ws.receive_json()
+                events.append(event)
+                if event.get("status") in ("complete", "error"):
+                    break
+        return task_id, events
+
+    run.report = {"score": 0.1, "flags": [], "details": {}}
+    run.reasoning = {"authenticity_score": 80, "summary": "Consistent document"}
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
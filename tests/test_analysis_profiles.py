@@ -0,0 +1,74 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+from services import analysis_profiles
+from services.analysis_profiles import PROFILES, UnknownProfile, get_profile, resolve_profile, _parse_key_profiles
+
+
+def test_explicit_profile_wins_over_the_api_key(monkeypatch):
+    monkeypatch.setattr(analysis_profiles, "API_KEY_PROFILES", {"bulk-key": "quick"})
+    assert resolve_profile("deep", "bulk-key") == "deep"
+    assert resolve_profile(None, "bulk-key") == "quick"
+    assert resolve_profile(None, "other-key") == analysis_profiles.DEFAULT_ANALYSIS_PROFILE
+
+
+def test_unknown_profile_is_refused():
+    with pytest.raises(UnknownProfile):
+        resolve_profile("turbo")
+
+
+def test_invalid_default_falls_back_to_standard(monkeypatch):
+    monkeypatch.setattr(analysis_profiles, "DEFAULT_ANALYSIS_PROFILE", "missing")
+    assert resolve_profile() == "standard"
+    assert get_profile("missing")["name"] == "standard"
+
+
+def test_get_profile_carries_its_name():
+    for name in PROFILES:
+        profile = get_profile(name)
+        assert profile["name"] == name
+        assert "ela" in profile["visual_detectors"]
+    assert not get_profile("quick")["reasoning"]
+    assert "trufor" in get_profile("deep")["visual_detectors"]
+
+
+def test_api_key_mapping_ignores_invalid_entries_without_echoing_them(capsys):
+    mapping = _parse_key_profiles("key-one:quick, key:with:colon:deep,secret-key:turbo,,no-separator")
+    assert mapping == {"key-one": "quick", "key:with:colon": "deep"}
+    output = capsys.readouterr().out
+    assert output.count("Ignoring invalid") == 2
+    assert "secret-key" not in output and "no-separator" not in output
+
+
+def test_quick_profile_runs_only_ela(tmp_path):
+    from services.pipeline_orchestrator import analyze_visual
+
+    path = tmp_path / "scan.jpg"
+    image = np.full((96, 128, 3), 180, dtype=np.uint8)
+    cv2.rectangle(image, (20, 20), (60, 60), (30, 60, 90), -1)
+    cv2.imwrite(str(path), image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+    report = asyncio.run(analyze_visual(str(path), profile=get_profile("quick")))
+    details = report["details"]
+    skipped = [name for name, value in details.items() if isinstance(value, dict) and value.get("status") == "skipped"]
+    assert details["ela"].get("status") != "skipped"
+    assert skipped and all(details[name]["profile"] == "quick" for name in skipped)
+
+
+def test_upload_validates_and_records_the_profile(api, analyze):
+    client, _ = api
+    response = client.post("/api/upload", params={"profile": "turbo"},
+                           files={"file": ("doc.pdf", b"%PDF-1.4\n", "application/pdf")})
+    assert response.status_code == 400
+
+    _, events = analyze(b"%PDF-1.4\n% quick profile\n", profile="quick")
+    assert any(e.get("step") == "REASONING_SKIPPED" for e in events)
+    data = events[-1]["data"]
+    assert data["analysis_profile"] == "quick"
+    assert data["reasoning"]["score_breakdown"]["Analysis Profile"] == "quick"
+    # No Gemini call for triage traffic: the local score stands alone
+    assert data["reasoning"]["fallback"] == "local_only"
+    assert next(e for e in events if e.get("step") == "ANALYSIS_COMPLETE")["data"]["analysis_profile"] == "quick"
@@ -0,0 +1,117 @@
+import asyncio
+
+from services.analysis_sessions import AnalysisSession, SessionManager
+from services.cancellation import checkpoint
+
+
+def collect(session, after_seq=0, on_event=None):
+    async def run():
+        seen = []
+        async for event in session.follow(after_seq):
+            seen.append(event)
+            if on_event:
+                on_event(event)
+        return seen
+    return run
+
+
+def test_replays_backlog_then_live_events():
+    async def main():
+        session = AnalysisSession("t1", grace_seconds=-1)
+        session.emit({"status": "processing", "step": "A"})
+        follower = asyncio.create_task(collect(session)())
+        await asyncio.sleep(0)
+        session.emit({"status": "processing", "step": "B"})
+        session.emit({"status": "complete", "step": "COMPLETE"})
+        return await asyncio.wait_for(follower, 1)
+
+    seen = asyncio.run(main())
+    assert [e["seq"] for e in seen] == [1, 2, 3]
+    assert seen[-1]["status"] == "complete"
+
+
+def test_terminal_event_published_during_backlog_replay_is_delivered():
+    async def main():
+        session = AnalysisSession("t2", grace_seconds=-1)
+        session.emit({"status": "processing", "step": "A"})
+        session.emit({"status": "processing", "step": "B"})
+
+        def finish_during_replay(event):
+            # The run finishes while the follower is still yielding the backlog
+            if event["seq"] == 1:
+                session.emit({"status": "complete", "step": "COMPLETE"})
+
+        return await asyncio.wait_for(collect(session, on_event=finish_during_replay)(), 1)
+
+    seen = asyncio.run(main())
+    assert [e["seq"] for e in seen] == [1, 2, 3]
+    assert seen[-1]["step"] == "COMPLETE"
+
+
+def test_reconnect_with_last_event_skips_seen_events():
+    async def main():
+        session = AnalysisSession("t3", grace_seconds=-1)
+        for step in ("A", "B", "C"):
+            session.emit({"status": "processing", "step": step})
+
+        def finish_during_replay(event):
+            session.emit({"status": "complete", "step": "COMPLETE"})
+
+        return await asyncio.wait_for(collect(session, after_seq=2, on_event=finish_during_replay)(), 1)
+
+    seen = asyncio.run(main())
+    # Every event after seq 2 exactly once, ending with the terminal one
+    assert [e["seq"] for e in seen] == [3, 4]
+
+
+def test_finished_session_replays_and_stops():
+    async def main():
+        session = AnalysisSession("t4", grace_seconds=-1)
+        session.emit({"status": "processing", "step": "A"})
+        session.emit({"status": "error", "message": "boom"})
+        return await asyncio.wait_for(collect(session)(), 1)
+
+    assert [e["status"] for e in asyncio.run(main())] == ["processing", "error"]
+
+
+def test_abandoned_session_is_cancelled_after_grace():
+    async def main():
+        manager = SessionManager()
+
+        async def run(emit):
+            emit({"status": "processing", "step": "START"})
+            while True:
+                await asyncio.sleep(0.01)
+                checkpoint()
+
+        session = manager.get_or_start("t5", run)
+        session.grace_seconds = 0.05
+        # Follow until the first event, then disconnect
+        async for _ in session.follow():
+            break
+        await asyncio.wait_for(session.runner, 1)
+        return session
+
+    session = asyncio.run(main())
+    assert session.finished
+    assert session.events[-1]["step"] == "CANCELLED"
+
+
+def test_reconnect_attaches_to_running_session():
+    async def main():
+        manager = SessionManager()
+        started = []
+
+        async def run(emit):
+            started.append(1)
+            await asyncio.sleep(0.01)
+            emit({"status": "complete", "step": "COMPLETE"})
+
+        first = manager.get_or_start("t6", run)
+        second = manager.get_or_start("t6", run)
+        await first.runner
+        return first, second, started
+
+    first, second, started = asyncio.run(main())
+    assert first is second
+    assert started == [1]
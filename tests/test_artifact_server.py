@@ -0,0 +1,97 @@
+import hashlib
+import os
+from pathlib import Path
+
+from services import artifact_server
+from services.artifact_server import ArtifactETags, etag_matches, resolve_artifact_path
+
+PAYLOAD = bytes(range(256)) * 16
+
+
+def write_artifact(main, name, data=PAYLOAD):
+    upload_dir = Path(main.UPLOAD_DIR)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    (upload_dir / name).write_bytes(data)
+    return upload_dir / name
+
+
+def test_etag_is_the_content_hash_and_cached_per_stat(tmp_path, monkeypatch):
+    path = tmp_path / "a.png"
+    path.write_bytes(PAYLOAD)
+    etags = ArtifactETags()
+    etag = etags.get(str(path), os.stat(path))
+    assert etag == f'"{hashlib.sha256(PAYLOAD).hexdigest()[:32]}"'
+
+    # Unchanged file: served from the cache without reading it again
+    monkeypatch.setattr(artifact_server.hashlib, "sha256", None)
+    assert etags.get(str(path), os.stat(path)) == etag
+
+
+def test_seeded_hash_is_used_until_the_file_changes(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(PAYLOAD)
+    etags = ArtifactETags()
+    etags.seed(str(path), "f" * 64)
+    assert etags.get(str(path), os.stat(path)) == f'"{"f" * 32}"'
+
+    path.write_bytes(b"new content")
+    os.utime(path, ns=(1, 1))
+    assert etags.get(str(path), os.stat(path)) == f'"{hashlib.sha256(b"new content").hexdigest()[:32]}"'
+
+
+def test_etag_matching_and_path_resolution(tmp_path):
+    assert etag_matches('"abc", W/"def"', '"def"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    (tmp_path / "a.png").write_bytes(PAYLOAD)
+    assert resolve_artifact_path(str(tmp_path), "a.png") == str(tmp_path / "a.png")
+    for name in ("../a.png", "sub/a.png", ".hidden", "", "missing.png"):
+        assert resolve_artifact_path(str(tmp_path), name) is None
+
+
+def test_artifact_endpoint_serves_etag_and_304(api):
+    client, main = api
+    write_artifact(main, "etag-test.ela.png")
+    response = client.get("/api/artifacts/etag-test.ela.png")
+    assert response.status_code == 200
+    assert response.content == PAYLOAD
+    assert response.headers["content-type"] == "image/png"
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    cached = client.get("/api/artifacts/etag-test.ela.png", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert client.get("/api/artifacts/..%2Fmain.py").status_code == 404
+
+
+def test_artifact_endpoint_answers_range_requests(api):
+    client, main = api
+    write_artifact(main, "range-test.pdf")
+    response = client.get("/api/artifacts/range-test.pdf", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == PAYLOAD[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(PAYLOAD)}"
+
+
+def test_accel_redirect_hands_the_body_to_nginx(api, monkeypatch):
+    client, main = api
+    write_artifact(main, "accel-test.png")
+    monkeypatch.setattr(artifact_server, "ARTIFACT_ACCEL_REDIRECT_PREFIX", "/_artifacts/")
+    response = client.get("/api/artifacts/accel-test.png", headers={"X-Accel-Enabled": "1"})
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/_artifacts/accel-test.png"
+    assert response.content == b""
+    assert response.headers["etag"]
+
+
+def test_accel_redirect_needs_the_proxy_header(api, monkeypatch):
+    client, main = api
+    write_artifact(main, "direct-test.png")
+    monkeypatch.setattr(artifact_server, "ARTIFACT_ACCEL_REDIRECT_PREFIX", "/_artifacts/")
+    # Browser talking to the backend port directly, not through nginx
+    response = client.get("/api/artifacts/direct-test.png")
+    assert response.status_code == 200
+    assert "x-accel-redirect" not in response.headers
+    assert response.content == PAYLOAD
+
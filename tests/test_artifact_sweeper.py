@@ -0,0 +1,169 @@
+import os
+import time
+
+from services import artifact_sweeper
+from services.artifact_sweeper import ArtifactSweeper
+from services.task_registry import SQLiteTaskRegistry, MemoryTaskRegistry
+
+
+def write(directory, name, size=10, age=0):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if age:
+        old = time.time() - age
+        os.utime(path, (old, old))
+    return path
+
+
+def two_workers(tmp_path, ttl=60):
+    """Two sweepers on one uploads directory sharing one SQLite registry (two uvicorn workers)."""
+    db = str(tmp_path / ".task_registry.sqlite3")
+    registry_a, registry_b = SQLiteTaskRegistry(db), SQLiteTaskRegistry(db)
+    a = ArtifactSweeper(str(tmp_path), ttl_seconds=ttl, on_evict=registry_a.remove, registry=registry_a)
+    b = ArtifactSweeper(str(tmp_path), ttl_seconds=ttl, on_evict=registry_b.remove, registry=registry_b)
+    return registry_a, a, b
+
+
+def test_expired_task_files_are_removed_together(tmp_path):
+    sweeper = ArtifactSweeper(str(tmp_path), ttl_seconds=60)
+    upload = write(tmp_path, "t1.jpg")
+    overlay = write(tmp_path, "t1.jpg.ela.png")
+    sweeper.track("t1", upload, overlay)
+
+    sweeper.sweep(now=time.time() + 30)
+    assert os.path.exists(upload)
+    sweeper.sweep(now=time.time() + 61)
+    assert not os.path.exists(upload) and not os.path.exists(overlay)
+    assert sweeper.stats()["tracked_bytes"] == 0
+
+
+def test_pinned_task_survives_and_lease_extends(tmp_path):
+    sweeper = ArtifactSweeper(str(tmp_path), ttl_seconds=60)
+    upload = write(tmp_path, "t1.jpg")
+    sweeper.track("t1", upload)
+    sweeper.pin("t1")
+    sweeper.sweep(now=time.time() + 120)
+    assert os.path.exists(upload)
+
+    sweeper.unpin("t1")
+    expires_at = sweeper.touch("t1", lease_seconds=600)
+    sweeper.sweep(now=expires_at - 1)
+    assert os.path.exists(upload)
+    sweeper.sweep(now=expires_at + 1)
+    assert not os.path.exists(upload)
+
+
+def test_disk_cap_evicts_least_recently_accessed(tmp_path):
+    sweeper = ArtifactSweeper(str(tmp_path), ttl_seconds=600, disk_cap_bytes=150)
+    old = write(tmp_path, "old.jpg", size=100)
+    new = write(tmp_path, "new.jpg", size=100)
+    sweeper.track("old", old)
+    time.sleep(0.01)
+    sweeper.track("new", new)
+    sweeper.touch("new")
+    sweeper.sweep()
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+
+
+def test_reconcile_leaves_files_leased_by_another_worker(tmp_path):
+    registry, a, b = two_workers(tmp_path)
+    upload = write(tmp_path, "t1.jpg")
+    registry.register("t1", path=upload)
+    a.track("t1", upload)
+    a.touch("t1", lease_seconds=3600)
+    # The upload is older than the TTL, but worker A still has it leased
+    os.utime(upload, (time.time() - 3600, time.time() - 3600))
+
+    b.reconcile()
+    b.sweep()
+    assert os.path.exists(upload)
+    assert b.stats()["tracked_tasks"] == 0
+
+
+def test_reconcile_leaves_files_of_a_running_analysis(tmp_path):
+    registry, a, b = two_workers(tmp_path)
+    upload = write(tmp_path, "t1.jpg", age=3600)
+    registry.register("t1", path=upload)
+    a.track("t1", upload)
+    a.pin("t1")
+
+    b.reconcile()
+    b.sweep()
+    assert os.path.exists(upload)
+
+
+def test_lease_through_another_worker_is_honoured(tmp_path):
+    registry, a, b = two_workers(tmp_path)
+    upload = write(tmp_path, "t1.jpg")
+    registry.register("t1", path=upload)
+    a.track("t1", upload)
+
+    # The dashboard's lease call lands on worker B, which does not track the task
+    expires_at = b.touch("t1", lease_seconds=3600)
+    assert expires_at is not None and expires_at > time.time() + 3000
+
+    # Worker A's own TTL has passed, the shared lease has not
+    a.sweep(now=time.time() + 120)
+    assert os.path.exists(upload)
+    a.sweep(now=expires_at + 1)
+    assert not os.path.exists(upload)
+    assert registry.get("t1") is None
+
+
+def test_leases_of_untracked_tasks_read_the_registry_once_per_sync_interval(tmp_path, monkeypatch):
+    registry, a, b = two_workers(tmp_path)
+    upload = write(tmp_path, "t1.jpg")
+    registry.register("t1", path=upload)
+    a.track("t1", upload)
+    reads = []
+    read = b.registry.get
+    monkeypatch.setattr(b.registry, "get", lambda task_id: reads.append(task_id) or read(task_id))
+
+    # A dashboard fetching every overlay through worker B
+    first = b.touch("t1", lease_seconds=3600)
+    for _ in range(20):
+        assert b.touch("t1", lease_seconds=3600) == first
+        assert b.touch("missing") is None
+    assert reads == ["t1", "missing"]
+
+    # Once the interval has passed, the registry is read again
+    later = time.time() + artifact_sweeper.LEASE_SYNC_SECONDS + 1
+    monkeypatch.setattr(artifact_sweeper.time, "time", lambda: later)
+    b.sweep()
+    assert b.touch("missing") is None
+    assert reads == ["t1", "missing", "missing"]
+
+
+def test_unknown_task_lease_is_rejected(tmp_path):
+    _, _, b = two_workers(tmp_path)
+    assert b.touch("missing") is None
+
+
+def test_reconcile_adopts_orphans_and_expired_records(tmp_path):
+    registry, a, b = two_workers(tmp_path)
+    orphan = write(tmp_path, "orphan.jpg", age=3600)
+    stale = write(tmp_path, "stale.jpg", age=3600)
+    fresh = write(tmp_path, "fresh.jpg")
+    # A worker that went away: its record's expiry has passed
+    registry.register("stale", path=stale, artifacts_expire_at=time.time() - 10)
+
+    b.reconcile()
+    b.sweep()
+    assert not os.path.exists(orphan)
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+    assert registry.get("stale") is None
+
+
+def test_memory_registry_single_worker(tmp_path):
+    registry = MemoryTaskRegistry()
+    sweeper = ArtifactSweeper(str(tmp_path), ttl_seconds=60, on_evict=registry.remove, registry=registry)
+    upload = write(tmp_path, "t1.jpg")
+    registry.register("t1", path=upload)
+    sweeper.track("t1", upload)
+    assert registry.get("t1")["artifacts_expire_at"] > time.time()
+    sweeper.sweep(now=time.time() + 61)
+    assert not os.path.exists(upload)
+    assert registry.get("t1") is None
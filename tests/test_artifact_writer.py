@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import json
+
+import cv2
+import numpy as np
+
+from services.artifact_writer import write_image_artifact, is_artifact_ref, collect_artifact_refs
+from services.artifact_server import offload_inline_images
+from services.result_cache import collect_report_artifacts
+
+
+def test_image_artifact_is_written_next_to_the_source(tmp_path):
+    source = tmp_path / "task1.jpg"
+    source.write_bytes(b"")
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    image[:, :, 2] = 255  # red in BGR
+
+    ref = write_image_artifact(str(source), "ela", image)
+    path = tmp_path / "task1.jpg.ela.png"
+    assert ref["id"] == "task1.jpg.ela.png"
+    assert (ref["kind"], ref["media_type"], ref["width"], ref["height"]) == ("ela", "image/png", 30, 20)
+    data = path.read_bytes()
+    assert ref["size"] == len(data) and ref["sha256"] == hashlib.sha256(data).hexdigest()
+    assert np.array_equal(cv2.imread(str(path)), image)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_float_rgb_and_rgba_images_are_converted(tmp_path):
+    source = str(tmp_path / "task2.png")
+    rgb = np.zeros((4, 4, 3), dtype=np.float32)
+    rgb[:, :, 0] = 1.0  # red in RGB, [0, 1] floats
+    write_image_artifact(source, "heatmap", rgb, color_order="rgb")
+    assert tuple(cv2.imread(source + ".heatmap.png")[0, 0]) == (0, 0, 255)
+
+    rgba = np.zeros((4, 4, 4), dtype=np.uint8)
+    rgba[:, :, 1] = 255
+    rgba[:, :, 3] = 128
+    ref = write_image_artifact(source, "mask", rgba, color_order="rgba")
+    assert tuple(cv2.imread(source + ".mask.png", cv2.IMREAD_UNCHANGED)[0, 0]) == (0, 255, 0, 128)
+    assert is_artifact_ref(ref)
+
+
+def test_artifact_refs_are_found_anywhere_in_a_report(tmp_path):
+    source = str(tmp_path / "task3.jpg")
+    ela = write_image_artifact(source, "ela", np.zeros((2, 2), dtype=np.uint8))
+    noise = write_image_artifact(source, "noise", np.zeros((2, 2), dtype=np.uint8))
+    report = {
+        "details": {
+            "ela": {"image": ela, "max_difference": 12},
+            "analyzed_images": [{"filename": "task3.img0.png",
+                                 "visual_report": {"details": {"noise_analysis": {"image": noise}}}}],
+        },
+        "flags": [{"id": "not-an-artifact"}],
+    }
+    assert collect_artifact_refs(report) == [ela, noise]
+    assert sorted(collect_report_artifacts(report, "uploads")) == sorted(
+        ["uploads/task3.jpg.ela.png", "uploads/task3.jpg.noise.png", "uploads/task3.img0.png"])
+
+
+def test_inline_images_become_artifact_references(tmp_path):
+    png = b"\x89PNG\r\n\x1a\n" + b"\x01" * 32
+    report = {"details": {"segformer": {"heatmap": "data:image/png;base64," + base64.b64encode(png).decode()}},
+              "pages": ["plain text"]}
+    written = offload_inline_images(report, str(tmp_path), "task4")
+    assert written == ["task4.inline0.png"]
+    ref = report["details"]["segformer"]["heatmap"]
+    assert is_artifact_ref(ref) and ref["id"] == "task4.inline0.png"
+    assert ref["sha256"] == hashlib.sha256(png).hexdigest()
+    assert (tmp_path / "task4.inline0.png").read_bytes() == png
+    assert report["pages"] == ["plain text"]
+
+
+def test_reports_carry_references_not_base64(analyze, api):
+    client, _ = api
+    png = cv2.imencode(".png", np.full((64, 64, 3), 200, dtype=np.uint8))[1].tobytes()
+    analyze.report = {"score": 0.1, "flags": [], "details": {
+        "heatmap_image": "data:image/png;base64," + base64.b64encode(png).decode()}}
+    _, events = analyze(b"%PDF-1.4\n% offloaded heatmap\n")
+
+    report = next(e for e in events if e.get("step") == "ANALYSIS_COMPLETE")["data"]
+    ref = report["details"]["heatmap_image"]
+    assert is_artifact_ref(ref)
+    assert "base64" not in json.dumps(events)
+    served = client.get(f"/api/artifacts/{ref['id']}")
+    assert served.status_code == 200 and served.content == png
+    assert served.headers["etag"] == f'"{ref["sha256"][:32]}"'
@@ -0,0 +1,189 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from services import batch_analysis
+from services.batch_analysis import extract_zip_documents, stage_batch_uploads
+from services.upload_stream import UploadRejected
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+PDF = b"%PDF-1.4\n%EOF"
+
+
+def zip_bytes(count, payload=PNG):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i in range(count):
+            archive.writestr(f"doc_{i}.png", payload)
+    buffer.seek(0)
+    return buffer
+
+
+def upload(name, data):
+    return UploadFile(file=io.BytesIO(data.getvalue() if hasattr(data, "getvalue") else data), filename=name)
+
+
+def test_zip_members_are_staged(tmp_path):
+    documents = extract_zip_documents(zip_bytes(3), str(tmp_path))
+    assert len(documents) == 3
+    assert all(os.path.exists(doc["path"]) for doc in documents)
+    assert {doc["content_type"] for doc in documents} == {"image/png"}
+
+
+def test_zip_stops_at_the_document_limit(tmp_path):
+    with pytest.raises(UploadRejected) as excinfo:
+        extract_zip_documents(zip_bytes(50), str(tmp_path), max_documents=5)
+    assert excinfo.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejected_member_is_reported_not_staged(tmp_path):
+    documents = extract_zip_documents(zip_bytes(2, payload=b"plain text"), str(tmp_path))
+    assert all("error" in doc for doc in documents)
+    assert os.listdir(tmp_path) == []
+
+
+def test_refused_batch_leaves_no_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_DOCUMENTS", 4)
+    files = [upload("a.pdf", PDF), upload("b.png", PNG), upload("docs.zip", zip_bytes(10))]
+
+    with pytest.raises(UploadRejected) as excinfo:
+        asyncio.run(stage_batch_uploads(files, str(tmp_path)))
+    assert excinfo.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_limit_counts_plain_files_and_zip_members(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_DOCUMENTS", 4)
+    files = [upload("a.pdf", PDF), upload("docs.zip", zip_bytes(3))]
+    documents = asyncio.run(stage_batch_uploads(files, str(tmp_path)))
+    assert len(documents) == 4
+
+    other = tmp_path / "other"
+    other.mkdir()
+    files = [upload("a.pdf", PDF), upload("docs.zip", zip_bytes(3)), upload("c.pdf", PDF)]
+    with pytest.raises(UploadRejected):
+        asyncio.run(stage_batch_uploads(files, str(other)))
+    assert os.listdir(other) == []
+
+
+def test_broken_archive_removes_earlier_uploads(tmp_path):
+    files = [upload("a.pdf", PDF), upload("bad.zip", b"PK\x03\x04 truncated")]
+    with pytest.raises(Exception):
+        asyncio.run(stage_batch_uploads(files, str(tmp_path)))
+    assert os.listdir(tmp_path) == []
+
+
+def fake_pipelines(monkeypatch, failing=()):
+    """Replaces the model pipelines with instant stand-ins (structural for everything)."""
+    def determine(path, content_type, document=None):
+        return batch_analysis.PipelineType.STRUCTURAL
+
+    async def structural(path, batch=None, document=None, profile=None):
+        if os.path.basename(path) in failing:
+            raise RuntimeError("parser crashed")
+        return {"trust_score": 90, "path": path}
+
+    monkeypatch.setattr(batch_analysis, "determine_pipeline", determine)
+    monkeypatch.setattr(batch_analysis, "analyze_structural", structural)
+
+
+def test_batch_emits_one_result_per_document(tmp_path, monkeypatch):
+    fake_pipelines(monkeypatch, failing=("bad.pdf",))
+    documents = []
+    for name in ("a.pdf", "bad.pdf"):
+        path = tmp_path / name
+        path.write_bytes(PDF)
+        documents.append({"task_id": name, "filename": name, "path": str(path), "content_type": "application/pdf"})
+    documents.append({"task_id": "refused", "filename": None, "error": "Unsupported file type"})
+
+    emitted = []
+
+    async def emit(item):
+        emitted.append(item)
+
+    asyncio.run(batch_analysis.run_batch_analysis(documents, emit=emit, concurrency=2))
+    by_task = {item["task_id"]: item for item in emitted}
+    assert len(emitted) == 3
+    assert by_task["a.pdf"]["status"] == "complete"
+    assert by_task["a.pdf"]["pipeline_used"] == batch_analysis.PipelineType.STRUCTURAL.value
+    assert by_task["a.pdf"]["report"]["analysis_profile"]
+    assert by_task["bad.pdf"]["status"] == "error"
+    assert by_task["bad.pdf"]["error"] == "parser crashed"
+    assert by_task["refused"]["status"] == "error"
+
+
+def test_cancelled_batch_reports_cancelled_documents(tmp_path, monkeypatch):
+    fake_pipelines(monkeypatch)
+    path = tmp_path / "a.pdf"
+    path.write_bytes(PDF)
+    token = batch_analysis.CancellationToken()
+    token.cancel("client_disconnected")
+    emitted = []
+
+    async def emit(item):
+        emitted.append(item)
+
+    documents = [{"task_id": "a", "filename": "a.pdf", "path": str(path), "content_type": "application/pdf"}]
+    asyncio.run(batch_analysis.run_batch_analysis(documents, emit=emit, token=token))
+    assert emitted[0]["status"] == "cancelled"
+    assert emitted[0]["reason"] == "client_disconnected"
+
+
+def test_batch_endpoint_streams_ndjson(api, monkeypatch):
+    client, main = api
+    fake_pipelines(monkeypatch)
+    files = [
+        ("files", ("one.pdf", io.BytesIO(PDF), "application/pdf")),
+        ("files", ("docs.zip", zip_bytes(2, payload=PDF), "application/zip")),
+    ]
+    response = client.post("/api/batch", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert lines[0]["status"] == "accepted" and lines[0]["document_count"] == 3
+    results = lines[1:]
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    assert all(r["status"] == "complete" for r in results)
+    # Finished documents are no longer pinned against the sweeper
+    assert not any(main.artifact_sweeper._tasks[r["task_id"]]["pinned"] for r in results)
+
+
+def test_batch_total_bytes_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_BYTES", len(PDF) + len(PNG) + 10)
+    files = [upload("a.pdf", PDF), upload("b.png", PNG), upload("docs.zip", zip_bytes(2))]
+
+    with pytest.raises(UploadRejected) as excinfo:
+        asyncio.run(stage_batch_uploads(files, str(tmp_path)))
+    assert excinfo.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+    # Under the cap, a file over the per-file limit is still a per-document error
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_BYTES", 10 * len(PNG))
+    monkeypatch.setattr(batch_analysis, "MAX_UPLOAD_BYTES", len(PDF))
+    documents = asyncio.run(stage_batch_uploads([upload("a.pdf", PDF), upload("b.png", PNG)], str(tmp_path)))
+    assert "error" not in documents[0] and "error" in documents[1]
+
+
+def test_full_queue_after_staging_leaves_nothing_pinned(api, monkeypatch):
+    client, main = api
+    fake_pipelines(monkeypatch)
+    before = set(os.listdir(main.UPLOAD_DIR)) if os.path.isdir(main.UPLOAD_DIR) else set()
+    pinned = main.artifact_sweeper.stats()["pinned_tasks"]
+
+    def full(run, on_position=None):
+        raise main.QueueFull("Analysis queue is full")
+
+    # is_full() passes before staging; the queue fills up while the files are written
+    monkeypatch.setattr(main.analysis_queue, "submit", full)
+    files = [("files", ("late.pdf", io.BytesIO(PDF + b"late"), "application/pdf"))]
+    response = client.post("/api/batch", files=files)
+    assert response.status_code == 429
+    assert main.artifact_sweeper.stats()["pinned_tasks"] == pinned
+    assert set(os.listdir(main.UPLOAD_DIR)) == before
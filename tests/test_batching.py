@@ -0,0 +1,37 @@
+import asyncio
+
+from services.batching import MicroBatcher
+
+
+def test_micro_batcher_groups_concurrent_items():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [i * 2 for i in items]
+
+    async def main():
+        batcher = MicroBatcher(double, max_batch=4, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        assert not batcher._tasks
+        return results
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8, 10]
+    assert [len(c) for c in calls] == [4, 2]
+
+
+def test_micro_batcher_keeps_running_batches_and_propagates_errors():
+    def fail(items):
+        raise RuntimeError("forward pass failed")
+
+    async def main():
+        batcher = MicroBatcher(fail, max_batch=2, max_wait=0.01)
+        first = asyncio.ensure_future(batcher.submit(1))
+        second = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0)
+        # The flushed batch is referenced until it finishes
+        assert len(batcher._tasks) == 1
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
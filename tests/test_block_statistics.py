@@ -0,0 +1,150 @@
+import cv2
+import numpy as np
+import pytest
+
+from services.block_statistics import MIN_OUTLIER_BLOCKS, block_inconsistency, block_mean_var
+from services.decoded_image import DecodedImage
+from services.pipeline_orchestrator import BLOCK_INCONSISTENCY_FLAG, perform_ela, perform_noise_analysis
+
+
+def naive_block_stats(values, block, stride):
+    h, w = values.shape
+    rows = range(0, h - block + 1, stride)
+    cols = range(0, w - block + 1, stride)
+    mean = np.array([[values[y:y + block, x:x + block].mean() for x in cols] for y in rows])
+    var = np.array([[values[y:y + block, x:x + block].var() for x in cols] for y in rows])
+    return mean, var
+
+
+@pytest.mark.parametrize("dtype, stride", [(np.uint8, None), (np.float32, 8)])
+def test_integral_image_stats_match_a_direct_computation(dtype, stride):
+    rng = np.random.default_rng(1)
+    values = (rng.random((70, 90)) * 255).astype(dtype)
+    mean, var, ys, xs = block_mean_var(values, block=16, stride=stride)
+    expected_mean, expected_var = naive_block_stats(values.astype(np.float64), 16, stride or 16)
+    assert mean.shape == expected_mean.shape
+    np.testing.assert_allclose(mean, expected_mean, rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(var, expected_var, rtol=1e-3, atol=1e-2)
+    # Partial blocks at the right / bottom edge are left out
+    assert ys[-1] + 16 <= 70 and xs[-1] + 16 <= 90
+
+
+def test_image_smaller_than_a_block_has_no_blocks():
+    mean, var, ys, xs = block_mean_var(np.zeros((10, 40), dtype=np.uint8), block=32)
+    assert mean.shape == (0, 0) and len(ys) == 0 and len(xs) == 0
+    assert block_inconsistency(np.zeros((10, 40), dtype=np.uint8))["grid"] == [0, 0]
+
+
+def residual_with_patch(blocks_high, block=32, size=256, seed=2):
+    """Uniform low-level residual with the listed (row, col) blocks raised."""
+    rng = np.random.default_rng(seed)
+    residual = rng.normal(3.0, 0.5, (size, size)).clip(0).astype(np.float32)
+    for r, c in blocks_high:
+        residual[r * block:(r + 1) * block, c * block:(c + 1) * block] += 6.0
+    return residual
+
+
+def test_consistent_residual_scores_zero():
+    summary = block_inconsistency(residual_with_patch([]), block=32)
+    assert summary["grid"] == [8, 8] and summary["valid_blocks"] == 64
+    assert summary["inconsistency_score"] == 0.0
+    assert summary["outlier_blocks"] == 0 and summary["top_blocks"] == []
+
+
+def test_pasted_region_is_located_and_scored():
+    patch = [(2, 3), (2, 4), (3, 3), (3, 4)]
+    summary = block_inconsistency(residual_with_patch(patch), block=32, top_k=8)
+    assert summary["outlier_blocks"] == len(patch)
+    assert summary["inconsistency_score"] > 0.5
+    located = {(b["y"] // 32, b["x"] // 32) for b in summary["top_blocks"]}
+    assert located == set(patch)
+    assert all(b["width"] == b["height"] == 32 and b["z"] > 0 for b in summary["top_blocks"])
+
+
+def test_a_single_odd_block_does_not_move_the_score():
+    summary = block_inconsistency(residual_with_patch([(5, 5)]), block=32)
+    assert summary["outlier_blocks"] == 1 < MIN_OUTLIER_BLOCKS
+    assert summary["inconsistency_score"] == 0.0
+    assert [(b["y"], b["x"]) for b in summary["top_blocks"]] == [(160, 160)]
+
+
+def test_flat_blocks_are_ignored():
+    residual = residual_with_patch([(0, 0), (0, 1), (1, 0), (1, 1)])
+    detail = np.full(residual.shape, 4.0, dtype=np.float32)
+    # The raised blocks are blank paper: their residual says nothing
+    detail[:64, :64] = 0.0
+    summary = block_inconsistency(residual, detail, block=32)
+    assert summary["valid_blocks"] == 60
+    assert summary["inconsistency_score"] == 0.0
+
+    # Too few usable blocks for meaningful statistics
+    assert block_inconsistency(residual, np.zeros_like(residual), block=32)["valid_blocks"] == 0
+
+
+def test_only_residual_above_the_rest_counts():
+    residual = residual_with_patch([])
+    # A quieter region (a flat fill, a clean edge) is not a sign of editing
+    residual[64:128, 64:128] = 0.5
+    summary = block_inconsistency(residual, block=32)
+    assert summary["inconsistency_score"] == 0.0 and summary["top_blocks"] == []
+
+
+def test_chroma_is_scored_on_its_own():
+    patch = [(2, 3), (2, 4), (3, 3), (3, 4)]
+    luma = residual_with_patch([])
+    detail = np.full(luma.shape, 4.0, dtype=np.float32)
+    chroma_detail = np.full(luma.shape, 4.0, dtype=np.float32)
+    summary = block_inconsistency(luma, detail, block=32,
+                                  chroma=(residual_with_patch(patch, seed=3), chroma_detail))
+    assert summary["inconsistency_score"] > 0.5
+    assert {(b["y"] // 32, b["x"] // 32) for b in summary["top_blocks"]} == set(patch)
+    assert {b["channel"] for b in summary["top_blocks"]} == {"chroma"}
+
+
+def letterhead(logo: bool, seed: int = 0) -> np.ndarray:
+    """A clean invoice page: text lines, a coloured header bar and optionally a logo."""
+    rng = np.random.default_rng(seed)
+    page = np.full((1000, 800, 3), 255, np.uint8)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.rectangle(page, (0, 0), (800, 110), (150, 80, 20), -1)
+    cv2.putText(page, "ACME CORPORATION", (30, 70), font, 1.4, (255, 255, 255), 3, cv2.LINE_AA)
+    if logo:
+        cv2.circle(page, (700, 200), 50, (30, 30, 200), -1)
+        cv2.circle(page, (700, 200), 25, (30, 200, 230), -1)
+    cv2.rectangle(page, (40, 700), (760, 820), (200, 200, 200), -1)
+    cv2.putText(page, "TOTAL DUE  $ 1,234.56", (60, 775), font, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+    for i in range(18):
+        color = (20, 20, 200) if i % 3 == 0 else (0, 0, 0)
+        words = " ".join(f"Item{rng.integers(100, 999)}" for _ in range(4))
+        cv2.putText(page, words, (40, 160 + 30 * i), font, 0.7, color, 1 + i % 2, cv2.LINE_AA)
+    return page
+
+
+@pytest.mark.parametrize("logo", [True, False])
+@pytest.mark.parametrize("quality", [75, 85, 95, None])
+def test_clean_documents_stay_below_the_flag(tmp_path, logo, quality):
+    # Text edges, coloured headers and logos re-compress unevenly on every page;
+    # none of that may read as a local inconsistency
+    path = str(tmp_path / ("page.png" if quality is None else "page.jpg"))
+    params = [] if quality is None else [cv2.IMWRITE_JPEG_QUALITY, quality]
+    cv2.imwrite(path, letterhead(logo), params)
+    image = DecodedImage(path)
+    ela = perform_ela(image, sweep=False)
+    noise = perform_noise_analysis(image)
+    assert ela["status"] == noise["status"] == "success"
+    assert ela["blocks"]["inconsistency_score"] < BLOCK_INCONSISTENCY_FLAG
+    assert noise["blocks"]["inconsistency_score"] < BLOCK_INCONSISTENCY_FLAG
+
+
+def test_block_inconsistency_is_weighted_into_the_local_score(analyze):
+    analyze.reasoning = {"error": "Reasoning layer failed: offline"}
+    analyze.report = {"score": 0.0, "flags": [], "details": {"analyzed_images": [{"visual_report": {"details": {
+        "semantic_segmentation": {"confidence_score": 0.0},
+        "ela": {"max_difference": 0, "blocks": {"inconsistency_score": 0.5}},
+        "noise_analysis": {"blocks": {"inconsistency_score": 0.1}},
+    }}}]}}
+    _, events = analyze(b"%PDF-1.4\n% block inconsistency\n")
+    breakdown = events[-1]["data"]["reasoning"]["score_breakdown"]
+    # The global ELA level looks clean; the inconsistent region takes 30% of the score down to 50
+    assert breakdown["Compression Consistency (ELA) (33%)"] == 85.0
+    assert events[-1]["data"]["reasoning"]["authenticity_score"] == round(100 * 2 / 3 + 85 / 3)
@@ -0,0 +1,124 @@
+import time
+import asyncio
+
+import pytest
+
+from services.analysis_sessions import SessionManager
+from services.cancellation import (AnalysisCancelled, CancellationToken, checkpoint, current_token,
+                                   run_in_executor, use_token)
+
+
+def test_cancel_keeps_the_first_reason():
+    token = CancellationToken()
+    assert not token.cancelled and token.remaining() is None
+    token.cancel("client_cancelled")
+    token.cancel("deadline_exceeded")
+    assert token.cancelled and token.reason == "client_cancelled"
+    with pytest.raises(AnalysisCancelled) as raised:
+        token.raise_if_cancelled()
+    assert raised.value.reason == "client_cancelled"
+
+
+def test_deadline_cancels_the_token():
+    token = CancellationToken(deadline_seconds=0.05)
+    assert 0 < token.remaining() <= 0.05
+    time.sleep(0.06)
+    assert token.cancelled and token.reason == "deadline_exceeded"
+    assert token.remaining() == 0.0
+
+
+def test_child_tokens_follow_their_parent():
+    batch = CancellationToken()
+    document = CancellationToken(deadline_seconds=60, parent=batch)
+    batch.cancel("client_disconnected")
+    assert document.cancelled and document.reason == "client_disconnected"
+
+
+def test_checkpoint_only_raises_inside_a_cancelled_analysis():
+    checkpoint()
+    token = CancellationToken()
+    with use_token(token):
+        assert current_token() is token
+        checkpoint()
+        token.cancel()
+        with pytest.raises(AnalysisCancelled):
+            checkpoint()
+    assert current_token() is None
+    checkpoint()
+
+
+def test_executor_jobs_see_the_token_of_their_analysis():
+    def detector(steps):
+        done = 0
+        for _ in range(steps):
+            checkpoint()
+            done += 1
+            time.sleep(0.01)
+        return done
+
+    async def main():
+        token = CancellationToken()
+        loop = asyncio.get_running_loop()
+        with use_token(token):
+            job = run_in_executor(loop, detector, 200)
+            await asyncio.sleep(0.05)
+            token.cancel("client_cancelled")
+            with pytest.raises(AnalysisCancelled):
+                await job
+            # Once cancelled, no new job is even queued
+            with pytest.raises(AnalysisCancelled):
+                run_in_executor(loop, detector, 1)
+
+    asyncio.run(main())
+
+
+def test_session_deadline_ends_the_run_with_a_cancelled_event():
+    async def run(emit):
+        emit({"status": "info", "step": "ANALYSIS_RUNNING"})
+        for _ in range(500):
+            checkpoint()
+            await asyncio.sleep(0.01)
+        emit({"status": "complete", "step": "COMPLETE"})
+
+    async def main():
+        manager = SessionManager()
+        session = manager.get_or_start("deadline-task", run)
+        session.token.deadline = time.monotonic() + 0.05
+        return [event async for event in session.follow()]
+
+    events = asyncio.run(main())
+    assert events[-1]["step"] == "CANCELLED"
+    assert events[-1]["reason"] == "deadline_exceeded"
+
+
+def test_client_cancel_stops_the_pipeline(analyze, api, monkeypatch):
+    client, main = api
+    steps = []
+
+    async def slow_structural(path, callback=None, document=None, profile=None):
+        for _ in range(500):
+            checkpoint()
+            steps.append(1)
+            await asyncio.sleep(0.01)
+        return {"score": 0.0, "flags": [], "details": {}}
+
+    monkeypatch.setattr(main, "analyze_structural", slow_structural)
+    response = client.post("/api/upload", files={"file": ("doc.pdf", b"%PDF-1.4\n% cancelled run\n", "application/pdf")})
+    task_id = response.json()["task_id"]
+
+    events = []
+    with client.websocket_connect(f"/ws/analyze/{task_id}") as ws:
+        while True:
+            event = ws.receive_json()
+            events.append(event)
+            if event.get("step") == "ANALYSIS_RUNNING":
+                ws.send_json({"action": "cancel"})
+            if event.get("status") in ("complete", "error"):
+                break
+
+    assert events[-1]["step"] == "CANCELLED"
+    assert events[-1]["reason"] == "client_cancelled"
+    assert len(steps) < 500
+    # Reported as cancelled, never stored as a finished result
+    result = client.get(f"/api/result/{task_id}").json()
+    assert result["status"] == "cancelled" and result["reason"] == "client_cancelled"
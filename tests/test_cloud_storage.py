@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from services import cloud_storage
+from services.cloud_storage import BackgroundUploads, content_addressed_blob_name, upload_to_gcs
+
+
+@pytest.fixture(autouse=True)
+def no_known_blobs(monkeypatch):
+    monkeypatch.setattr(cloud_storage, "_known_blobs", OrderedDict())
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def exists(self):
+        self.bucket.exists_calls += 1
+        return self.name in self.bucket.objects
+
+    def upload_from_filename(self, filename, if_generation_match=None):
+        self.bucket.uploads.append((filename, self.name, if_generation_match))
+        self.bucket.objects.add(self.name)
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = set()
+        self.uploads = []
+        self.exists_calls = 0
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+class FakeClient:
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket())
+
+
+def test_blob_names_are_content_addressed():
+    assert content_addressed_blob_name("abc123", "Scan.PDF") == "documents/abc123.pdf"
+    assert content_addressed_blob_name("abc123", "other-name.pdf") == "documents/abc123.pdf"
+
+
+def test_existing_objects_are_not_uploaded_again(tmp_path, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(cloud_storage, "get_storage_client", lambda: client)
+    source = tmp_path / "doc.pdf"
+    source.write_bytes(b"%PDF-1.4\n")
+
+    first = upload_to_gcs(str(source), "documents/abc.pdf")
+    second = upload_to_gcs(str(source), "documents/abc.pdf")
+    bucket = client.bucket(cloud_storage.GCS_BUCKET_NAME)
+    assert first == second == f"gs://{cloud_storage.GCS_BUCKET_NAME}/documents/abc.pdf"
+    # Create-only upload, and only once
+    assert bucket.uploads == [(str(source), "documents/abc.pdf", 0)]
+    # The second call knew the object already: no exists() round-trip
+    assert bucket.exists_calls == 1
+
+
+def test_known_blobs_are_checked_again_after_their_ttl(tmp_path, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(cloud_storage, "get_storage_client", lambda: client)
+    bucket = client.bucket(cloud_storage.GCS_BUCKET_NAME)
+    bucket.objects.add("documents/abc.pdf")
+
+    upload_to_gcs("unused.pdf", "documents/abc.pdf")
+    cloud_storage._known_blobs["documents/abc.pdf"] -= cloud_storage.KNOWN_BLOB_TTL_SECONDS + 1
+    upload_to_gcs("unused.pdf", "documents/abc.pdf")
+    assert bucket.exists_calls == 2
+    assert bucket.uploads == []
+
+
+def test_known_blobs_are_bounded(tmp_path, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(cloud_storage, "get_storage_client", lambda: client)
+    monkeypatch.setattr(cloud_storage, "KNOWN_BLOBS_MAX_ENTRIES", 2)
+    bucket = client.bucket(cloud_storage.GCS_BUCKET_NAME)
+    bucket.objects.update({"documents/a.pdf", "documents/b.pdf", "documents/c.pdf"})
+
+    for name in ("documents/a.pdf", "documents/b.pdf", "documents/a.pdf", "documents/c.pdf"):
+        upload_to_gcs("unused.pdf", name)
+    # a was used again after b, so b is the one dropped
+    assert list(cloud_storage._known_blobs) == ["documents/a.pdf", "documents/c.pdf"]
+    upload_to_gcs("unused.pdf", "documents/b.pdf")
+    assert bucket.exists_calls == 4
+
+
+def test_upload_failure_returns_none(monkeypatch):
+    def broken():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(cloud_storage, "get_storage_client", broken)
+    assert upload_to_gcs("missing.pdf", "documents/abc.pdf") is None
+
+
+def test_background_upload_overlaps_and_is_awaited_once(monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def store(source, destination):
+        calls.append((source, destination))
+        release.wait(5)
+        return f"file://{destination}"
+
+    monkeypatch.setattr(cloud_storage, "store_document", store)
+
+    async def main():
+        uploads = BackgroundUploads()
+        uploads.start("t1", "uploads/a.pdf", "documents/a.pdf")
+        # A second start for the same task is a no-op
+        uploads.start("t1", "uploads/a.pdf", "documents/a.pdf")
+        await asyncio.sleep(0.05)
+        # Already running while the caller does other work
+        assert calls == [("uploads/a.pdf", "documents/a.pdf")]
+        release.set()
+        uri = await uploads.result("t1", "uploads/a.pdf", "documents/a.pdf")
+        return uri, dict(uploads._pending)
+
+    uri, pending = asyncio.run(main())
+    assert uri == "file://documents/a.pdf"
+    assert pending == {}
+    assert len(calls) == 1
+
+
+def test_result_starts_an_upload_that_was_never_started(monkeypatch):
+    monkeypatch.setattr(cloud_storage, "store_document", lambda source, destination: f"file://{destination}")
+
+    async def main():
+        uploads = BackgroundUploads()
+        return await uploads.result("t2", "uploads/b.pdf", "documents/b.pdf")
+
+    assert asyncio.run(main()) == "file://documents/b.pdf"
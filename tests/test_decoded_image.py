@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from services.decoded_image import DecodedImage, EXIF_ORIENTATION
+from components.segformer.inference import preprocess_image, IMAGE_SIZE
+
+
+def make_image(path, orientation=1, size=(640, 400), fmt="JPEG"):
+    rng = np.random.default_rng(7)
+    w, h = size
+    pixels = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 2)
+    img = Image.fromarray(pixels)
+    exif = img.getexif()
+    exif[EXIF_ORIENTATION] = orientation
+    img.save(path, fmt, exif=exif, **({"quality": 90} if fmt == "JPEG" else {}))
+    return str(path)
+
+
+@pytest.mark.parametrize("orientation", [1, 3, 6, 8])
+@pytest.mark.parametrize("fmt,ext", [("JPEG", "jpg"), ("PNG", "png")])
+def test_views_match_what_each_detector_decoded_itself(tmp_path, orientation, fmt, ext):
+    path = make_image(tmp_path / f"o{orientation}.{ext}", orientation, fmt=fmt)
+    image = DecodedImage(path)
+
+    # Models: Pillow, orientation not applied
+    assert np.array_equal(image.rgb, np.asarray(Image.open(path).convert("RGB")))
+    assert image.size == Image.open(path).size
+    # ELA / noise / quantization: cv2.imread, orientation applied
+    assert np.array_equal(image.bgr, cv2.imread(path))
+    assert np.array_equal(image.gray, cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+
+
+def test_views_are_read_only_and_cached(tmp_path):
+    image = DecodedImage(make_image(tmp_path / "a.jpg"))
+    assert image.rgb is image.rgb
+    with pytest.raises(ValueError):
+        image.gray[0, 0] = 1
+    image.close()
+    assert image.rgb.shape == (400, 640, 3)
+
+
+def test_downscaled_matches_pillow_thumbnail(tmp_path):
+    path = make_image(tmp_path / "big.jpg", size=(1500, 900))
+    reference = Image.open(path).convert("RGB")
+    reference.thumbnail((1024, 1024))
+
+    image = DecodedImage(path)
+    assert np.array_equal(image.downscaled(1024), np.asarray(reference))
+    assert image.downscaled(0) is image.rgb
+    assert image.downscaled(4096) is image.rgb
+
+
+@pytest.mark.parametrize("size", [(1500, 900), (300, 200)])
+def test_segformer_input_matches_pillow_bilinear(tmp_path, size):
+    path = make_image(tmp_path / "s.jpg", orientation=6, size=size)
+    resized = Image.open(path).convert("RGB").resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+    arr = torch.tensor(np.array(resized).astype(np.float32) / 255.0).permute(2, 0, 1)
+    mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+    std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+    reference = ((arr - mean) / std).unsqueeze(0)
+
+    tensor, original_size = preprocess_image(DecodedImage(path))
+    assert original_size == size
+    assert torch.equal(tensor, reference)
+    assert torch.equal(preprocess_image(path)[0], reference)
+
+
+def test_unreadable_file_raises_value_error(tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    with pytest.raises(ValueError):
+        DecodedImage(str(path)).rgb
@@ -0,0 +1,122 @@
+import io
+
+from pypdf import PdfWriter
+
+from services import document_context
+from services.document_context import DocumentContext
+
+
+def make_pdf(path, pages=2, updates=0):
+    """A blank PDF, optionally followed by incremental updates (one extra %%EOF each)."""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    data = buffer.getvalue()
+    for i in range(updates):
+        data += f"\n% update {i}\nxref\n0 0\ntrailer\n<< >>\nstartxref\n0\n%%EOF\n".encode()
+    path.write_bytes(data)
+    return data
+
+
+def test_views_are_lazy_and_parsed_once(tmp_path, monkeypatch):
+    path = tmp_path / "doc.pdf"
+    make_pdf(path, pages=3)
+    opened = []
+    monkeypatch.setattr(document_context, "open", lambda *a: opened.append(a) or open(*a), raising=False)
+    with DocumentContext(str(path), "application/pdf") as document:
+        # Nothing is opened until a stage asks for a view
+        assert document._handles == []
+        reader = document.pypdf_reader
+        assert document.pypdf_reader is reader
+        assert len(reader.pages) == 3
+        assert document.trailer is reader.trailer
+        assert document.pyhanko_reader is document.pyhanko_reader
+        assert document.embedded_signatures == []
+        # The file is opened and mapped once; pypdf and pyHanko read the mapping through their own cursors
+        assert len(opened) == 1
+        assert document.pypdf_reader.stream is not document.pyhanko_reader.stream
+    assert document._handles == []
+
+
+def test_raw_is_a_mapping_of_the_file(tmp_path):
+    path = tmp_path / "doc.pdf"
+    data = make_pdf(path)
+    with DocumentContext(str(path)) as document:
+        raw = document.raw
+        assert raw is document.raw
+        assert bytes(raw[:]) == data
+        assert document.count(b"%%EOF") == data.count(b"%%EOF")
+
+
+def test_xref_info_counts_incremental_updates(tmp_path):
+    original = tmp_path / "original.pdf"
+    updated = tmp_path / "updated.pdf"
+    make_pdf(original)
+    make_pdf(updated, updates=2)
+    with DocumentContext(str(original)) as a, DocumentContext(str(updated)) as b:
+        assert b.xref_info["eof_markers"] == a.xref_info["eof_markers"] + 2
+        assert b.xref_info["startxref_offsets"] == a.xref_info["startxref_offsets"] + 2
+
+
+def test_empty_file_maps_to_empty_bytes(tmp_path):
+    path = tmp_path / "empty.pdf"
+    path.write_bytes(b"")
+    with DocumentContext(str(path)) as document:
+        assert document.raw == b""
+        assert document.count(b"%%EOF") == 0
+
+
+def test_embedded_images_of_a_text_only_pdf(tmp_path):
+    path = tmp_path / "doc.pdf"
+    make_pdf(path)
+    with DocumentContext(str(path)) as document:
+        assert document.embedded_images() == []
+
+
+def test_routing_reuses_the_shared_parse(tmp_path):
+    from services.pipeline_orchestrator import determine_pipeline, PipelineType
+
+    path = tmp_path / "doc.pdf"
+    make_pdf(path)
+    with DocumentContext(str(path), "application/pdf") as document:
+        assert determine_pipeline(str(path), "application/pdf", document=document) == PipelineType.STRUCTURAL
+        # The signature scan stays cached for the cryptographic / structural stage
+        reader = document.pyhanko_reader
+        assert "embedded_signatures" in document._cache
+        assert determine_pipeline(str(path), "application/pdf", document=document) == PipelineType.STRUCTURAL
+        assert document.pyhanko_reader is reader
+
+
+def test_structural_and_signature_stages_parse_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    from services.pipeline_orchestrator import analyze_cryptographic, analyze_structural
+
+    path = tmp_path / "doc.pdf"
+    make_pdf(path, updates=1)
+    threads = {}
+
+    def recorded(name, view):
+        def wrapper(self, *args):
+            threads[name] = threading.current_thread()
+            return view(self, *args)
+        return wrapper
+
+    for name in ("xref_info", "pypdf_reader", "embedded_signatures"):
+        monkeypatch.setattr(DocumentContext, name, property(recorded(name, getattr(DocumentContext, name).fget)))
+    monkeypatch.setattr(DocumentContext, "embedded_images", recorded("embedded_images", DocumentContext.embedded_images))
+
+    async def run():
+        with DocumentContext(str(path), "application/pdf") as document:
+            structural = await analyze_structural(str(path), document=document)
+            await analyze_cryptographic(str(path), document=document)
+        return structural, threading.current_thread()
+
+    structural, loop_thread = asyncio.run(run())
+    assert structural["details"]["eof_markers_found"] == 2
+    assert structural["details"]["embedded_image_count"] == 0
+    assert set(threads) == {"xref_info", "pypdf_reader", "embedded_signatures", "embedded_images"}
+    assert all(thread is not loop_thread for thread in threads.values())
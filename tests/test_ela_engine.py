@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+import pytest
+
+from services import ela_engine
+from services.cancellation import AnalysisCancelled, CancellationToken, use_token
+from services.ela_engine import (JPEG_MCU_SIZE, find_ghosts, grid_aligned_crop, jpeg_ghost_analysis, recompress,
+                                 sweep_qualities)
+
+
+def textured(size=256, seed=0):
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 255, (size, size, 3), dtype=np.uint8), (5, 5), 0)
+
+
+def jpeg(bgr, quality):
+    return cv2.imdecode(cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])[1], cv2.IMREAD_COLOR)
+
+
+def test_in_memory_round_trip_matches_a_file_round_trip(tmp_path):
+    image = textured(64)
+    path = str(tmp_path / "resaved.jpg")
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    assert np.array_equal(recompress(image, 90), cv2.imread(path))
+
+
+def test_sweep_qualities_follow_the_configuration(monkeypatch):
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_MIN_QUALITY", 90)
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_MAX_QUALITY", 70)
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_STEP", 5)
+    assert sweep_qualities() == [70, 75, 80, 85, 90]
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_MAX_QUALITY", 120)
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_STEP", 0)
+    assert sweep_qualities() == list(range(90, 101))
+
+
+def test_crop_stays_on_the_jpeg_grid_within_the_budget():
+    image = np.zeros((1000, 1500, 3), dtype=np.uint8)
+    crop = grid_aligned_crop(image, 200_000)
+    h, w = crop.shape[:2]
+    assert h * w <= 200_000
+    assert h % JPEG_MCU_SIZE == 0 and w % JPEG_MCU_SIZE == 0
+    # A view whose origin is a multiple of the MCU size
+    assert np.shares_memory(crop, image)
+    offset = (crop.__array_interface__["data"][0] - image.__array_interface__["data"][0]) // 3
+    y, x = divmod(offset, 1500)
+    assert y % JPEG_MCU_SIZE == 0 and x % JPEG_MCU_SIZE == 0
+    assert grid_aligned_crop(image, 0) is image
+    assert grid_aligned_crop(image, 10_000_000) is image
+
+
+def test_find_ghosts_reports_dips_deepest_first():
+    qualities = [60, 61, 62, 63, 64, 65]
+    curve = [10.0, 6.0, 10.0, 10.0, 4.0, 9.0]
+    ghosts = find_ghosts(qualities, curve)
+    assert [g["quality"] for g in ghosts] == [64, 61]
+    assert ghosts[0]["dip"] == pytest.approx(0.556, abs=1e-3)
+    # Shallow dips and flat curves are not ghosts
+    assert find_ghosts(qualities, [10.0, 9.5, 10.0, 10.0, 10.0, 10.0]) == []
+    assert find_ghosts([60], [5.0]) == []
+
+
+@pytest.mark.parametrize("quality", [70, 80])
+def test_sweep_finds_the_quality_an_image_was_saved_with(quality):
+    result = jpeg_ghost_analysis(jpeg(textured(), quality), max_pixels=0)
+    assert result["best_quality"] == quality
+    assert len(result["mean_residual"]) == len(result["max_residual"]) == len(result["qualities"])
+    assert result["analyzed_pixels"] == 256 * 256
+
+
+def test_never_compressed_image_has_no_ghost():
+    result = jpeg_ghost_analysis(textured(), max_pixels=0)
+    assert result["best_quality"] is None and result["earlier_quality"] is None
+
+
+def test_a_deep_dip_below_the_last_save_marks_an_earlier_save(monkeypatch):
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_MIN_QUALITY", 60)
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_MAX_QUALITY", 66)
+    monkeypatch.setattr(ela_engine, "ELA_SWEEP_STEP", 1)
+    curve = {60: 9.0, 61: 5.0, 62: 9.0, 63: 9.0, 64: 9.0, 65: 2.0, 66: 8.0}
+    monkeypatch.setattr(ela_engine, "_residual_stats", lambda region, q: (curve[q], curve[q] * 3))
+    result = jpeg_ghost_analysis(textured(32), max_pixels=0)
+    assert result["best_quality"] == 65
+    assert result["earlier_quality"] == 61
+    assert result["max_residual"][0] == 27.0
+
+
+def test_cancelled_analysis_stops_the_sweep():
+    token = CancellationToken()
+    token.cancel("client_cancelled")
+    with use_token(token), pytest.raises(AnalysisCancelled):
+        jpeg_ghost_analysis(textured(64), max_pixels=0)
+
+
+def test_perform_ela_leaves_only_its_overlay_on_disk(tmp_path):
+    from services.pipeline_orchestrator import perform_ela
+
+    path = tmp_path / "scan.jpg"
+    cv2.imwrite(str(path), textured(), [cv2.IMWRITE_JPEG_QUALITY, 75])
+    result = perform_ela(str(path), quality=90, sweep=True, sweep_max_pixels=0)
+    assert result["status"] == "success"
+    assert result["ghost"]["best_quality"] == 75
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["scan.jpg", "scan.jpg.ela.png"]
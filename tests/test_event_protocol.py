@@ -0,0 +1,67 @@
+def test_complete_delta_drops_the_report(api):
+    _, main = api
+    final_response = {"task_id": "t1", "report": {"score": 0.1}, "reasoning": {"authenticity_score": 80}}
+    delta = main.complete_delta(final_response, report_seq=7)
+    assert delta == {"task_id": "t1", "reasoning": {"authenticity_score": 80}, "report_seq": 7}
+    # The response itself is left whole (it is what gets stored)
+    assert "report" in final_response
+
+
+def test_report_is_sent_once(analyze):
+    analyze.report = {"score": 0.2, "flags": ["incremental update"], "details": {"pages": 2}}
+    _, events = analyze(b"%PDF-1.4\n% report once\n")
+
+    with_report = [e for e in events if isinstance(e.get("data"), dict) and e["data"].get("details") is not None]
+    assert len(with_report) == 1
+    report_event = with_report[0]
+    assert report_event["step"] == "ANALYSIS_COMPLETE"
+    assert report_event["data"]["flags"] == ["incremental update"]
+
+    complete = events[-1]
+    assert complete["step"] == "COMPLETE"
+    assert "report" not in complete["data"]
+    assert complete["data"]["report_seq"] == report_event["seq"]
+    assert complete["data"]["reasoning"]["score_breakdown"]
+    assert [e["seq"] for e in events] == list(range(1, len(events) + 1))
+
+
+def test_cache_hit_follows_the_same_protocol(analyze):
+    data = b"%PDF-1.4\n% cached protocol\n"
+    analyze(data)
+    _, events = analyze(data)
+
+    assert any(e.get("step") == "CACHE_HIT" for e in events)
+    report_event = next(e for e in events if e.get("step") == "ANALYSIS_COMPLETE")
+    complete = events[-1]
+    assert "report" not in complete["data"]
+    assert complete["data"]["report_seq"] == report_event["seq"]
+    assert complete["data"]["cached"] is True
+
+
+def test_reconnect_after_the_report_gets_only_the_delta(analyze, api):
+    client, _ = api
+    task_id, events = analyze(b"%PDF-1.4\n% reconnect delta\n")
+    report_seq = events[-1]["data"]["report_seq"]
+
+    with client.websocket_connect(f"/ws/analyze/{task_id}?last_event={report_seq}") as ws:
+        replayed = []
+        while True:
+            event = ws.receive_json()
+            replayed.append(event)
+            if event.get("status") == "complete":
+                break
+    assert [e["seq"] for e in replayed] == [e["seq"] for e in events if e["seq"] > report_seq]
+    assert all(e.get("step") != "ANALYSIS_COMPLETE" for e in replayed)
+
+
+def test_stored_result_is_sent_whole_once_the_session_is_gone(analyze, api):
+    client, main = api
+    task_id, _ = analyze(b"%PDF-1.4\n% stored whole\n")
+    # Simulates a restart: only the result store still knows the task
+    del main.analysis_sessions._sessions[task_id]
+
+    with client.websocket_connect(f"/ws/analyze/{task_id}") as ws:
+        event = ws.receive_json()
+    assert event["step"] == "COMPLETE"
+    assert event["data"]["report"]["score"] == 0.1
+    assert "report_seq" not in event["data"]
@@ -0,0 +1,128 @@
+import json
+import asyncio
+
+import pytest
+
+from services import forensic_reasoning
+from services.forensic_reasoning import run_semantic_reasoning_async
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """generate_content_async stand-in: replays `outcomes` (exception, delay or JSON text)."""
+
+    def __init__(self, outcomes, delay=0.0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return FakeResponse(outcome)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Installs a FakeModel; no network, no backoff sleeps, a fresh semaphore per test."""
+    def install(outcomes, delay=0.0, concurrency=4):
+        model = FakeModel(outcomes, delay)
+        monkeypatch.setattr(forensic_reasoning, "build_reasoning_request",
+                            lambda uri, mime_type, report: (model, ["doc", "prompt"], {}, "fake-model"))
+        monkeypatch.setattr(forensic_reasoning, "REASONING_BACKOFF_SECONDS", 0.0)
+        monkeypatch.setattr(forensic_reasoning, "_reasoning_semaphore", asyncio.Semaphore(concurrency))
+        return model
+    return install
+
+
+VERDICT = json.dumps({"authenticity_score": 88, "summary": "Looks genuine"})
+
+
+def test_successful_call_returns_parsed_verdict(fake_model):
+    model = fake_model([VERDICT])
+    result = asyncio.run(run_semantic_reasoning_async("file:///doc.pdf"))
+    assert result == {"authenticity_score": 88, "summary": "Looks genuine", "model_name": "fake-model"}
+    assert model.calls == 1
+
+
+def test_transient_failures_are_retried(fake_model, monkeypatch):
+    monkeypatch.setattr(forensic_reasoning, "REASONING_MAX_RETRIES", 2)
+    model = fake_model([RuntimeError("503"), RuntimeError("503"), VERDICT])
+    result = asyncio.run(run_semantic_reasoning_async("file:///doc.pdf"))
+    assert result["authenticity_score"] == 88
+    assert model.calls == 3
+
+
+def test_retries_are_bounded(fake_model, monkeypatch):
+    monkeypatch.setattr(forensic_reasoning, "REASONING_MAX_RETRIES", 1)
+    model = fake_model([RuntimeError("quota exceeded")])
+    result = asyncio.run(run_semantic_reasoning_async("file:///doc.pdf"))
+    assert result == {"error": "Reasoning layer failed: quota exceeded"}
+    assert model.calls == 2
+
+
+def test_malformed_output_is_not_retried(fake_model):
+    model = fake_model(["not json"])
+    result = asyncio.run(run_semantic_reasoning_async("file:///doc.pdf"))
+    assert result["error"].startswith("Reasoning layer failed")
+    assert model.calls == 1
+
+
+def test_deadline_marks_the_result_timed_out(fake_model):
+    fake_model([VERDICT], delay=1.0)
+    result = asyncio.run(run_semantic_reasoning_async("file:///doc.pdf", deadline_seconds=0.05))
+    assert result["timed_out"] is True
+    assert "timed out" in result["error"]
+
+
+def test_concurrent_calls_are_capped(fake_model):
+    model = fake_model([VERDICT], delay=0.02, concurrency=2)
+
+    async def main():
+        return await asyncio.gather(*(run_semantic_reasoning_async("file:///doc.pdf") for _ in range(6)))
+
+    results = asyncio.run(main())
+    assert all(r["authenticity_score"] == 88 for r in results)
+    assert model.peak == 2
+
+
+def test_analysis_falls_back_to_local_weights_without_a_verdict(analyze):
+    analyze.report = {"score": 0.25, "flags": [], "details": {}}
+    analyze.reasoning = {"error": "Reasoning layer timed out after 45s", "timed_out": True}
+    _, events = analyze(b"%PDF-1.4\n% reasoning fallback\n")
+
+    assert any(e.get("step") == "REASONING_FALLBACK" and "timed out" in e["message"] for e in events)
+    complete = events[-1]
+    assert complete["step"] == "COMPLETE"
+    reasoning = complete["data"]["reasoning"]
+    assert reasoning["fallback"] == "local_only"
+    assert reasoning["original_ai_score"] is None
+    # Structural document, no AI verdict: metadata/structure carries the whole score
+    assert reasoning["authenticity_score"] == 75
+    assert reasoning["score_breakdown"]["Metadata/Structure (100%)"] == 75.0
+
+
+def test_analysis_blends_the_ai_verdict_when_available(analyze):
+    analyze.report = {"score": 0.25, "flags": [], "details": {}}
+    analyze.reasoning = {"authenticity_score": 95, "summary": "Genuine"}
+    _, events = analyze(b"%PDF-1.4\n% reasoning verdict\n")
+
+    assert not any(e.get("step") == "REASONING_FALLBACK" for e in events)
+    reasoning = events[-1]["data"]["reasoning"]
+    assert "fallback" not in reasoning
+    assert reasoning["original_ai_score"] == 95
+    assert reasoning["authenticity_score"] == round(95 * 0.6 + 75 * 0.4)
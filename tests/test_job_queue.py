@@ -0,0 +1,122 @@
+import io
+import asyncio
+
+import pytest
+
+from services.job_queue import AnalysisQueue, QueueFull
+from services.cancellation import AnalysisCancelled
+
+
+def test_queue_runs_jobs_on_a_bounded_worker_pool():
+    running = []
+    peak = []
+
+    async def main():
+        queue = AnalysisQueue(workers=2, max_depth=8)
+
+        def make(i):
+            async def run():
+                running.append(i)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.remove(i)
+                return i * 10
+            return run
+
+        jobs = [queue.submit(make(i)) for i in range(5)]
+        results = [await job.result() for job in jobs]
+        stats = queue.stats()
+        await queue.stop()
+        return results, stats
+
+    results, stats = asyncio.run(main())
+    assert results == [0, 10, 20, 30, 40]
+    assert max(peak) == 2
+    assert stats["completed"] == 5 and stats["queue_depth"] == 0 and stats["running"] == 0
+
+
+def test_submit_raises_queue_full_at_max_depth():
+    async def main():
+        queue = AnalysisQueue(workers=1, max_depth=2)
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+
+        jobs = [queue.submit(blocked)]
+        await asyncio.sleep(0)  # the worker picks up the first job
+        jobs += [queue.submit(blocked), queue.submit(blocked)]
+        assert queue.is_full()
+        with pytest.raises(QueueFull):
+            queue.submit(blocked)
+        stats = queue.stats()
+        release.set()
+        await asyncio.gather(*(job.result() for job in jobs))
+        await queue.stop()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == 2 and stats["running"] == 1
+
+
+def test_waiting_jobs_are_told_their_position():
+    positions = []
+
+    async def main():
+        queue = AnalysisQueue(workers=1, max_depth=4)
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+
+        async def on_position(position):
+            positions.append(position)
+
+        first = queue.submit(blocked)
+        await asyncio.sleep(0)
+        second = queue.submit(blocked)
+        third = queue.submit(blocked, on_position=on_position)
+        assert queue.position(first) == 0
+        assert queue.position(second) == 1
+        assert queue.position(third) == 2
+        release.set()
+        await asyncio.gather(first.result(), second.result(), third.result())
+        await queue.stop()
+
+    asyncio.run(main())
+    # Notified as the line moved: second place once the first job finished
+    assert positions == [1]
+
+
+def test_failures_and_cancellations_reach_the_submitter():
+    async def main():
+        queue = AnalysisQueue(workers=1, max_depth=4)
+
+        async def broken():
+            raise RuntimeError("pipeline failed")
+
+        async def cancelled():
+            raise AnalysisCancelled("deadline")
+
+        async def fine():
+            return "ok"
+
+        jobs = [queue.submit(broken), queue.submit(cancelled), queue.submit(fine)]
+        results = await asyncio.gather(*(job.result() for job in jobs), return_exceptions=True)
+        await queue.stop()
+        return results
+
+    broken, cancelled, fine = asyncio.run(main())
+    assert isinstance(broken, RuntimeError)
+    assert isinstance(cancelled, AnalysisCancelled)
+    # A failing job does not take its worker down
+    assert fine == "ok"
+
+
+def test_upload_is_refused_with_429_while_the_queue_is_full(api, monkeypatch):
+    client, main = api
+    monkeypatch.setattr(main.analysis_queue, "is_full", lambda: True)
+    response = client.post("/api/upload", files={"file": ("doc.pdf", io.BytesIO(b"%PDF-1.4\n"), "application/pdf")})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+
+from services.artifact_sweeper import ArtifactSweeper
+from services.cloud_storage import LocalStorage, content_addressed_blob_name
+
+
+def upload(tmp_path, name, data=b"%PDF-1.4 document"):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir(exist_ok=True)
+    path = uploads / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_put_links_instead_of_copying(tmp_path):
+    store = LocalStorage(str(tmp_path / "storage"))
+    source = upload(tmp_path, "t1.pdf")
+    uri = store.put(source, content_addressed_blob_name("abc", "t1.pdf"))
+    stored = uri[len("file://"):]
+    assert open(stored, "rb").read() == b"%PDF-1.4 document"
+    assert os.stat(stored).st_ino == os.stat(source).st_ino
+
+
+def test_objects_are_kept_while_their_upload_exists(tmp_path):
+    store = LocalStorage(str(tmp_path / "storage"), ttl_seconds=60)
+    source = upload(tmp_path, "t1.pdf")
+    stored = store.put(source, "documents/abc.pdf")[len("file://"):]
+    age(stored, 3600)
+
+    assert store.purge_expired() == 0
+    assert os.path.exists(stored)
+
+
+def test_objects_of_swept_uploads_are_purged_after_the_ttl(tmp_path):
+    store = LocalStorage(str(tmp_path / "storage"), ttl_seconds=60)
+    source = upload(tmp_path, "t1.pdf")
+    stored = store.put(source, "documents/abc.pdf")[len("file://"):]
+    os.remove(source) # the artifact sweeper evicted the upload
+
+    assert store.purge_expired() == 0 # stored recently
+    assert store.purge_expired(now=time.time() + 120) == 1
+    assert not os.path.exists(stored)
+
+
+def test_storing_the_same_bytes_again_restarts_retention(tmp_path):
+    store = LocalStorage(str(tmp_path / "storage"), ttl_seconds=60)
+    first = upload(tmp_path, "t1.pdf")
+    stored = store.put(first, "documents/abc.pdf")[len("file://"):]
+    os.remove(first)
+    age(stored, 3600)
+
+    # A second upload of the same document reuses the object
+    second = upload(tmp_path, "t2.pdf")
+    store.put(second, "documents/abc.pdf")
+    assert store.purge_expired() == 0
+    assert os.path.exists(stored)
+
+
+def test_sweeper_runs_the_purge_with_reconcile(tmp_path):
+    calls = []
+    sweeper = ArtifactSweeper(str(tmp_path), maintenance=[lambda: calls.append(1)])
+
+    async def main():
+        task = asyncio.create_task(sweeper.run(interval_seconds=0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(main())
+    # Once at startup; the next reconcile is RECONCILE_INTERVAL_SECONDS away
+    assert calls == [1]
@@ -0,0 +1,66 @@
+from services.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_renders_prometheus_text():
+    counter = Counter("jobs_total", "Jobs.", labels=("outcome",))
+    counter.inc(outcome="ok")
+    counter.inc(2, outcome="ok")
+    counter.inc(outcome='bad "quoted"\nline')
+    lines = counter.render()
+    assert lines[:2] == ["# HELP jobs_total Jobs.", "# TYPE jobs_total counter"]
+    assert 'jobs_total{outcome="ok"} 3' in lines
+    assert 'jobs_total{outcome="bad \\"quoted\\"\\nline"} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage_seconds", "Stages.", labels=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage="ela")
+    lines = histogram.render()
+    assert 'stage_seconds_bucket{stage="ela",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="ela",le="1.0"} 3' in lines
+    assert 'stage_seconds_bucket{stage="ela",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="ela"} 4' in lines
+    assert 'stage_seconds_sum{stage="ela"} 4.25' in lines
+
+
+def test_histogram_times_a_block_even_when_it_raises():
+    histogram = Histogram("block_seconds", "Blocks.", labels=("stage",))
+    try:
+        with histogram.time(stage="failing"):
+            raise ValueError("detector crashed")
+    except ValueError:
+        pass
+    assert 'block_seconds_count{stage="failing"} 1' in histogram.render()
+
+
+def test_gauge_callback_is_read_at_scrape_time():
+    state = {"waiting": 1}
+    gauge = Gauge("queue_jobs", "Jobs.", labels=("state",), callback=lambda: {("waiting",): state["waiting"]})
+    assert 'queue_jobs{state="waiting"} 1' in gauge.render()
+    state["waiting"] = 4
+    assert 'queue_jobs{state="waiting"} 4' in gauge.render()
+
+    broken = Gauge("broken", "Broken.", callback=lambda: 1 / 0)
+    # A failing callback drops its samples instead of failing the scrape
+    assert broken.render() == ["# HELP broken Broken.", "# TYPE broken gauge"]
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    registry.register(Counter("a_total", "A.")).inc()
+    registry.register(Gauge("b", "B.")).set(2.5)
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "a_total 1\n" in text and "b 2.5\n" in text
+
+
+def test_metrics_endpoint_exposes_the_process_metrics(api):
+    client, _ = api
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for name in ("veridoc_stage_duration_seconds", "veridoc_detector_duration_seconds",
+                 "veridoc_analyses_total", "veridoc_cache_requests_total", "veridoc_analysis_queue_jobs"):
+        assert f"# TYPE {name} " in response.text
+    assert 'veridoc_analysis_queue_jobs{state="running"}' in response.text
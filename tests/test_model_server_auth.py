@@ -0,0 +1,140 @@
+import os
+import socket
+import stat
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import pytest
+
+from components.model_server import client as model_client
+
+
+@pytest.fixture(autouse=True)
+def no_configured_key(monkeypatch):
+    monkeypatch.setattr(model_client, "MODEL_SERVER_AUTHKEY", "")
+    monkeypatch.setattr(model_client, "MODEL_SERVER_AUTHKEY_FILE", "")
+
+
+def test_tcp_without_key_is_refused():
+    with pytest.raises(model_client.ModelServerError):
+        model_client.resolve_authkey("0.0.0.0:7000", create=True)
+    with pytest.raises(model_client.ModelServerError):
+        model_client.resolve_authkey("127.0.0.1:7000")
+
+
+def test_explicit_key_and_key_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_client, "MODEL_SERVER_AUTHKEY", "from-env")
+    assert model_client.resolve_authkey("127.0.0.1:7000") == b"from-env"
+
+    secret = tmp_path / "secret"
+    secret.write_bytes(b"from-file\n")
+    monkeypatch.setattr(model_client, "MODEL_SERVER_AUTHKEY", "")
+    monkeypatch.setattr(model_client, "MODEL_SERVER_AUTHKEY_FILE", str(secret))
+    assert model_client.resolve_authkey("127.0.0.1:7000", create=True) == b"from-file"
+
+
+def test_unix_socket_gets_a_private_random_key(tmp_path):
+    socket_path = str(tmp_path / "models.sock")
+    first = model_client.resolve_authkey(socket_path, create=True)
+    mode = stat.S_IMODE(os.stat(model_client.key_file_path(socket_path)).st_mode)
+    assert mode == 0o600
+    assert model_client.resolve_authkey(socket_path) == first
+    # Every server start rotates it
+    assert model_client.resolve_authkey(socket_path, create=True) != first
+
+
+def test_missing_key_file_is_a_model_server_error(tmp_path):
+    with pytest.raises(model_client.ModelServerError):
+        model_client.resolve_authkey(str(tmp_path / "absent.sock"))
+
+
+def test_wrong_key_cannot_connect(tmp_path):
+    socket_path = str(tmp_path / "models.sock")
+    key = model_client.resolve_authkey(socket_path, create=True)
+    listener = Listener(socket_path, family="AF_UNIX", authkey=key)
+
+    def accept_one():
+        try:
+            listener.accept().close()
+        except Exception:
+            pass
+
+    server = threading.Thread(target=accept_one, daemon=True)
+    server.start()
+    with pytest.raises(AuthenticationError):
+        Client(socket_path, family="AF_UNIX", authkey=b"veridoc-model-server")
+    server.join(1)
+    listener.close()
+
+
+def _start_server(monkeypatch, tmp_path):
+    """Runs server.main() on a unix socket in a daemon thread, without loading models."""
+    pytest.importorskip("torch")
+    from components.model_server import server
+
+    socket_path = str(tmp_path / "models.sock")
+    monkeypatch.setattr(model_client, "MODEL_SERVER_ADDRESS", socket_path)
+    monkeypatch.setattr(server, "get_segformer", lambda: None)
+    monkeypatch.setattr(server, "TruForEngine", lambda: None)
+    monkeypatch.setattr(server, "HANDSHAKE_TIMEOUT", 0.5)
+    threading.Thread(target=server.main, daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(socket_path) and os.path.exists(model_client.key_file_path(socket_path)):
+            break
+        time.sleep(0.05)
+    return server, socket_path
+
+
+def test_bad_and_stalled_clients_do_not_stop_the_server(monkeypatch, tmp_path):
+    server, socket_path = _start_server(monkeypatch, tmp_path)
+
+    with pytest.raises(AuthenticationError):
+        Client(socket_path, family="AF_UNIX", authkey=b"wrong-key")
+    # Connects and never answers the challenge
+    stalled = socket.socket(socket.AF_UNIX)
+    stalled.connect(socket_path)
+
+    conn = Client(socket_path, family="AF_UNIX", authkey=model_client.resolve_authkey(socket_path))
+    conn.send({"model": "unknown"})
+    assert "error" in conn.recv()
+    conn.close()
+    stalled.close()
+
+
+def test_failed_request_releases_exported_blocks(monkeypatch):
+    torch = pytest.importorskip("torch")
+    import numpy as np
+    from multiprocessing import shared_memory
+    from components.model_server import server
+
+    class HalfBrokenEngine:
+        _model = object()
+        _device = "cpu"
+
+        def forward(self, tensor):
+            return torch.zeros(2, 2), "not a tensor"
+
+    created = []
+    original = model_client.array_to_shared_memory
+
+    def tracking(arr):
+        shm, desc = original(arr)
+        created.append(desc["shm"])
+        return shm, desc
+
+    monkeypatch.setattr(server, "TruForEngine", HalfBrokenEngine)
+    monkeypatch.setattr(model_client, "array_to_shared_memory", tracking)
+
+    shm, desc = original(np.zeros((1, 3, 2, 2), dtype=np.float32))
+    try:
+        reply = server.handle_request({"model": "trufor", "input": desc})
+    finally:
+        shm.close()
+        shm.unlink()
+
+    assert "error" in reply
+    assert len(created) == 1
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=created[0])
@@ -0,0 +1,65 @@
+import asyncio
+
+import numpy as np
+
+from services import model_warmup
+from services.model_warmup import ModelReadiness
+
+
+def overlay(side):
+    return np.zeros((side, side, 4), dtype=np.float32)
+
+
+def warming_readiness(monkeypatch):
+    monkeypatch.setattr(model_warmup, "MODEL_WARMUP", True)
+    monkeypatch.setattr(model_warmup, "WARMUP_IMAGE_SIDE", 64)
+    return ModelReadiness()
+
+
+def test_ready_once_every_model_ran(tmp_path, monkeypatch):
+    readiness = warming_readiness(monkeypatch)
+    monkeypatch.setattr(readiness, "_warm_segformer", overlay)
+    monkeypatch.setattr(readiness, "_warm_trufor", overlay)
+    assert readiness.status == "warming" and not readiness.is_ready
+
+    asyncio.run(readiness.run(str(tmp_path)))
+    state = readiness.to_dict()
+    assert state["status"] == "ready" and readiness.is_ready
+    assert {m["status"] for m in state["models"].values()} == {"ready"}
+    assert state["warmup_ms"] is not None
+    # The synthetic overlays are not left behind
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_degraded_when_a_model_is_unavailable(tmp_path, monkeypatch):
+    readiness = warming_readiness(monkeypatch)
+
+    def missing(side):
+        raise RuntimeError("TruFor model not loaded")
+
+    monkeypatch.setattr(readiness, "_warm_segformer", overlay)
+    monkeypatch.setattr(readiness, "_warm_trufor", missing)
+    readiness.warm_up(str(tmp_path))
+    state = readiness.to_dict()
+    assert state["status"] == "degraded" and readiness.is_ready
+    assert state["models"]["trufor"] == {"status": "unavailable", "error": "TruFor model not loaded"}
+    assert state["models"]["segformer"]["status"] == "ready"
+
+
+def test_warm_up_disabled_is_ready_immediately(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_warmup, "MODEL_WARMUP", False)
+    readiness = ModelReadiness()
+    asyncio.run(readiness.run(str(tmp_path)))
+    assert readiness.status == "ready" and readiness.models == {}
+
+
+def test_ready_endpoint_gates_traffic_while_health_stays_up(api, monkeypatch):
+    client, main = api
+    monkeypatch.setattr(main.model_readiness, "status", "warming")
+    response = client.get("/ready")
+    assert response.status_code == 503 and response.json()["status"] == "warming"
+    assert client.get("/health").status_code == 200
+    assert "veridoc_ready 0" in client.get("/metrics").text
+
+    monkeypatch.setattr(main.model_readiness, "status", "ready")
+    assert client.get("/ready").status_code == 200
@@ -0,0 +1,108 @@
+import io
+import time
+
+import cv2
+import numpy as np
+
+from services import result_cache
+from services.result_cache import ResultIndex
+
+
+def jpeg_bytes(seed=0):
+    rng = np.random.default_rng(seed)
+    pixels = cv2.GaussianBlur(rng.integers(0, 255, (240, 320, 3), dtype=np.uint8), (0, 0), 2)
+    ok, encoded = cv2.imencode(".jpg", pixels, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def wait_for_result(client, task_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = client.get(f"/api/result/{task_id}")
+        if response.status_code == 200:
+            return response.json()
+        time.sleep(0.2)
+    raise AssertionError(f"No result for {task_id}")
+
+
+def test_lookups_do_not_recompute_the_fingerprint(monkeypatch):
+    calls = []
+    monkeypatch.setattr(result_cache, "compute_model_fingerprint", lambda: calls.append(1) or "weights-a")
+    index = ResultIndex()
+    assert calls == [1]
+
+    index.put("hash", {"filename": "t.jpg"}, profile="quick")
+    for _ in range(5):
+        assert index.get("hash", "quick") == {"filename": "t.jpg"}
+    index.version()
+    assert calls == [1]
+
+
+def test_refresh_fingerprint_invalidates_on_new_weights(monkeypatch):
+    fingerprint = {"value": "weights-a"}
+    monkeypatch.setattr(result_cache, "compute_model_fingerprint", lambda: fingerprint["value"])
+    index = ResultIndex()
+    index.put("hash", {"filename": "t.jpg"}, profile="quick")
+
+    index.refresh_fingerprint()
+    assert index.get("hash", "quick") is not None
+    fingerprint["value"] = "weights-b"
+    index.refresh_fingerprint()
+    assert index.get("hash", "quick") is None
+    assert "weights-b" in index.version()
+
+
+def test_entries_expire_and_evict(monkeypatch):
+    monkeypatch.setattr(result_cache, "compute_model_fingerprint", lambda: "weights")
+    index = ResultIndex(max_entries=2, ttl_seconds=60)
+    for name in ("a", "b", "c"):
+        index.put(name, {"filename": f"{name}.jpg"})
+    assert index.get("a") is None
+    assert index.get("c") is not None
+
+    index._entries[("c", "standard", "weights", result_cache.PIPELINE_VERSION)]["stored_at"] -= 120
+    assert index.get("c") is None
+
+
+def test_duplicate_upload_gets_its_own_trace(api):
+    client, _ = api
+    data = jpeg_bytes(seed=1)
+
+    def analyze():
+        response = client.post("/api/upload?autostart=true&profile=quick",
+                               files={"file": ("scan.jpg", io.BytesIO(data), "image/jpeg")})
+        assert response.status_code == 200
+        return wait_for_result(client, response.json()["task_id"])
+
+    first, second = analyze(), analyze()
+    original, reused = first["result"], second["result"]
+    assert not original.get("cached")
+    assert reused["cached"] is True
+    assert reused["report"] == original["report"]
+
+    # The duplicate's trace describes its own (short) run, not the original one
+    assert reused["trace"]["trace_id"] != original["trace"]["trace_id"]
+    assert reused["trace"]["root"]["attributes"]["task_id"] == reused["task_id"]
+    assert reused["trace"]["root"]["attributes"]["cached"] is True
+    assert [c["name"] for c in reused["trace"]["root"]["children"]] == ["cache_lookup"]
+
+    trace = client.get(f"/api/tasks/{reused['task_id']}/trace").json()
+    assert trace["trace_id"] == reused["trace"]["trace_id"]
+
+
+def test_duplicate_upload_skips_the_cloud_upload(api, analyze, monkeypatch):
+    _, main = api
+    started = []
+    monkeypatch.setattr(main.cloud_uploads, "start", lambda task_id, source, blob: started.append(task_id))
+
+    async def stored(task_id, source, blob):
+        return f"file://{blob}"
+
+    monkeypatch.setattr(main.cloud_uploads, "result", stored)
+    data = b"%PDF-1.4\n% duplicate-upload-test\n%%EOF"
+    first, _ = analyze(data)
+    second, events = analyze(data)
+    assert events[-1]["status"] == "complete" and events[-1]["data"]["cached"] is True
+    assert first in started
+    # Served from the result index: no upload queued, not even an exists() check
+    assert second not in started
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import asyncio
+
+import pytest
+
+from services import result_store
+from services.result_store import MemoryResultStore, SQLiteResultStore, decode_result, encode_result
+from services.event_stream import format_sse, sse_stream
+
+RESPONSE = {"task_id": "t1", "report": {"details": {"histogram_values": list(range(256))}}, "reasoning": {}}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(ttl_seconds=3600):
+        if request.param == "memory":
+            return MemoryResultStore(ttl_seconds=ttl_seconds)
+        return SQLiteResultStore(str(tmp_path / "results.sqlite3"), ttl_seconds=ttl_seconds)
+    return make
+
+
+def test_results_are_stored_compressed(make_store):
+    store = make_store()
+    stored = store.put("t1", RESPONSE, content_hash="abc", profile="standard", version="v1")
+    assert stored["size"] < len(json.dumps(RESPONSE))
+    assert decode_result(encode_result(RESPONSE)) == RESPONSE
+
+    row = store.get("t1")
+    assert row["response"] == RESPONSE
+    assert row["expires_at"] == pytest.approx(row["stored_at"] + 3600)
+    assert store.get("unknown") is None
+    assert store.stats()["results"] == 1
+
+
+def test_expired_results_are_not_served(make_store):
+    store = make_store(ttl_seconds=0)
+    store.put("t1", RESPONSE, content_hash="abc", profile="standard", version="v1", reusable=True)
+    assert store.get("t1") is None
+    assert store.get_by_hash("abc", "standard", "v1") is None
+    assert store.stats()["results"] == 0
+
+
+def test_hash_lookup_needs_a_reusable_row_of_the_same_profile_and_version(make_store):
+    store = make_store()
+    store.put("failed", {"task_id": "failed"}, content_hash="abc", profile="standard", version="v1", reusable=False)
+    assert store.get_by_hash("abc", "standard", "v1") is None
+
+    store.put("older", {"task_id": "older"}, content_hash="abc", profile="standard", version="v1",
+              artifacts=["uploads/older.pdf"], reusable=True)
+    time.sleep(0.01)
+    store.put("newer", {"task_id": "newer"}, content_hash="abc", profile="standard", version="v1",
+              artifacts=["uploads/newer.pdf"], reusable=True)
+    hit = store.get_by_hash("abc", "standard", "v1")
+    assert hit == {"response": {"task_id": "newer"}, "artifacts": ["uploads/newer.pdf"], "task_id": "newer"}
+    assert store.get_by_hash("abc", "deep", "v1") is None
+    assert store.get_by_hash("abc", "standard", "v2") is None
+
+
+def test_sqlite_results_survive_a_restart_and_expired_rows_are_purged(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_STORE_PURGE_INTERVAL_SECONDS", 0)
+    path = str(tmp_path / "results.sqlite3")
+    SQLiteResultStore(path).put("t1", RESPONSE)
+    assert SQLiteResultStore(path).get("t1")["response"] == RESPONSE
+
+    short_lived = SQLiteResultStore(path, ttl_seconds=0)
+    short_lived.put("t2", RESPONSE)
+    # The next write deletes the expired row
+    short_lived.put("t3", RESPONSE)
+    count = short_lived._connect().execute("SELECT COUNT(*) FROM results WHERE task_id = 't2'").fetchone()[0]
+    assert count == 0
+
+
+def test_result_database_is_not_served(api):
+    client, main = api
+    db_path = os.path.abspath(main.result_store.db_path)
+    assert not db_path.startswith(os.path.abspath(main.UPLOAD_DIR) + os.sep)
+    for name in (".results.sqlite3", "results.sqlite3", ".results.sqlite3-wal"):
+        assert client.get(f"/static/uploads/{name}").status_code == 404
+        assert client.get(f"/api/artifacts/{name}").status_code == 404
+
+
+def test_sse_frames_carry_the_sequence_number():
+    assert format_sse({"seq": 3, "step": "INIT"}) == 'id: 3\ndata: {"seq": 3, "step": "INIT"}\n\n'
+    assert format_sse({"status": "error"}) == 'data: {"status": "error"}\n\n'
+
+
+def test_sse_stream_sends_keepalives_while_idle():
+    async def events():
+        yield {"seq": 1, "step": "INIT"}
+        await asyncio.sleep(0.05)
+        yield {"seq": 2, "status": "complete"}
+
+    async def main():
+        return [chunk async for chunk in sse_stream(events(), keepalive_seconds=0.01)]
+
+    chunks = asyncio.run(main())
+    assert chunks[0].startswith("id: 1\n")
+    assert ": keep-alive\n\n" in chunks
+    assert chunks[-1].startswith("id: 2\n")
+
+
+def poll_result(client, task_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f"/api/result/{task_id}")
+        if response.status_code != 202:
+            return response
+        time.sleep(0.05)
+    raise AssertionError(f"{task_id} did not finish")
+
+
+def test_polling_clients_get_the_stored_result(analyze, api):
+    client, _ = api
+    assert client.get("/api/result/unknown-task").status_code == 404
+
+    upload = client.post("/api/upload", files={"file": ("doc.pdf", b"%PDF-1.4\n% polled\n", "application/pdf")})
+    task_id = upload.json()["task_id"]
+    pending = client.get(f"/api/result/{task_id}")
+    assert pending.status_code == 202 and pending.json()["status"] == "pending"
+
+    started = client.post("/api/upload", params={"autostart": "true"},
+                          files={"file": ("doc.pdf", b"%PDF-1.4\n% autostarted\n", "application/pdf")})
+    assert started.json()["started"] is True
+    task_id = started.json()["task_id"]
+    response = poll_result(client, task_id)
+    body = response.json()
+    assert response.status_code == 200 and body["status"] == "complete"
+    # The stored result is whole: report included, no reference to a session event
+    assert body["result"]["task_id"] == task_id
+    assert body["result"]["report"]["score"] == 0.1
+    assert body["expires_at"] > body["stored_at"]
+
+
+def test_sse_stream_of_progress(analyze, api):
+    client, _ = api
+    upload = client.post("/api/upload", files={"file": ("doc.pdf", b"%PDF-1.4\n% sse\n", "application/pdf")})
+    task_id = upload.json()["task_id"]
+
+    response = client.get(f"/api/tasks/{task_id}/events")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in response.text.split("\n\n") if f.startswith("id: ")]
+    events = [json.loads(f.split("data: ", 1)[1]) for f in frames]
+    assert [e["seq"] for e in events] == list(range(1, len(events) + 1))
+    assert events[-1]["step"] == "COMPLETE"
+
+    # EventSource resuming after the terminal event is told to stop
+    done = client.get(f"/api/tasks/{task_id}/events", headers={"Last-Event-ID": str(events[-1]["seq"])})
+    assert done.status_code == 204
+    assert client.get("/api/tasks/unknown-task/events").status_code == 404
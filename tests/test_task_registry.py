@@ -0,0 +1,92 @@
+import os
+import threading
+
+import pytest
+
+from services.task_registry import MemoryTaskRegistry, SQLiteTaskRegistry, create_task_registry
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def registry(request, tmp_path):
+    if request.param == "memory":
+        return MemoryTaskRegistry()
+    return SQLiteTaskRegistry(str(tmp_path / ".task_registry.sqlite3"))
+
+
+def test_register_get_update_remove(registry):
+    record = registry.register("t1", path="uploads/t1.pdf", content_type="application/pdf")
+    assert record["task_id"] == "t1" and record["created_at"] > 0
+
+    assert registry.get("t1")["path"] == "uploads/t1.pdf"
+    registry.update("t1", profile="deep")
+    assert registry.get("t1")["profile"] == "deep"
+
+    registry.remove("t1")
+    assert registry.get("t1") is None
+    assert registry.get("missing") is None
+    # Updating an unknown task is a no-op, not an insert
+    registry.update("missing", profile="quick")
+    assert registry.get("missing") is None
+
+
+def test_get_returns_a_copy(registry):
+    registry.register("t1", path="a")
+    registry.get("t1")["path"] = "changed"
+    assert registry.get("t1")["path"] == "a"
+
+
+def test_sqlite_registry_is_shared_between_workers(tmp_path):
+    db = str(tmp_path / ".task_registry.sqlite3")
+    upload_worker, socket_worker = SQLiteTaskRegistry(db), SQLiteTaskRegistry(db)
+    upload_worker.register("t1", path="uploads/t1.jpg", sha256="abc")
+    assert socket_worker.get("t1")["sha256"] == "abc"
+
+
+def test_sqlite_registry_from_several_threads(tmp_path):
+    registry = SQLiteTaskRegistry(str(tmp_path / ".task_registry.sqlite3"))
+
+    def register(start):
+        for i in range(start, start + 25):
+            registry.register(f"t{i}", path=f"uploads/t{i}.pdf")
+
+    threads = [threading.Thread(target=register, args=(n * 25,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(registry.get(f"t{i}") for i in range(100))
+
+
+def test_backend_selection(tmp_path, monkeypatch):
+    monkeypatch.setenv("TASK_REGISTRY_BACKEND", "sqlite")
+    monkeypatch.setenv("TASK_REGISTRY_DB", str(tmp_path / "tasks.sqlite3"))
+    assert isinstance(create_task_registry(str(tmp_path)), SQLiteTaskRegistry)
+    monkeypatch.setenv("TASK_REGISTRY_BACKEND", "memory")
+    assert isinstance(create_task_registry(str(tmp_path)), MemoryTaskRegistry)
+
+
+def test_default_database_is_outside_the_uploads_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("TASK_REGISTRY_BACKEND", "sqlite")
+    monkeypatch.delenv("TASK_REGISTRY_DB", raising=False)
+    registry = create_task_registry(str(tmp_path / "data"))
+    assert registry.db_path == str(tmp_path / "data" / "task_registry.sqlite3")
+
+
+def test_registry_database_cannot_be_fetched(api):
+    client, main = api
+    # A registry file left in the uploads directory by an older version
+    leftover = os.path.join(main.UPLOAD_DIR, ".task_registry.sqlite3")
+    with open(leftover, "wb") as fh:
+        fh.write(b"SQLite format 3\x00")
+    try:
+        assert client.get("/static/uploads/.task_registry.sqlite3").status_code == 404
+        assert client.get("/api/artifacts/.task_registry.sqlite3").status_code == 404
+    finally:
+        os.remove(leftover)
+
+
+def test_websocket_rejects_unknown_task(api):
+    client, main = api
+    with client.websocket_connect("/ws/analyze/not-a-task") as ws:
+        event = ws.receive_json()
+    assert event["status"] == "error"
@@ -0,0 +1,133 @@
+import time
+import asyncio
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import text_layer
+from services.cancellation import AnalysisCancelled, CancellationToken, use_token
+from services.document_context import DocumentContext
+from services.text_layer import extract_page_range, extract_text_layer
+
+
+def text_pdf(texts) -> bytes:
+    """A minimal PDF with one line of Helvetica text per page."""
+    objects = []
+    page_ids = [4 + 2 * i for i in range(len(texts))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(texts)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, text in enumerate(texts):
+        stream = f"BT /F1 12 Tf 20 100 Td ({text}) Tj ET".encode()
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 200] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[i] + 1} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def stop_pool():
+    yield
+    text_layer.shutdown_pool()
+
+
+def test_page_range_extracts_each_page(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(text_pdf(["First page", "Second page", "Third page"]))
+    pages = extract_page_range(str(path), 1, 3, budget_seconds=5)
+    assert [p["index"] for p in pages] == [1, 2]
+    assert [p["text"].strip() for p in pages] == ["Second page", "Third page"]
+    assert all(p["status"] == "ok" and p["char_count"] == len(p["text"]) for p in pages)
+
+
+def test_slow_page_is_cut_off_at_its_budget(tmp_path, monkeypatch):
+    path = tmp_path / "slow.pdf"
+    path.write_bytes(text_pdf(["Slow", "Fast"]))
+    reader = text_layer._worker_reader(str(path))
+
+    class SlowPage:
+        def extract_text(self):
+            time.sleep(2)
+            return "never"
+
+    pages = [SlowPage(), reader.pages[1]]
+    monkeypatch.setattr(text_layer, "_worker_reader", lambda p: type("Reader", (), {"pages": pages})())
+
+    began = time.perf_counter()
+    result = extract_page_range(str(path), 0, 2, budget_seconds=0.1)
+    assert time.perf_counter() - began < 1.5
+    assert result[0]["status"] == "timeout" and result[0]["text"] == ""
+    assert result[1]["status"] == "ok" and result[1]["text"].strip() == "Fast"
+
+
+def test_text_layer_is_extracted_in_chunks_and_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_layer, "TEXT_PAGES_PER_TASK", 2)
+    path = tmp_path / "doc.pdf"
+    texts = [f"Page number {i}" for i in range(5)]
+    path.write_bytes(text_pdf(texts))
+
+    async def main():
+        with DocumentContext(str(path), "application/pdf") as document:
+            first = await extract_text_layer(document, content_hash="text-layer-test")
+            second = await extract_text_layer(document, content_hash="text-layer-test")
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first["page_count"] == 5 and first["cached"] is False
+    assert [p["index"] for p in first["pages"]] == [0, 1, 2, 3, 4]
+    assert [p["text"].strip() for p in first["pages"]] == texts
+    assert first["char_count"] == sum(p["char_count"] for p in first["pages"])
+    assert second["cached"] is True and second["pages"] == first["pages"]
+
+
+def test_text_layer_is_only_extracted_when_requested(analyze):
+    data = text_pdf(["Statement of account"])
+    _, events = analyze(data)
+    assert not any(e.get("step") == "TEXT_EXTRACTION" for e in events)
+    assert "text_layer" not in events[-1]["data"]
+
+    _, events = analyze(data + b"% requested\n", text_layer="true")
+    assert any(e.get("step") == "TEXT_EXTRACTION" for e in events)
+    layer = events[-1]["data"]["text_layer"]
+    assert layer["pages"][0]["text"].strip() == "Statement of account"
+
+
+def test_cancelled_analysis_stops_waiting_for_pages(monkeypatch):
+    calls = []
+
+    def slow_range(path, start, stop, budget_seconds):
+        calls.append(start)
+        time.sleep(0.5)
+        return []
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(text_layer, "_get_pool", lambda: pool)
+    monkeypatch.setattr(text_layer, "extract_page_range", slow_range)
+    monkeypatch.setattr(text_layer, "TEXT_PAGES_PER_TASK", 1)
+    document = SimpleNamespace(path="doc.pdf", pypdf_reader=SimpleNamespace(pages=[None] * 20))
+
+    async def main():
+        with use_token(CancellationToken(deadline_seconds=0.2)):
+            await extract_text_layer(document)
+
+    began = time.perf_counter()
+    with pytest.raises(AnalysisCancelled) as raised:
+        asyncio.run(main())
+    pool.shutdown(wait=True)
+    assert raised.value.reason == "deadline_exceeded"
+    assert time.perf_counter() - began < 2
+    # Page ranges still queued were dropped instead of run
+    assert len(calls) < 20
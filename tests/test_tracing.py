@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from services.tracing import Trace, span, trace_to_otlp
+
+
+def test_spans_nest_under_the_current_span():
+    trace = Trace("analysis", task_id="t1").start()
+    with span("routing"):
+        pass
+    with span("pipeline", pipeline="structural") as pipeline:
+        with span("ela"):
+            pass
+        pipeline.set_attribute("pages", 3)
+    trace.finish()
+
+    root = trace.to_dict()["root"]
+    assert root["attributes"] == {"task_id": "t1"}
+    assert [c["name"] for c in root["children"]] == ["routing", "pipeline"]
+    pipeline = root["children"][1]
+    assert pipeline["attributes"] == {"pipeline": "structural", "pages": 3}
+    assert pipeline["children"][0]["name"] == "ela"
+    assert pipeline["children"][0]["parent_span_id"] == pipeline["span_id"]
+    assert all(c["wall_ms"] is not None and c["status"] == "ok" for c in root["children"])
+
+
+def test_gathered_tasks_attach_to_the_span_that_started_them():
+    async def detector(name):
+        await asyncio.sleep(0)
+        with span(name):
+            await asyncio.sleep(0)
+
+    async def main():
+        trace = Trace("analysis").start()
+        with span("detectors"):
+            await asyncio.gather(detector("ela"), detector("noise"))
+        trace.finish()
+        return trace.to_dict()
+
+    root = asyncio.run(main())["root"]
+    assert sorted(c["name"] for c in root["children"][0]["children"]) == ["ela", "noise"]
+
+
+def test_failed_span_records_the_error_and_reraises():
+    trace = Trace("analysis").start()
+    with pytest.raises(ValueError):
+        with span("segformer"):
+            raise ValueError("bad tensor")
+    trace.finish()
+    child = trace.to_dict()["root"]["children"][0]
+    assert child["status"] == "error"
+    assert child["error"] == "ValueError: bad tensor"
+
+
+def test_span_outside_a_trace_is_a_no_op():
+    with span("standalone") as current:
+        assert current is None
+
+
+def test_trace_finish_is_idempotent():
+    trace = Trace("analysis").start()
+    trace.finish()
+    ended = trace.root.end_ns
+    trace.finish(RuntimeError("late"))
+    assert trace.root.end_ns == ended and trace.root.status == "ok"
+
+
+def test_otlp_export_flattens_the_tree():
+    trace = Trace("analysis", cached=False, size=1024).start()
+    with span("reasoning", model="gemini"):
+        pass
+    trace.finish()
+    trace_dict = trace.to_dict()
+    export = trace_to_otlp(trace_dict)
+
+    spans = export["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root, child = spans
+    assert root["traceId"] == child["traceId"] == trace_dict["trace_id"]
+    assert "parentSpanId" not in root
+    assert child["parentSpanId"] == root["spanId"]
+    assert child["status"] == {"code": 1}
+    attributes = {a["key"]: a["value"] for a in root["attributes"]}
+    assert attributes["cached"] == {"boolValue": False}
+    assert attributes["size"] == {"intValue": "1024"}
+    assert "doubleValue" in attributes["veridoc.wall_ms"]
+    service = export["resourceSpans"][0]["resource"]["attributes"][0]
+    assert service == {"key": "service.name", "value": {"stringValue": trace_dict["service"]}}
+
+
+def test_task_trace_endpoint(analyze, api):
+    client, _ = api
+    task_id, _ = analyze(b"%PDF-1.4\n% traced run\n")
+
+    tree = client.get(f"/api/tasks/{task_id}/trace").json()
+    names = [c["name"] for c in tree["root"]["children"]]
+    assert "cache_lookup" in names and "routing" in names and "reasoning" in names
+
+    otlp = client.get(f"/api/tasks/{task_id}/trace", params={"format": "otlp"}).json()
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert {s["traceId"] for s in spans} == {tree["trace_id"]}
+    assert client.get("/api/tasks/unknown-task/trace").status_code == 404
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from services import upload_stream
+from services.upload_stream import stream_upload_to_disk, copy_stream_to_disk, UploadRejected, UPLOAD_CHUNK_SIZE
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+PDF = b"%PDF-1.7\n" + b"1 0 obj\n" * 10
+
+
+def stream(data, name="upload.bin", max_bytes=upload_stream.MAX_UPLOAD_BYTES, directory=None):
+    upload = UploadFile(file=io.BytesIO(data), filename=name)
+    return asyncio.run(stream_upload_to_disk(upload, str(directory), "t1", max_bytes))
+
+
+def test_sniffs_type_from_content_not_filename(tmp_path):
+    stored = stream(JPEG, name="looks_like.pdf", directory=tmp_path)
+    assert stored["content_type"] == "image/jpeg"
+    assert stored["filename"] == "t1.jpg"
+    # Images are routed to the visual pipeline as soon as the first chunk is read
+    assert stored["pipeline_hint"] == "visual"
+
+    stored = stream(PDF, name="scan.jpg", directory=tmp_path)
+    assert stored["content_type"] == "application/pdf"
+    assert stored["pipeline_hint"] is None
+
+
+def test_hash_and_size_cover_every_chunk(tmp_path):
+    data = PDF + os.urandom(3 * UPLOAD_CHUNK_SIZE + 17)
+    stored = stream(data, directory=tmp_path)
+    assert stored["size"] == len(data)
+    assert stored["sha256"] == hashlib.sha256(data).hexdigest()
+    assert open(stored["path"], "rb").read() == data
+
+
+def test_unsupported_type_is_415_and_writes_nothing(tmp_path):
+    with pytest.raises(UploadRejected) as excinfo:
+        stream(b"just some text", directory=tmp_path)
+    assert excinfo.value.status_code == 415
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_upload_is_413_and_partial_file_removed(tmp_path):
+    data = PDF + os.urandom(2 * UPLOAD_CHUNK_SIZE)
+    with pytest.raises(UploadRejected) as excinfo:
+        stream(data, max_bytes=UPLOAD_CHUNK_SIZE + 10, directory=tmp_path)
+    assert excinfo.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_copy_stream_to_disk_matches_the_async_path(tmp_path):
+    stored = copy_stream_to_disk(io.BytesIO(PDF), str(tmp_path), "t2")
+    assert stored["sha256"] == hashlib.sha256(PDF).hexdigest()
+    assert stored["filename"] == "t2.pdf"
+
+
+def test_upload_endpoint_registers_the_task(api):
+    client, main = api
+    response = client.post("/api/upload", files={"file": ("doc.pdf", io.BytesIO(PDF), "application/pdf")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sha256"] == hashlib.sha256(PDF).hexdigest()
+    assert body["started"] is False
+
+    task = main.task_registry.get(body["task_id"])
+    assert task["content_type"] == "application/pdf"
+    assert os.path.exists(task["path"])
+
+
+def test_upload_endpoint_rejects_unknown_types(api):
+    client, _ = api
+    response = client.post("/api/upload", files={"file": ("notes.txt", io.BytesIO(b"hello"), "text/plain")})
+    assert response.status_code == 415
+
+
+def limited_app(limit):
+    from fastapi import FastAPI, File, UploadFile as FastAPIUploadFile
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.add_middleware(upload_stream.RequestBodyLimit, limits={"/upload": limit})
+    received = []
+
+    @app.post("/upload")
+    async def upload(file: FastAPIUploadFile = File(...)):
+        received.append(len(await file.read()))
+        return {"size": received[-1]}
+
+    @app.post("/other")
+    async def other(file: FastAPIUploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app), received
+
+
+def test_declared_oversized_body_is_refused_before_it_is_read():
+    client, received = limited_app(1024)
+    data = os.urandom(upload_stream.MULTIPART_OVERHEAD_BYTES + 2048)
+    response = client.post("/upload", files={"file": ("big.pdf", io.BytesIO(data), "application/pdf")})
+    assert response.status_code == 413
+    assert received == []
+    # Other paths are not limited
+    assert client.post("/other", files={"file": ("big.pdf", io.BytesIO(data), "application/pdf")}).json() == {"size": len(data)}
+
+
+def test_chunked_body_is_cut_off_once_it_passes_the_limit():
+    client, received = limited_app(1024)
+    boundary = "limit-boundary"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.pdf\"\r\n"
+            "Content-Type: application/pdf\r\n\r\n").encode()
+
+    def body():
+        # No Content-Length: only counting the chunks as they arrive can stop it
+        yield head
+        for _ in range(64):
+            yield b"\x00" * (UPLOAD_CHUNK_SIZE // 16)
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post("/upload", content=body(),
+                           headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert received == []
+
+    small = client.post("/upload", files={"file": ("small.pdf", io.BytesIO(PDF), "application/pdf")})
+    assert small.json() == {"size": len(PDF)}